@@ -0,0 +1,77 @@
+"""
+Script to create the alert_job_result table and move the results of
+existing alert jobs out of alert_job.results_json into it.
+This is a one-time migration script.
+"""
+
+import sys
+import os
+import json
+import logging
+from sqlalchemy import create_engine, text, inspect, MetaData, Table, Column, Integer, String, Text, ForeignKey
+import traceback
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_alert_job_result_table():
+    """Create the alert_job_result table and fill it from alert_job.results_json"""
+    try:
+        # Get database URL from environment
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            logger.error("DATABASE_URL environment variable not found")
+            sys.exit(1)
+
+        # Create connection to database
+        engine = create_engine(database_url)
+        inspector = inspect(engine)
+
+        if not inspector.has_table('alert_job_result'):
+            metadata = MetaData()
+            Table('alert_job', metadata, Column('id', String(36), primary_key=True))
+            Table('alert_job_result', metadata,
+                Column('job_id', String(36), ForeignKey('alert_job.id', ondelete='CASCADE'), primary_key=True),
+                Column('seq', Integer, primary_key=True, autoincrement=False),
+                Column('result_json', Text, nullable=False)
+            )
+            metadata.create_all(engine, tables=[metadata.tables['alert_job_result']])
+            logger.info("Successfully created alert_job_result table")
+        else:
+            logger.info("alert_job_result table already exists, skipping creation")
+
+        columns = [column['name'] for column in inspector.get_columns('alert_job')]
+        if 'results_json' not in columns:
+            logger.info("alert_job has no results_json column, nothing to move")
+            return
+
+        with engine.connect() as connection:
+            # Start a transaction
+            with connection.begin():
+                jobs = connection.execute(text(
+                    "SELECT id, results_json FROM alert_job WHERE results_json IS NOT NULL")).fetchall()
+                moved = 0
+                for job_id, results_json in jobs:
+                    exists = connection.execute(text(
+                        "SELECT 1 FROM alert_job_result WHERE job_id = :job_id"), {'job_id': job_id}).fetchone()
+                    if exists:
+                        continue
+                    for seq, result in enumerate(json.loads(results_json), start=1):
+                        connection.execute(text(
+                            "INSERT INTO alert_job_result (job_id, seq, result_json) VALUES (:job_id, :seq, :result_json)"),
+                            {'job_id': job_id, 'seq': seq, 'result_json': json.dumps(result)})
+                    connection.execute(text("UPDATE alert_job SET results_json = NULL WHERE id = :job_id"),
+                                       {'job_id': job_id})
+                    moved += 1
+                logger.info(f"Moved the results of {moved} alert jobs to alert_job_result")
+
+    except Exception as e:
+        logger.error(f"Error adding alert job result table: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logger.info("Starting migration to store alert job results as rows")
+    add_alert_job_result_table()
+    logger.info("Migration completed successfully")
@@ -0,0 +1,76 @@
+"""
+Script to add the version field to the circuit table and create the
+circuit_change journal table.
+This is a one-time migration script.
+"""
+
+import sys
+import os
+import logging
+from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, String, DateTime, ForeignKey
+import datetime
+import traceback
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_circuit_change_journal():
+    """Add version column to the circuit table and create the circuit_change table"""
+    try:
+        # Get database URL from environment
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            logger.error("DATABASE_URL environment variable not found")
+            sys.exit(1)
+
+        # Create connection to database
+        engine = create_engine(database_url)
+
+        with engine.connect() as connection:
+            # Start a transaction
+            with connection.begin():
+                # Check if column already exists
+                check_sql = text("""
+                    SELECT column_name
+                    FROM information_schema.columns
+                    WHERE table_name='circuit' AND column_name='version';
+                """)
+
+                result = connection.execute(check_sql)
+                if result.fetchone() is not None:
+                    logger.info("version column already exists in circuit table")
+                else:
+                    logger.info("Adding version column to circuit table")
+                    connection.execute(text("""
+                        ALTER TABLE circuit
+                        ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+                    """))
+                    logger.info("Successfully added version column to circuit table")
+
+        # Create the journal table if it doesn't exist
+        if engine.dialect.has_table(engine.connect(), 'circuit_change'):
+            logger.info("circuit_change table already exists, skipping creation")
+            return
+
+        metadata = MetaData()
+        Table('user', metadata, Column('id', Integer, primary_key=True))
+        Table('circuit_change', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('circuit_pk', Integer, nullable=True),
+            Column('action', String(10), nullable=False),
+            Column('user_id', Integer, ForeignKey('user.id'), nullable=True),
+            Column('created_at', DateTime, default=datetime.datetime.utcnow, index=True)
+        )
+        metadata.create_all(engine, tables=[metadata.tables['circuit_change']])
+        logger.info("Successfully created circuit_change table")
+
+    except Exception as e:
+        logger.error(f"Error adding circuit change journal: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logger.info("Starting migration to add the circuit change journal")
+    add_circuit_change_journal()
+    logger.info("Migration completed successfully")
@@ -0,0 +1,87 @@
+"""
+Script to add the row_class field to the circuit table and classify the
+circuits already in it.
+This is a one-time migration script.
+"""
+
+import sys
+import os
+import logging
+from sqlalchemy import create_engine, text
+import traceback
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_row_class_column():
+    """Add row_class column to the circuit table"""
+    try:
+        # Get database URL from environment
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            logger.error("DATABASE_URL environment variable not found")
+            sys.exit(1)
+
+        # Create connection to database
+        engine = create_engine(database_url)
+
+        with engine.connect() as connection:
+            # Start a transaction
+            with connection.begin():
+                # Check if column already exists
+                check_sql = text("""
+                    SELECT column_name
+                    FROM information_schema.columns
+                    WHERE table_name='circuit' AND column_name='row_class';
+                """)
+
+                result = connection.execute(check_sql)
+                column_exists = result.fetchone() is not None
+
+                if column_exists:
+                    logger.info("row_class column already exists in circuit table")
+                    return
+
+                # Add the column and its index
+                logger.info("Adding row_class column to circuit table")
+                connection.execute(text("""
+                    ALTER TABLE circuit
+                    ADD COLUMN row_class VARCHAR(10) NULL;
+                """))
+                connection.execute(text("""
+                    CREATE INDEX ix_circuit_row_class ON circuit (row_class);
+                """))
+
+                logger.info("Successfully added row_class column to circuit table")
+
+    except Exception as e:
+        logger.error(f"Error adding row_class column: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+def classify_existing_circuits():
+    """Classify every circuit in the table"""
+    # Imported here so the models are only loaded once the column exists
+    from app import app, db
+    from models import Circuit
+    from utils.circuit_rows import classify_circuit
+
+    try:
+        with app.app_context():
+            count = 0
+            for circuit in Circuit.query.order_by(Circuit.id):
+                circuit.row_class = classify_circuit(circuit.sheet, circuit.to_dict())
+                count += 1
+            db.session.commit()
+            logger.info(f"Classified {count} circuits")
+    except Exception as e:
+        logger.error(f"Error classifying circuits: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logger.info("Starting migration to add row_class column to circuit table")
+    add_row_class_column()
+    classify_existing_circuits()
+    logger.info("Migration completed successfully")
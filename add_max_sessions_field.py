@@ -0,0 +1,63 @@
+"""
+Script to add max_sessions field to the equipment table.
+This is a one-time migration script.
+"""
+
+import sys
+import os
+import logging
+from sqlalchemy import create_engine, text
+import traceback
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def add_max_sessions_column():
+    """Add max_sessions column to the equipment table"""
+    try:
+        # Get database URL from environment
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            logger.error("DATABASE_URL environment variable not found")
+            sys.exit(1)
+        
+        # Create connection to database
+        engine = create_engine(database_url)
+        
+        with engine.connect() as connection:
+            # Start a transaction
+            with connection.begin():
+                # Check if column already exists
+                check_sql = text("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name='equipment' AND column_name='max_sessions';
+                """)
+                
+                result = connection.execute(check_sql)
+                column_exists = result.fetchone() is not None
+                
+                if column_exists:
+                    logger.info("max_sessions column already exists in equipment table")
+                    return
+                
+                # Add the column
+                logger.info("Adding max_sessions column to equipment table")
+                add_column_sql = text("""
+                    ALTER TABLE equipment 
+                    ADD COLUMN max_sessions INTEGER NULL;
+                """)
+                
+                connection.execute(add_column_sql)
+                logger.info("Successfully added max_sessions column to equipment table")
+                
+    except Exception as e:
+        logger.error(f"Error adding max_sessions column: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logger.info("Starting migration to add max_sessions column to equipment table")
+    add_max_sessions_column()
+    logger.info("Migration completed successfully")
\ No newline at end of file
@@ -60,6 +60,36 @@ if not os.path.exists(UPLOAD_FOLDER):
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
+# Alert execution settings
+app.config['ALERT_PARALLEL_EXECUTION'] = os.environ.get('ALERT_PARALLEL_EXECUTION', 'true').lower() in ('1', 'true', 'yes')
+app.config['ALERT_MAX_WORKERS'] = int(os.environ.get('ALERT_MAX_WORKERS', '8'))  # Max devices queried at once
+app.config['ALERT_CONNECT_DEADLINE'] = float(os.environ.get('ALERT_CONNECT_DEADLINE', '30'))  # Seconds per device to connect
+app.config['ALERT_DEVICE_MAX_SESSIONS'] = int(os.environ.get('ALERT_DEVICE_MAX_SESSIONS', '4'))  # Sessions per device unless set on the equipment
+app.config['ALERT_DEVICE_QUEUE_TIMEOUT'] = float(os.environ.get('ALERT_DEVICE_QUEUE_TIMEOUT', '60'))  # Seconds to wait for a free session
+app.config['ALERT_STREAM_TOKEN_MAX_AGE'] = 120  # Seconds a live results page has to open its stream
+app.config['ALERT_CACHE_ENABLED'] = os.environ.get('ALERT_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+app.config['ALERT_COALESCE_REQUESTS'] = os.environ.get('ALERT_COALESCE_REQUESTS', 'true').lower() in ('1', 'true', 'yes')
+app.config['ALERT_BULK_MAX_CIRCUITS'] = int(os.environ.get('ALERT_BULK_MAX_CIRCUITS', '200'))  # Circuit IDs per bulk check
+app.config['ALERT_BACKGROUND_JOBS'] = os.environ.get('ALERT_BACKGROUND_JOBS', 'true').lower() in ('1', 'true', 'yes')
+app.config['ALERT_JOB_WORKERS'] = int(os.environ.get('ALERT_JOB_WORKERS', '4'))  # Jobs run at once per process
+app.config['ALERT_JOB_QUEUE_LIMIT'] = int(os.environ.get('ALERT_JOB_QUEUE_LIMIT', '20'))  # Jobs queued or running per process
+app.config['ALERT_JOB_RETENTION'] = int(os.environ.get('ALERT_JOB_RETENTION', '86400'))  # Seconds finished jobs are kept
+app.config['ALERT_JOB_STALE_AFTER'] = int(os.environ.get('ALERT_JOB_STALE_AFTER', '3600'))  # Seconds before an unfinished job is assumed abandoned
+
+# Circuit ID Database: rows per page of the circuit list and its JSON endpoint
+app.config['CIRCUIT_PAGE_SIZE'] = int(os.environ.get('CIRCUIT_PAGE_SIZE', '100'))
+app.config['CIRCUIT_PAGE_SIZE_MAX'] = 1000  # Largest per_page a JSON client may ask for
+app.config['CIRCUIT_JOURNAL_RETENTION'] = int(os.environ.get('CIRCUIT_JOURNAL_RETENTION', '604800'))  # Seconds circuit change entries are kept
+# Snapshot of the circuit list shared by the workers; must be on a local filesystem they can all write
+app.config['CIRCUIT_SNAPSHOT_PATH'] = os.environ.get(
+    'CIRCUIT_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'circuit_snapshot.bin'))
+
+# Metrics: /metrics is refused unless METRICS_TOKEN is set, and scrapers
+# must send it as a bearer token
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+from utils import metrics
+metrics.init_app(app)
+
 # Newline to <br> filter for Jinja templates
 @app.template_filter('nl2br')
 def nl2br_filter(s):
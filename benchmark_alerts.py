@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for circuit alert checks
+
+Starts a local fleet of mock SSH devices (mock_fleet.py, or one
+start_fixed_ssh_server.py process per port), seeds a throwaway SQLite
+database with equipment and circuit mappings pointing at them, then drives
+two scenarios at each requested concurrency level:
+
+- alert: POST /submit_alert through the Flask test client, synchronously,
+  exactly as the results page is produced (pool, limiter and coalescing included)
+- ssh:   connect, run one command and disconnect with SSHClient directly for
+  each of the circuit's commands, the cost of a check without any of the
+  application around it (no pool, limiter or coalescing)
+
+For each run the p50/p95/p99 latency, throughput and SSH connections opened
+per check are printed and written to a JSON file together with the git commit,
+so runs can be compared across commits.
+
+Usage:
+    python benchmark_alerts.py --devices 4 --circuits 20 --concurrency 1,4,16 --requests 40
+    python benchmark_alerts.py --scenario alert --output results/before.json
+    python benchmark_alerts.py --devices 100 --fleet-args "--command-delay 0.2-1.5 --output-size 200000"
+    python benchmark_alerts.py --server fixed
+"""
+
+import argparse
+import json
+import logging
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HOST_KEY_PATH = os.path.join(BASE_DIR, 'mock_ssh_host_key')
+
+DEVICE_USERNAME = 'test'
+DEVICE_PASSWORD = 'Ac0rN$'
+BENCH_USERNAME = 'benchmark'
+BENCH_PASSWORD = 'benchmark'
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values, interpolating between ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wait_for_port(host, port, timeout=15):
+    """Wait until something accepts TCP connections on host:port"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+class LocalFleet:
+    """Mock SSH devices on consecutive local ports, served by child processes
+
+    With server='fleet' a single mock_fleet.py process simulates every device;
+    with server='fixed' one start_fixed_ssh_server.py process is started per
+    device, which closes each connection after one command.
+    """
+
+    def __init__(self, devices, base_port, server='fleet', fleet_args='', host='127.0.0.1'):
+        """Initialize the fleet
+
+        Args:
+            devices (int): Number of mock devices to start
+            base_port (int): Port of the first device; the others follow it
+            server (str, optional): 'fleet' or 'fixed'. Defaults to 'fleet'.
+            fleet_args (str, optional): Extra mock_fleet.py arguments, such as latency
+                and fault settings. Defaults to ''.
+            host (str, optional): Address to bind. Defaults to 127.0.0.1.
+        """
+        self.host = host
+        self.server = server
+        self.fleet_args = fleet_args
+        self.ports = [base_port + i for i in range(devices)]
+        self.processes = []
+        self.workdir = None
+
+    def start(self):
+        """Start the servers and wait for every device to accept connections"""
+        # Run the servers in a scratch directory so their log files do not
+        # overwrite each other or the ones in the repository
+        self.workdir = tempfile.mkdtemp(prefix='acorn_fleet_')
+        if os.path.exists(HOST_KEY_PATH):
+            shutil.copy(HOST_KEY_PATH, os.path.join(self.workdir, 'mock_ssh_host_key'))
+
+        env = dict(os.environ, PYTHONPATH=BASE_DIR, SSH_SERVER_BIND=self.host)
+        if self.server == 'fleet':
+            command = [sys.executable, os.path.join(BASE_DIR, 'mock_fleet.py'), '--devices', str(len(self.ports)),
+                       '--base-port', str(self.ports[0]), '--bind', self.host] + shlex.split(self.fleet_args)
+            self.processes.append(subprocess.Popen(command, cwd=self.workdir, env=env,
+                                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        else:
+            for port in self.ports:
+                self.processes.append(subprocess.Popen(
+                    [sys.executable, os.path.join(BASE_DIR, 'start_fixed_ssh_server.py')],
+                    cwd=self.workdir, env=dict(env, SSH_SERVER_PORT=str(port)),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+        for port in self.ports:
+            if not wait_for_port(self.host, port):
+                self.stop()
+                raise RuntimeError(f"Mock SSH server on port {port} did not start")
+
+    def stop(self):
+        """Stop every server and remove the scratch directory"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+
+class ConnectionCounter:
+    """Counts new SSH sessions opened by SSHClient.connect() in this process"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def install(self, client_class):
+        """Wrap client_class.connect so every successful new session is counted"""
+        original = client_class.connect
+        counter = self
+
+        def counting_connect(client, *args, **kwargs):
+            already_connected = bool(client.connected and client.client)
+            result = original(client, *args, **kwargs)
+            if not already_connected:
+                with counter._lock:
+                    counter.count += 1
+            return result
+
+        client_class.connect = counting_connect
+
+
+def seed_database(app, db, fleet, circuits, devices_per_circuit, commands):
+    """Create the benchmark user, one Equipment per mock device and the circuit mappings
+
+    Returns:
+        list: The seeded circuit IDs
+    """
+    from models import User, Equipment, CircuitMapping
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        user = User(username=BENCH_USERNAME, email='benchmark@acorn.test', is_admin=True)
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+
+        equipment = []
+        for index, port in enumerate(fleet.ports):
+            item = Equipment(name=f"bench-device-{index:03d}", ip_address=fleet.host, ssh_port=port,
+                             username=DEVICE_USERNAME, password=DEVICE_PASSWORD)
+            db.session.add(item)
+            equipment.append(item)
+        db.session.flush()
+
+        circuit_ids = []
+        for number in range(circuits):
+            circuit_id = f"BENCH-{number + 1:04d}"
+            circuit_ids.append(circuit_id)
+            for offset in range(min(devices_per_circuit, len(equipment))):
+                item = equipment[(number + offset) % len(equipment)]
+                db.session.add(CircuitMapping(circuit_id=circuit_id, equipment_id=item.id, command=commands,
+                                              description='Benchmark circuit'))
+        db.session.commit()
+
+        return circuit_ids
+
+
+def run_load(operation, total, concurrency):
+    """Run operation(i) total times from concurrency threads
+
+    Returns:
+        tuple: (latencies in seconds, error count, wall clock seconds)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def timed(index):
+        start = time.perf_counter()
+        try:
+            ok = operation(index)
+        except Exception as e:
+            logging.getLogger('benchmark').warning(f"Request {index} failed: {str(e)}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors[0] += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(total)))
+    return latencies, errors[0], time.perf_counter() - wall_start
+
+
+def summarize(scenario, concurrency, latencies, errors, wall_time, connections):
+    """Build the result record for one scenario and concurrency level"""
+    millis = [value * 1000 for value in latencies]
+    count = len(latencies)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': count,
+        'errors': errors,
+        'duration_s': round(wall_time, 3),
+        'throughput_rps': round(count / wall_time, 2) if wall_time else None,
+        'latency_ms': {
+            'p50': round(percentile(millis, 50), 1),
+            'p95': round(percentile(millis, 95), 1),
+            'p99': round(percentile(millis, 99), 1),
+            'mean': round(sum(millis) / count, 1),
+            'max': round(max(millis), 1)
+        },
+        'connections': connections,
+        'connections_per_check': round(connections / count, 2) if count else None
+    }
+
+
+def alert_scenario(app, circuit_ids):
+    """Return an operation that submits an alert check for a seeded circuit"""
+    local = threading.local()
+
+    def operation(index):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+            client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+        response = client.post('/submit_alert', data={'circuit_id': circuit_ids[index % len(circuit_ids)]})
+        body = response.get_data(as_text=True)
+        return response.status_code == 200 and 'border-danger' not in body
+
+    return operation
+
+
+def ssh_scenario(fleet, commands, devices_per_circuit, circuits):
+    """Return an operation that checks a circuit with a fresh SSHClient session per command"""
+    from utils.ssh_client import SSHClient
+
+    command_list = [command.strip() for command in commands.split(';') if command.strip()]
+
+    def operation(index):
+        ok = True
+        number = index % circuits
+        for offset in range(min(devices_per_circuit, len(fleet.ports))):
+            port = fleet.ports[(number + offset) % len(fleet.ports)]
+            for command in command_list:
+                client = SSHClient(hostname=fleet.host, port=port, username=DEVICE_USERNAME,
+                                   password=DEVICE_PASSWORD)
+                try:
+                    client.connect()
+                    success, _ = client.execute_command(command)
+                    ok = ok and success
+                finally:
+                    client.disconnect()
+        return ok
+
+    return operation
+
+
+def print_result(result):
+    latency = result['latency_ms']
+    print(f"{result['scenario']:>6} c={result['concurrency']:<4} n={result['requests']:<5} "
+          f"err={result['errors']:<4} p50={latency['p50']:>8.1f}ms p95={latency['p95']:>8.1f}ms "
+          f"p99={latency['p99']:>8.1f}ms {result['throughput_rps']:>7.2f} req/s "
+          f"{result['connections_per_check']:.2f} conn/check")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark alert checks against a local mock SSH fleet')
+    parser.add_argument('--devices', type=int, default=4, help='Mock devices to start (default: 4)')
+    parser.add_argument('--base-port', type=int, default=2400, help='Port of the first mock device (default: 2400)')
+    parser.add_argument('--server', choices=['fleet', 'fixed'], default='fleet',
+                        help='Mock servers to run: mock_fleet.py or start_fixed_ssh_server.py (default: fleet)')
+    parser.add_argument('--fleet-args', default='',
+                        help='Extra mock_fleet.py arguments, e.g. "--command-delay 0.1-0.5 --reset-rate 0.01"')
+    parser.add_argument('--circuits', type=int, default=20, help='Circuits to seed (default: 20)')
+    parser.add_argument('--devices-per-circuit', type=int, default=2,
+                        help='Equipment each circuit is mapped to (default: 2)')
+    parser.add_argument('--commands', default='show version; show interface ge-0/0/0',
+                        help='Semicolon-separated commands mapped to every circuit')
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help='Comma-separated concurrency levels (default: 1,4,16)')
+    parser.add_argument('--requests', type=int, default=40, help='Checks per concurrency level (default: 40)')
+    parser.add_argument('--scenario', choices=['alert', 'ssh', 'all'], default='all',
+                        help='What to drive (default: all)')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON file to write (default: benchmark_results.json)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Keep application logging, and the temporary directory holding its log files')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    # The application reads its settings when it is imported, so point it at a
+    # throwaway database and run checks synchronously before importing it.
+    # Everything else it writes goes to the same directory: the auth method
+    # cache, the circuit snapshot and the log files it opens, relative to the
+    # working directory, on import.
+    db_dir = tempfile.mkdtemp(prefix='acorn_bench_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'benchmark.db')}"
+    os.environ['ALERT_BACKGROUND_JOBS'] = 'false'
+    os.environ['SSH_AUTH_CACHE_FILE'] = os.path.join(db_dir, 'ssh_auth_methods.json')
+    os.environ['CIRCUIT_SNAPSHOT_PATH'] = os.path.join(db_dir, 'circuit_snapshot.bin')
+    sys.path.insert(0, BASE_DIR)
+
+    cwd = os.getcwd()
+    os.chdir(db_dir)
+    try:
+        from app import app, db
+        from utils.ssh_client import SSHClient, ssh_pool
+    finally:
+        os.chdir(cwd)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['ALERT_BACKGROUND_JOBS'] = False
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        for name in ('ssh_timing', 'utils', 'routes'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        # Dead pooled sessions (every one with --server fixed, which closes each
+        # connection after one command) are logged as errors when they are
+        # replaced; failed checks are still counted as errors
+        for name in ('paramiko', 'utils.ssh_client'):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    counter = ConnectionCounter()
+    counter.install(SSHClient)
+
+    fleet = LocalFleet(args.devices, args.base_port, server=args.server, fleet_args=args.fleet_args)
+    print(f"Starting {args.devices} mock devices on ports {fleet.ports[0]}-{fleet.ports[-1]}...")
+    fleet.start()
+
+    results = []
+    try:
+        circuit_ids = seed_database(app, db, fleet, args.circuits, args.devices_per_circuit, args.commands)
+        scenarios = ['alert', 'ssh'] if args.scenario == 'all' else [args.scenario]
+
+        for scenario in scenarios:
+            if scenario == 'alert':
+                operation = alert_scenario(app, circuit_ids)
+            else:
+                operation = ssh_scenario(fleet, args.commands, args.devices_per_circuit, args.circuits)
+
+            for concurrency in levels:
+                # Start every level with no pooled sessions so levels are comparable
+                ssh_pool.close_all()
+                connections_before = counter.count
+                latencies, errors, wall_time = run_load(operation, args.requests, concurrency)
+                result = summarize(scenario, concurrency, latencies, errors, wall_time,
+                                   counter.count - connections_before)
+                results.append(result)
+                print_result(result)
+    finally:
+        ssh_pool.close_all()
+        fleet.stop()
+        if args.verbose:
+            print(f"Application logs kept in {db_dir}")
+        else:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': git_commit(),
+        'settings': {
+            'server': args.server,
+            'fleet_args': args.fleet_args,
+            'devices': args.devices,
+            'circuits': args.circuits,
+            'devices_per_circuit': args.devices_per_circuit,
+            'commands': args.commands,
+            'requests': args.requests,
+            'parallel_execution': app.config['ALERT_PARALLEL_EXECUTION'],
+            'max_workers': app.config['ALERT_MAX_WORKERS'],
+            'device_max_sessions': app.config['ALERT_DEVICE_MAX_SESSIONS'],
+            'coalesce_requests': app.config['ALERT_COALESCE_REQUESTS'],
+            'cache_enabled': app.config['ALERT_CACHE_ENABLED'],
+            'pool_max_size': ssh_pool.max_size
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
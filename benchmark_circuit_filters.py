@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the circuit list filters
+
+Generates a synthetic Circuit ID database (providers, markets, statuses and
+Circuit ID formats like those of the workbook, plus header rows that are
+classified away), builds a circuit snapshot from it in memory and times each
+scenario two ways:
+
+- loop:       the per-row Python filter chain - provider, status, row class
+  and search checks for every circuit, then a sort into display order
+- vectorized: CircuitSnapshot.select, which combines NumPy masks over the
+  snapshot's columns and gathers the matches in display order
+
+Both must return the same circuits in the same order; a scenario where they
+differ is reported as a mismatch. No database or running application is
+needed. The p50/p95 times and speedups are printed and written to a JSON file
+(in the temp directory unless --output is given) together with the git commit,
+so runs can be compared across commits.
+
+Usage:
+    python benchmark_circuit_filters.py
+    python benchmark_circuit_filters.py --circuits 250000 --repeat 10 --output results/filters.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+from utils.circuit_rows import ROW_CLEAN, ROW_JUNK, KEY_FIELDS, VALID_PROVIDERS, classify_circuit, listed_fields
+from utils.circuit_snapshot import CircuitSnapshot, build_snapshot
+
+MARKETS = ['ATL', 'DAL', 'JAX', 'MIA', 'NYC', 'CHI', 'DEN', 'PHX', 'SEA', 'LAX', 'HOU', 'ORL', 'TPA', 'CLT',
+           'NSH', 'BHM', 'MEM', 'RAL', 'SAV', 'MOB']
+
+# Sheets whose rows carry providers outside VALID_PROVIDERS
+OTHER_SHEETS = ['Data Center', 'Dark Fiber', 'Wavelengths']
+
+# (name, select() arguments) for each scenario, as the circuit list passes them
+SCENARIOS = [
+    ('default', {'status': 'ACTIVE'}),
+    ('provider+status', {'provider': 'Lumen', 'status': 'ACTIVE'}),
+    ('show_all', {'clean_only': True}),
+    ('circuit_id', {'status': 'ACTIVE', 'search_term': 'kgfn.12', 'search_field': 'circuit_id'}),
+    ('circuit_id_short', {'search_term': '12', 'search_field': 'circuit_id'}),
+    ('market', {'search_term': 'dal', 'search_field': 'market'}),
+    ('all_fields', {'status': 'ACTIVE', 'search_term': 'atl', 'search_field': 'all'}),
+    ('combined', {'provider': 'Cogent', 'status': 'ACTIVE', 'search_term': 'dia 10g', 'search_field': 'all'}),
+]
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values, interpolating between ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def synthetic_circuit_id(rnd, provider):
+    """Return a Circuit ID in the format the provider uses"""
+    if provider in ('Lumen', 'CenturyLink'):
+        return f"{rnd.randrange(10, 99)}.KGFN.{rnd.randrange(100000, 999999)}..LUMN"
+    if provider == 'Cogent':
+        return f"1-{rnd.randrange(100000000, 999999999)}"
+    if provider == 'Windstream':
+        return f"{rnd.randrange(100, 999)}/KQGN/{rnd.randrange(100000, 999999)}//WIN"
+    return f"ICC-{rnd.randrange(100000, 999999)}"
+
+
+def generate_circuits(count, seed):
+    """Return count synthetic rows as (pk, row_class, listed) in table order, leaving out junk rows
+
+    About one row in a hundred is a repeated header or spacer row, which is
+    classified as junk and never listed, like in the workbook.
+    """
+    rnd = random.Random(seed)
+    circuits = []
+    for pk in range(1, count + 1):
+        if rnd.random() < 0.01:
+            sheet = rnd.choice(VALID_PROVIDERS)
+            fields = {'Market': 'Market', 'Provider': sheet, 'Circuit ID': 'Circuit ID', 'Status': 'Status'}
+        else:
+            if rnd.random() < 0.9:
+                sheet = provider = rnd.choice(VALID_PROVIDERS)
+            else:
+                sheet = rnd.choice(OTHER_SHEETS)
+                provider = rnd.choice(['Zayo', 'Crown Castle', 'FPL FiberNet'])
+            market = rnd.choice(MARKETS)
+            fields = {
+                'Market': market,
+                'Provider': provider,
+                'Circuit ID': synthetic_circuit_id(rnd, provider),
+                'Status': rnd.choices(['ACTIVE', 'INACTIVE', 'PENDING'], weights=[6, 3, 1])[0],
+                'Description': f"{rnd.choice(['DIA', 'MPLS', 'Wave', 'Dark Fiber'])} "
+                               f"{rnd.choice(['1G', '10G', '100G'])} - {market}{rnd.randrange(1, 9):02d} "
+                               f"to {rnd.choice(MARKETS)}{rnd.randrange(1, 9):02d}"
+            }
+            if rnd.random() < 0.2:
+                fields['Parent CID'] = synthetic_circuit_id(rnd, provider)
+            if rnd.random() < 0.3:
+                fields['Access Provider'] = rnd.choice(VALID_PROVIDERS)
+                fields['Access CID'] = synthetic_circuit_id(rnd, fields['Access Provider'])
+            if rnd.random() < 0.005:
+                fields['Description'] = 'Description'  # Suspect: a key field holding its own name
+
+        row_class = classify_circuit(sheet, fields)
+        if row_class != ROW_JUNK:
+            circuits.append((pk, row_class, listed_fields(sheet, fields)))
+    return circuits
+
+
+def loop_matches(circuit, search_term, search_field):
+    """Check one circuit against a search term, field by field"""
+    search = search_term.lower()
+    search_norm = ''.join(c for c in search if c.isalnum())
+    circuit_id = str(circuit.get('Circuit ID') or '').lower()
+    circuit_id_norm = ''.join(c for c in circuit_id if c.isalnum())
+
+    if search_field == 'circuit_id':
+        if search == 'circuit id':
+            return False
+        return search in circuit_id or bool(search_norm and search_norm in circuit_id_norm)
+
+    for name, field in (('market', 'Market'), ('provider', 'Provider'), ('status', 'Status')):
+        if search_field == name:
+            if search == field.lower():
+                return False
+            return bool(circuit.get(field)) and search in str(circuit[field]).lower()
+
+    for field in KEY_FIELDS:
+        if search == field.lower():
+            continue
+        if circuit.get(field) and search in str(circuit[field]).lower():
+            return True
+    return bool(search_norm and search_norm in circuit_id_norm)
+
+
+def loop_select(circuits, provider=None, status=None, clean_only=False, search_term='', search_field='all'):
+    """Filter the circuits one row at a time and return their numbers in display order"""
+    matches = []
+    for number, (_, row_class, circuit) in enumerate(circuits):
+        if clean_only and row_class != ROW_CLEAN:
+            continue
+        if provider is not None and circuit.get('Provider') != provider:
+            continue
+        if status is not None and circuit.get('Status') != status:
+            continue
+        if search_term and not loop_matches(circuit, search_term, search_field):
+            continue
+        matches.append(number)
+    return sorted(matches, key=lambda number: (str(circuits[number][2].get('Provider', '')),
+                                               str(circuits[number][2].get('Circuit ID', ''))))
+
+
+def time_runs(operation, repeat):
+    """Run operation repeat times; return its last result and the durations in ms"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = operation()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the circuit list filters on synthetic data')
+    parser.add_argument('--circuits', type=int, default=100000, help='Rows to generate (default: 100000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each scenario and method (default: 5)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic data (default: 1)')
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'benchmark_circuit_filters.json'),
+                        help='JSON file to write (default: benchmark_circuit_filters.json in the temp directory)')
+    args = parser.parse_args()
+
+    print(f"Generating {args.circuits} circuits...")
+    circuits = generate_circuits(args.circuits, args.seed)
+
+    start = time.perf_counter()
+    data = build_snapshot(circuits, (None, 0, None), 'benchmark')
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    snapshot = CircuitSnapshot(data)
+    open_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(circuits)} listable circuits; snapshot of {len(data) / 1e6:.1f} MB "
+          f"built in {build_s:.2f}s, opened in {open_ms:.2f}ms")
+
+    results = []
+    mismatches = 0
+    for name, kwargs in SCENARIOS:
+        expected, loop_ms = time_runs(lambda: loop_select(circuits, **kwargs), args.repeat)
+        selected, vectorized_ms = time_runs(lambda: snapshot.select(**kwargs), args.repeat)
+        match = list(selected) == expected
+        mismatches += not match
+        result = {
+            'scenario': name,
+            'arguments': kwargs,
+            'matches': len(expected),
+            'same_result': match,
+            'loop_ms': {'p50': round(percentile(loop_ms, 50), 2), 'p95': round(percentile(loop_ms, 95), 2)},
+            'vectorized_ms': {'p50': round(percentile(vectorized_ms, 50), 2),
+                              'p95': round(percentile(vectorized_ms, 95), 2)},
+            'speedup': round(percentile(loop_ms, 50) / max(percentile(vectorized_ms, 50), 1e-6), 1)
+        }
+        results.append(result)
+        print(f"{name:>16} n={result['matches']:<6} loop p50={result['loop_ms']['p50']:>8.1f}ms "
+              f"vectorized p50={result['vectorized_ms']['p50']:>7.2f}ms {result['speedup']:>7.1f}x"
+              f"{'' if match else '  MISMATCH'}")
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': git_commit(),
+        'settings': {
+            'circuits': args.circuits,
+            'listable_circuits': len(circuits),
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'snapshot': {'bytes': len(data), 'build_s': round(build_s, 3), 'open_ms': round(open_ms, 3)},
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for running ACORN with several workers.
+
+Usage: gunicorn -c gunicorn_workers.conf.py main:app
+
+This file is not named gunicorn.conf.py so that gunicorn only uses it when it
+is passed with -c. Each worker process has its own SSH pool, device session
+limits, coalescing of identical commands and background job queue, so the
+per-process limits apply once per worker.
+
+For metrics to be combined across workers, set PROMETHEUS_MULTIPROC_DIR to an
+empty directory before starting gunicorn; it is cleared here on startup.
+"""
+
+import glob
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '180'))
+
+
+def on_starting(server):
+    """Remove metric files left over from a previous run"""
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """Drop the live gauge values of a worker that has exited"""
+    from utils.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Script to load the Circuit IDs database into the circuit table.
+
+The source is either a JSON file in the format written by read_excel.py
+(sheet name -> list of rows, e.g. circuit_ids_data.json) or the Excel workbook
+itself, which is read with read_excel.py. By default the existing circuits are
+replaced; use --append to add to them instead.
+
+Usage:
+    python import_circuit_ids.py [circuit_ids_data.json]
+    python import_circuit_ids.py --excel "attached_assets/Appendix D - Circuit IDs.xlsx"
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from app import app, db
+from models import Circuit
+from utils.circuit_store import circuit_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_json(json_file):
+    """Load circuit data from a JSON file written by read_excel.py"""
+    with open(json_file, 'r') as f:
+        return json.load(f)
+
+
+def load_excel(excel_path):
+    """Read circuit data from the Excel workbook with read_excel.py
+
+    The rows are passed through JSON the same way read_excel.py saves them, so
+    dates and other values are stored exactly as in circuit_ids_data.json.
+    """
+    from read_excel import read_excel_file, json_serial
+    data = read_excel_file(excel_path)
+    return json.loads(json.dumps(data, default=json_serial))
+
+
+def import_circuits(data, replace_existing=True):
+    """
+    Import circuit data into the circuit table
+
+    Args:
+        data: Sheet name -> list of circuit dicts
+        replace_existing: If True, delete existing circuits first
+
+    Returns:
+        int: Number of circuits imported
+    """
+    with app.app_context():
+        try:
+            if replace_existing:
+                existing_count = Circuit.query.delete()
+                logger.info(f"Deleted {existing_count} existing circuits")
+
+            imported_count = 0
+            for sheet_name, circuits in data.items():
+                for fields in circuits:
+                    # Rows keep the order of the source so the circuit list is unchanged
+                    db.session.add(Circuit.from_dict(sheet_name, fields))
+                    imported_count += 1
+                logger.info(f"Imported {len(circuits)} circuits from sheet {sheet_name}")
+
+            # Running workers reload the circuit list when they see this entry
+            circuit_store.record_change('reload')
+            db.session.commit()
+            logger.info(f"Successfully imported {imported_count} circuits")
+
+        except Exception as e:
+            logger.error(f"Error during circuit import: {str(e)}")
+            db.session.rollback()
+            raise
+
+        # Build the snapshot of the circuit list now rather than on the first
+        # request; if that fails, the first request builds it instead
+        try:
+            circuit_store.current()
+        except Exception as e:
+            logger.warning(f"Could not build the circuit snapshot: {str(e)}")
+        return imported_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the Circuit IDs database into the circuit table")
+    parser.add_argument('json_file', nargs='?', default='circuit_ids_data.json',
+                        help="JSON file written by read_excel.py (default: circuit_ids_data.json)")
+    parser.add_argument('--excel', metavar='PATH', help="Read the Excel workbook instead of a JSON file")
+    parser.add_argument('--append', action='store_true', help="Keep the existing circuits")
+    args = parser.parse_args()
+
+    source = args.excel or args.json_file
+    if not os.path.exists(source):
+        logger.error(f"File not found: {source}")
+        return 1
+
+    logger.info(f"Loading circuit data from {source}")
+    data = load_excel(source) if args.excel else load_json(source)
+    import_circuits(data, replace_existing=not args.append)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+Mock SSH Device Fleet for ACORN Testing
+
+Simulates many network devices in one process, each listening on its own
+port. Unlike fixed_ssh_server.py and improved_ssh_server.py, which serve one
+hardcoded device with a thread per listening socket, every device here has
+its own profile:
+
+- banner, authentication and command latency (fixed or a random range)
+- output size, from a few lines up to many MB, streamed in chunks
+- password, keyboard-interactive or both authentication methods
+- fault injection: connection resets in the middle of a command, hangs
+  before the SSH banner, and rejected logins
+
+One selector thread accepts connections on every listening socket. The SSH
+side is paramiko, which runs a thread per transport, so each connection
+costs a handler thread plus its transport thread, and each running command
+one more thread: about three threads per busy session, which is fine for a
+few hundred concurrent sessions. Sessions accept any number of exec
+channels, so connection reuse can be tested.
+
+Besides the profile's output, two commands are understood by every device:
+``generate <bytes>`` returns that much output and ``sleep <seconds>`` waits
+before answering.
+
+Usage:
+    python mock_fleet.py --devices 200 --base-port 2400
+    python mock_fleet.py --devices 50 --command-delay 0.1-0.8 --output-size 5000000 --auth mixed
+    python mock_fleet.py --devices 20 --reset-rate 0.05 --hang-rate 0.02 --auth-fail-rate 0.01
+    python mock_fleet.py --config fleet.json
+
+The --config file is a JSON object with "defaults" (profile fields applied to
+every device) and "devices" (a list of profiles overriding them per device).
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import selectors
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+import paramiko
+
+logger = logging.getLogger('mock_fleet')
+
+HOST_KEY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_ssh_host_key')
+
+# How much output is sent per channel write
+CHUNK_SIZE = 64 * 1024
+
+# paramiko replies to an exec request only after check_channel_exec_request
+# returns, and a client fails the request if the channel is closed before that
+# reply, which under load can take a while to go out. Finished commands
+# therefore send EOF right away, which is all a client needs, and leave closing
+# the channel to the client for up to this long.
+CLOSE_GRACE = 30.0
+
+AUTH_METHODS = {
+    'password': 'password',
+    'keyboard-interactive': 'keyboard-interactive',
+    'mixed': 'password,keyboard-interactive'
+}
+
+
+def load_host_key(path=HOST_KEY_PATH):
+    """Load the shared mock host key, generating it if it does not exist"""
+    if not os.path.exists(path):
+        logger.info("Generating new host key...")
+        key = paramiko.RSAKey.generate(2048)
+        key.write_private_key_file(path)
+        return key
+    return paramiko.RSAKey.from_private_key_file(path)
+
+
+def parse_range(value):
+    """Parse a latency or size setting: a number or a "low-high" range
+
+    Returns:
+        tuple: (low, high); both are equal for a fixed value
+    """
+    if isinstance(value, (int, float)):
+        return float(value), float(value)
+    text = str(value).strip()
+    if '-' in text:
+        low, high = text.split('-', 1)
+        return float(low), float(high)
+    return float(text), float(text)
+
+
+class DeviceProfile:
+    """Behaviour of one simulated device"""
+
+    FIELDS = ('name', 'port', 'username', 'password', 'auth', 'banner_delay', 'auth_delay',
+              'command_delay', 'output_size', 'reset_rate', 'hang_rate', 'auth_fail_rate')
+
+    def __init__(self, name, port, username='test', password='Ac0rN$', auth='password',
+                 banner_delay=0.0, auth_delay=0.0, command_delay=0.0, output_size=0,
+                 reset_rate=0.0, hang_rate=0.0, auth_fail_rate=0.0):
+        """Initialize the profile
+
+        Args:
+            name (str): Hostname shown in prompts and output
+            port (int): TCP port the device listens on
+            username (str, optional): Accepted username. Defaults to 'test'.
+            password (str, optional): Accepted password. Defaults to 'Ac0rN$'.
+            auth (str, optional): 'password', 'keyboard-interactive' or 'mixed'. Defaults to 'password'.
+            banner_delay (float, optional): Seconds before the SSH banner is sent. Defaults to 0.
+            auth_delay (float, optional): Seconds to answer each authentication attempt. Defaults to 0.
+            command_delay (float, optional): Seconds before a command produces output. Defaults to 0.
+            output_size (int, optional): Minimum bytes of output per command; 0 sends the
+                normal short response. Defaults to 0.
+            reset_rate (float, optional): Chance a command's connection is reset halfway
+                through its output. Defaults to 0.
+            hang_rate (float, optional): Chance a new connection never gets a banner. Defaults to 0.
+            auth_fail_rate (float, optional): Chance valid credentials are rejected. Defaults to 0.
+        """
+        if auth not in AUTH_METHODS:
+            raise ValueError(f"Unknown auth method {auth!r}; expected one of {', '.join(AUTH_METHODS)}")
+        self.name = name
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.auth = auth
+        self.banner_delay = float(banner_delay)
+        self.auth_delay = float(auth_delay)
+        self.command_delay = float(command_delay)
+        self.output_size = int(output_size)
+        self.reset_rate = float(reset_rate)
+        self.hang_rate = float(hang_rate)
+        self.auth_fail_rate = float(auth_fail_rate)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def build_profiles(devices, base_port, seed=None, **settings):
+    """Create uniform profiles for a fleet, drawing ranged settings per device
+
+    Args:
+        devices (int): Number of devices
+        base_port (int): Port of the first device; the others follow it
+        seed (int, optional): Random seed so the same fleet can be recreated. Defaults to None.
+        **settings: DeviceProfile fields; latency and output_size values may be
+            "low-high" ranges, from which each device gets its own value
+
+    Returns:
+        list: DeviceProfile objects
+    """
+    rng = random.Random(seed)
+    ranged = {'banner_delay', 'auth_delay', 'command_delay', 'output_size'}
+    auth = settings.pop('auth', 'password')
+
+    profiles = []
+    for index in range(devices):
+        fields = {}
+        for key, value in settings.items():
+            if key in ranged:
+                low, high = parse_range(value)
+                fields[key] = rng.uniform(low, high)
+            else:
+                fields[key] = value
+        if auth == 'alternate':
+            # Half the fleet on each method, as seen with mixed OLT and router vendors
+            fields['auth'] = 'keyboard-interactive' if index % 2 else 'password'
+        else:
+            fields['auth'] = auth
+        profiles.append(DeviceProfile(name=f"mock-{index + 1:03d}", port=base_port + index, **fields))
+    return profiles
+
+
+def load_profiles(path):
+    """Read device profiles from a JSON config file"""
+    with open(path) as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    profiles = []
+    for index, device in enumerate(config.get('devices', [])):
+        fields = dict(defaults, **device)
+        fields.setdefault('name', f"mock-{index + 1:03d}")
+        profiles.append(DeviceProfile(**fields))
+    return profiles
+
+
+class _DeviceServer(paramiko.ServerInterface):
+    """SSH server interface for one connection to a device"""
+
+    def __init__(self, fleet, profile, auth_fails):
+        self.fleet = fleet
+        self.profile = profile
+        self.auth_fails = auth_fails
+
+    def get_allowed_auths(self, username):
+        return AUTH_METHODS[self.profile.auth]
+
+    def _check_credentials(self, username, password):
+        if self.profile.auth_delay:
+            time.sleep(self.profile.auth_delay)
+        if self.auth_fails:
+            self.fleet.count('auth_failures_injected')
+            return paramiko.AUTH_FAILED
+        if username == self.profile.username and password == self.profile.password:
+            return paramiko.AUTH_SUCCESSFUL
+        self.fleet.count('auth_failures')
+        return paramiko.AUTH_FAILED
+
+    def check_auth_password(self, username, password):
+        if 'password' not in AUTH_METHODS[self.profile.auth]:
+            return paramiko.AUTH_FAILED
+        return self._check_credentials(username, password)
+
+    def check_auth_interactive(self, username, submethods):
+        if 'keyboard-interactive' not in AUTH_METHODS[self.profile.auth]:
+            return paramiko.AUTH_FAILED
+        self._interactive_user = username
+        return paramiko.InteractiveQuery('', '', ('Password: ', False))
+
+    def check_auth_interactive_response(self, responses):
+        password = responses[0] if responses else ''
+        return self._check_credentials(getattr(self, '_interactive_user', None), password)
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self.fleet.run_shell, args=(self.profile, channel), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.fleet.run_exec, args=(self.profile, channel, command.decode('utf-8', 'replace')),
+                         daemon=True).start()
+        return True
+
+
+class MockFleet:
+    """Serves every device profile from one process until stopped"""
+
+    def __init__(self, profiles, host='127.0.0.1', seed=None, host_key=None):
+        """Initialize the fleet
+
+        Args:
+            profiles (list): DeviceProfile objects, each with its own port
+            host (str, optional): Address to bind. Defaults to 127.0.0.1.
+            seed (int, optional): Seed for fault injection. Defaults to None.
+            host_key (paramiko.PKey, optional): Host key. Defaults to mock_ssh_host_key.
+        """
+        self.profiles = profiles
+        self.host = host
+        self.host_key = host_key or load_host_key()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._sockets = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def chance(self, rate):
+        """Return True with the given probability"""
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] = self._stats.get(name, 0) + amount
+
+    def stats(self):
+        """Return counters of connections, commands, bytes sent and injected faults"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def start(self):
+        """Bind every device's port and serve them from a background thread"""
+        for profile in self.profiles:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((self.host, profile.port))
+            except OSError:
+                sock.close()
+                self.stop()
+                raise
+            sock.listen(128)
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ, profile)
+            self._sockets.append(sock)
+
+        self._thread = threading.Thread(target=self._serve, name='mock-fleet-accept', daemon=True)
+        self._thread.start()
+        logger.info(f"Serving {len(self.profiles)} mock devices on {self.host}")
+
+    def stop(self):
+        """Stop accepting connections and close the listening sockets"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for sock in self._sockets:
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            sock.close()
+        self._sockets = []
+
+    def serve_forever(self):
+        """Start the fleet and block until interrupted"""
+        self.start()
+        try:
+            while not self._stop.is_set():
+                time.sleep(0.5)
+        finally:
+            self.stop()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(timeout=0.5):
+                try:
+                    client, addr = key.fileobj.accept()
+                except (BlockingIOError, OSError):
+                    continue
+                client.setblocking(True)
+                self.count('connections')
+                threading.Thread(target=self._handle_connection, args=(key.data, client, addr),
+                                 daemon=True).start()
+
+    def _handle_connection(self, profile, client, addr):
+        """Run the SSH server side of one connection"""
+        if self.chance(profile.hang_rate):
+            # Accept the TCP connection but never send a banner
+            self.count('hangs_injected')
+            logger.info(f"{profile.name}: hanging connection from {addr[0]}:{addr[1]}")
+            try:
+                while not self._stop.is_set() and client.recv(4096):
+                    pass
+            except OSError:
+                pass
+            client.close()
+            return
+
+        if profile.banner_delay:
+            time.sleep(profile.banner_delay)
+
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        server = _DeviceServer(self, profile, auth_fails=self.chance(profile.auth_fail_rate))
+        try:
+            transport.start_server(server=server)
+            # Channels are handled by the server interface callbacks. Accepted
+            # channels are kept referenced, as paramiko closes a channel once it
+            # is garbage collected.
+            channels = []
+            while transport.is_active() and not self._stop.is_set():
+                channel = transport.accept(1)
+                if channel is not None:
+                    channels = [c for c in channels if not c.closed] + [channel]
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logger.debug(f"{profile.name}: connection from {addr[0]}:{addr[1]} ended: {str(e)}")
+        finally:
+            transport.close()
+
+    def run_exec(self, profile, channel, command):
+        """Answer one exec request and close its channel"""
+        self.count('commands')
+        try:
+            delay, output = self.respond(profile, command)
+            if delay:
+                time.sleep(delay)
+            reset_at = len(output) // 2 if self.chance(profile.reset_rate) else None
+            self._send(profile, channel, output, reset_at)
+            channel.send_exit_status(0)
+            channel.shutdown_write()
+            close_by = time.monotonic() + CLOSE_GRACE
+            while not channel.closed and time.monotonic() < close_by:
+                time.sleep(0.05)
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            logger.debug(f"{profile.name}: command {command!r} ended early: {str(e)}")
+        finally:
+            self._close_channel(channel)
+
+    def run_shell(self, profile, channel):
+        """Serve a line-based interactive shell until 'exit'"""
+        prompt = f"{profile.name}> ".encode()
+        try:
+            channel.sendall(f"Welcome to {profile.name}\r\n".encode() + prompt)
+            buffer = b''
+            while True:
+                data = channel.recv(1024)
+                if not data:
+                    break
+                buffer += data
+                while b'\n' in buffer or b'\r' in buffer:
+                    line, _, buffer = buffer.replace(b'\r', b'\n').partition(b'\n')
+                    command = line.decode('utf-8', 'replace').strip()
+                    if not command:
+                        channel.sendall(prompt)
+                        continue
+                    if command.lower() in ('exit', 'quit', 'logout'):
+                        channel.sendall(b"Goodbye!\r\n")
+                        return
+                    self.count('commands')
+                    delay, output = self.respond(profile, command)
+                    if delay:
+                        time.sleep(delay)
+                    self._send(profile, channel, output, None)
+                    channel.sendall(b"\r\n" + prompt)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            self._close_channel(channel)
+
+    @staticmethod
+    def _close_channel(channel):
+        """Close a channel whose connection may already be gone"""
+        try:
+            channel.close()
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+
+    def respond(self, profile, command):
+        """Return (delay in seconds, output bytes) for a command on a device"""
+        words = command.split()
+        delay = profile.command_delay
+        size = profile.output_size
+
+        if words and words[0] == 'sleep' and len(words) > 1:
+            delay += float(words[1])
+        if words and words[0] == 'generate' and len(words) > 1:
+            size = int(words[1])
+
+        text = self._base_output(profile, command).encode()
+        if size > len(text):
+            text += self._filler(size - len(text))
+        return delay, text
+
+    @staticmethod
+    def _base_output(profile, command):
+        if command.startswith('show version'):
+            return (f"\n{profile.name} Mock Router v1.0\nModel: Virtual-1000\n"
+                    f"Serial: VM{profile.port:08d}\nUptime: 1 day, 6 hours, 37 minutes\n")
+        if command.startswith('show interface'):
+            return ("\nInterface ge-0/0/0, Enabled, Physical link is Up\n"
+                    "  Description: Uplink to Provider\n  MTU: 1500 bytes\n"
+                    "  Input rate: 5.2 Mbps (3200 pps)\n  Output rate: 2.1 Mbps (1500 pps)\n")
+        return f"\n{profile.name}: output of '{command}'\n"
+
+    @staticmethod
+    def _filler(size):
+        """Interface counter lines adding up to size bytes"""
+        lines = []
+        total = 0
+        number = 0
+        while total < size:
+            number += 1
+            line = (f"ge-0/{number // 48}/{number % 48:<3} up    up    in {number * 7919 % 100000:>6} pps  "
+                    f"out {number * 104729 % 100000:>6} pps  errors 0\n")
+            lines.append(line)
+            total += len(line)
+        return ''.join(lines).encode()[:size]
+
+    def _send(self, profile, channel, output, reset_at):
+        """Stream output in chunks, resetting the connection at reset_at if given"""
+        sent = 0
+        while sent < len(output):
+            end = min(len(output), sent + CHUNK_SIZE)
+            if reset_at is not None and end >= reset_at:
+                channel.sendall(output[sent:reset_at])
+                self.count('bytes', reset_at - sent)
+                self._reset(profile, channel)
+                return
+            channel.sendall(output[sent:end])
+            self.count('bytes', end - sent)
+            sent = end
+
+    def _reset(self, profile, channel):
+        """Drop the TCP connection with a RST, as a device crash or firewall would"""
+        self.count('resets_injected')
+        logger.info(f"{profile.name}: resetting connection mid-command")
+        sock = channel.get_transport().sock
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        except OSError:
+            pass
+        sock.close()
+        raise EOFError("connection reset by fault injection")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a fleet of SSH network devices')
+    parser.add_argument('--config', help='JSON file with "defaults" and per-device "devices" profiles')
+    parser.add_argument('--devices', type=int, default=10, help='Number of devices (default: 10)')
+    parser.add_argument('--base-port', type=int, default=2400, help='Port of the first device (default: 2400)')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--username', default='test', help="Accepted username (default: test)")
+    parser.add_argument('--password', default='Ac0rN$', help="Accepted password (default: Ac0rN$)")
+    parser.add_argument('--auth', choices=list(AUTH_METHODS) + ['alternate'], default='password',
+                        help='Authentication offered; "alternate" gives half the devices each method')
+    parser.add_argument('--banner-delay', default='0', help='Seconds before the banner, or a low-high range')
+    parser.add_argument('--auth-delay', default='0', help='Seconds per authentication attempt, or a range')
+    parser.add_argument('--command-delay', default='0', help='Seconds before command output, or a range')
+    parser.add_argument('--output-size', default='0', help='Bytes of output per command, or a range')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='Chance a command is cut off by a reset')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Chance a connection never gets a banner')
+    parser.add_argument('--auth-fail-rate', type=float, default=0.0, help='Chance a valid login is rejected')
+    parser.add_argument('--seed', type=int, help='Random seed for ranged settings and faults')
+    parser.add_argument('--list', action='store_true', help='Print the device profiles as JSON and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger('paramiko').setLevel(logging.WARNING)
+
+    if args.config:
+        profiles = load_profiles(args.config)
+    else:
+        profiles = build_profiles(args.devices, args.base_port, seed=args.seed,
+                                  username=args.username, password=args.password, auth=args.auth,
+                                  banner_delay=args.banner_delay, auth_delay=args.auth_delay,
+                                  command_delay=args.command_delay, output_size=args.output_size,
+                                  reset_rate=args.reset_rate, hang_rate=args.hang_rate,
+                                  auth_fail_rate=args.auth_fail_rate)
+
+    if args.list:
+        print(json.dumps([profile.to_dict() for profile in profiles], indent=2))
+        return
+
+    fleet = MockFleet(profiles, host=args.bind, seed=args.seed)
+    signal.signal(signal.SIGTERM, lambda signum, frame: fleet._stop.set())
+    print(f"Starting {len(profiles)} mock devices on {args.bind}, ports "
+          f"{min(p.port for p in profiles)}-{max(p.port for p in profiles)}")
+    try:
+        fleet.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Mock fleet stopped: {json.dumps(fleet.stats())}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
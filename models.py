@@ -2,6 +2,8 @@ from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import datetime
+import json
+from utils.circuit_rows import classify_circuit
 
 # Available themes
 THEMES = {
@@ -74,6 +76,7 @@ class Equipment(db.Model):
     username = db.Column(db.String(50), nullable=False)  # Default username (for backward compatibility)
     password = db.Column(db.String(100), nullable=False)  # Default password (for backward compatibility)
     key_filename = db.Column(db.String(255), nullable=True)  # Path to SSH private key file (optional)
+    max_sessions = db.Column(db.Integer, nullable=True)  # Concurrent SSH sessions allowed (None = app default, 0 = unlimited)
     
     # Relationships
     circuit_mappings = db.relationship('CircuitMapping', back_populates='equipment', cascade='all, delete-orphan')
@@ -152,6 +155,107 @@ class CircuitMapping(db.Model):
         return f"<CircuitMapping {self.circuit_id} -> {self.equipment.name if self.equipment else 'None'}>"
 
 
+class Circuit(db.Model):
+    """Model for the circuit inventory (Circuit IDs database)
+    
+    The fields searched and edited from the Circuit IDs pages have their own
+    indexed columns. The rest of each row - the long tail of provider-specific
+    columns from the source workbook - is kept as a JSON object in extra_json.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    sheet = db.Column(db.String(100), nullable=False, index=True)  # Workbook sheet the row came from
+    market = db.Column(db.Text, nullable=True)
+    provider = db.Column(db.String(100), nullable=True, index=True)
+    description = db.Column(db.Text, nullable=True)
+    circuit_id = db.Column(db.String(100), nullable=True, index=True)
+    status = db.Column(db.String(50), nullable=True, index=True)
+    parent_cid = db.Column(db.String(100), nullable=True)
+    access_cid = db.Column(db.String(100), nullable=True)
+    access_provider = db.Column(db.String(100), nullable=True)
+    extra_json = db.Column(db.Text, nullable=True)
+    row_class = db.Column(db.String(10), nullable=True, index=True)  # clean, suspect or junk (see utils/circuit_rows.py)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Incremented on every update
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
+    
+    # Updates and deletes address a row by Circuit ID and Provider
+    __table_args__ = (db.Index('ix_circuit_circuit_id_provider', 'circuit_id', 'provider'),)
+    
+    # Updates and deletes only apply to the version that was loaded, and raise
+    # StaleDataError if someone else changed the row in the meantime
+    __mapper_args__ = {'version_id_col': version}
+    
+    # Field name in the source data -> column
+    CORE_FIELDS = {
+        'Market': 'market',
+        'Provider': 'provider',
+        'Description': 'description',
+        'Circuit ID': 'circuit_id',
+        'Status': 'status',
+        'Parent CID': 'parent_cid',
+        'Access CID': 'access_cid',
+        'Access Provider': 'access_provider'
+    }
+    
+    @classmethod
+    def from_dict(cls, sheet, fields):
+        """Create a circuit from a row of the source data"""
+        circuit = cls(sheet=sheet)
+        circuit.set_fields(fields)
+        return circuit
+    
+    def get_extra(self):
+        """Returns the fields without a column of their own as a dict"""
+        return json.loads(self.extra_json) if self.extra_json else {}
+    
+    def set_fields(self, fields):
+        """Set fields by their source data names, e.g. {'Circuit ID': ..., 'Capacity': ...}"""
+        extra = self.get_extra()
+        for field, value in fields.items():
+            column = self.CORE_FIELDS.get(field)
+            if column:
+                setattr(self, column, None if value is None else str(value))
+            else:
+                extra[field] = value
+        self.extra_json = json.dumps(extra)
+        # Header and spacer rows are recognized once here instead of on every listing
+        self.row_class = classify_circuit(self.sheet, self.to_dict())
+    
+    def to_dict(self):
+        """Returns the row keyed by source data field names, as the Circuit IDs pages use it
+        
+        Core fields are only included when set, like cells in the source data.
+        """
+        fields = {}
+        for field, column in self.CORE_FIELDS.items():
+            value = getattr(self, column)
+            if value is not None:
+                fields[field] = value
+        fields.update(self.get_extra())
+        return fields
+    
+    def __repr__(self):
+        return f"<Circuit {self.circuit_id} ({self.provider})>"
+
+
+class CircuitChange(db.Model):
+    """Model for the journal of changes to the circuit table
+    
+    Every edit, delete and import of circuits appends an entry in the same
+    transaction as the change. Each worker keeps a copy of the circuit list and
+    brings it up to date by reloading only the circuits named in the entries
+    after the last one it has seen. Old entries are pruned periodically.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    circuit_pk = db.Column(db.Integer, nullable=True)  # circuit.id of the changed row; None for imports
+    action = db.Column(db.String(10), nullable=False)  # update, delete or reload (every circuit changed)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<CircuitChange {self.id} {self.action} {self.circuit_pk}>"
+
+
 class Contact(db.Model):
     """Model for global contacts database (POC Database)"""
     id = db.Column(db.Integer, primary_key=True)
@@ -174,6 +278,79 @@ class Contact(db.Model):
         return f"<Contact {self.first_name} {self.last_name} ({self.company})>"
 
 
+class AlertJob(db.Model):
+    """Model for alert runs executed in the background, and bulk checks, with their results"""
+    id = db.Column(db.String(36), primary_key=True)  # UUID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    circuit_id = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, completed, cancelled, failed
+    cancel_requested = db.Column(db.Boolean, default=False)
+    
+    # JSON list of the result slots to display; the results are AlertJobResult rows
+    pending_json = db.Column(db.Text, nullable=True)
+    
+    error = db.Column(db.Text, nullable=True)
+    total_time = db.Column(db.Integer, nullable=True)  # ms
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    FINISHED_STATUSES = ('completed', 'cancelled', 'failed')
+    
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+    
+    def get_pending(self):
+        """Returns the result slots of this job as a list"""
+        return json.loads(self.pending_json) if self.pending_json else []
+    
+    def get_results(self, since=0):
+        """Returns the results received after the first ``since``, in the order they were recorded"""
+        rows = (db.session.query(AlertJobResult.result_json)
+                .filter(AlertJobResult.job_id == self.id, AlertJobResult.seq > since)
+                .order_by(AlertJobResult.seq))
+        return [json.loads(result_json) for result_json, in rows]
+    
+    def result_count(self):
+        """Returns the number of results recorded so far"""
+        return db.session.query(db.func.count(AlertJobResult.seq)).filter(AlertJobResult.job_id == self.id).scalar()
+    
+    def to_dict(self, since=0):
+        """Returns the job status and the results after the first ``since`` for the status endpoint"""
+        results = self.get_results(since=max(since, 0))
+        return {
+            'id': self.id,
+            'circuit_id': self.circuit_id,
+            'status': self.status,
+            'cancel_requested': bool(self.cancel_requested),
+            'result_count': self.result_count(),
+            'results': results,
+            'error': self.error,
+            'total_time': self.total_time,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f"<AlertJob {self.id} {self.circuit_id} {self.status}>"
+
+
+class AlertJobResult(db.Model):
+    """Model for one result of an alert job
+    
+    Results are numbered 1, 2, ... in the order they are recorded, so pollers
+    can ask for the ones after the last they have, and recording a result is a
+    single insert however many came before it.
+    """
+    job_id = db.Column(db.String(36), db.ForeignKey('alert_job.id', ondelete='CASCADE'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    result_json = db.Column(db.Text, nullable=False)
+    
+    def __repr__(self):
+        return f"<AlertJobResult {self.job_id} {self.seq}>"
+
+
 class AppSettings(db.Model):
     """Model for application settings"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1,10 +1,14 @@
 import logging
 import datetime
+import hashlib
+import hmac
 import traceback
 import os
 import uuid
 import json
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, Response
+import csv
+import io
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file, Response, stream_with_context, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
@@ -12,10 +16,17 @@ from flask_wtf.csrf import validate_csrf as validate_csrf_token
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, EmailField, TextAreaField, SelectField, HiddenField, SearchField
 from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError, Optional
 from sqlalchemy import or_
+from sqlalchemy.orm.exc import StaleDataError
 from werkzeug.utils import secure_filename
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from app import app, db
-from models import Equipment, CircuitMapping, User, UserCredential, Contact, AppSettings, THEMES
-from utils.ssh_client import SSHClient
+from models import Equipment, CircuitMapping, User, UserCredential, Contact, AppSettings, AlertJob, Circuit, THEMES
+from utils.ssh_client import SSHClient, ConnectPolicy, ssh_pool
+from utils.alert_runner import MappingTask, run_tasks, iter_results
+from utils.alert_jobs import alert_jobs, JobQueueFull
+from utils.output_capture import get_spill_path, get_spill_owner
+from utils.circuit_store import circuit_store
+from utils.circuit_rows import VALID_PROVIDERS, KEY_FIELDS
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -667,6 +678,176 @@ def theme_settings():
     return render_template('theme_settings.html', form=form, current_theme=current_theme, 
                            themes=THEMES, theme_previews=theme_previews)
 
+def _build_ssh_params(equipment, credentials):
+    """Build the SSHClient keyword arguments for an equipment and the current user"""
+    # Check if user has TACACS credentials - these are preferred
+    if hasattr(current_user, 'tacacs_username') and current_user.tacacs_username and current_user.tacacs_password:
+        logger.info(f"Using TACACS credentials for user {current_user.username}")
+        # No key file with TACACS
+        return {
+            'hostname': equipment.ip_address,
+            'port': equipment.ssh_port,
+            'username': current_user.tacacs_username,
+            'password': current_user.tacacs_password
+        }
+    
+    # Use equipment-specific or user-specific credentials
+    logger.info(f"Using equipment-specific credentials for {equipment.name}")
+    ssh_params = {
+        'hostname': equipment.ip_address,
+        'port': equipment.ssh_port,
+        'username': credentials['username'],
+        'password': credentials['password']
+    }
+    
+    # Add key_filename if available in credentials
+    if 'key_filename' in credentials and credentials['key_filename']:
+        ssh_params['key_filename'] = credentials['key_filename']
+        logger.info(f"Using key-based authentication for {equipment.name} with key file: {credentials['key_filename']}")
+    
+    return ssh_params
+
+def _get_contact_info(mappings):
+    """Extract contact information from the first mapping of a circuit"""
+    # (assuming the same circuit ID has the same contact across mappings)
+    if mappings and (mappings[0].contact_name or mappings[0].contact_email or 
+                      mappings[0].contact_phone or mappings[0].contact_notes):
+        return {
+            'name': mappings[0].contact_name,
+            'email': mappings[0].contact_email,
+            'phone': mappings[0].contact_phone,
+            'notes': mappings[0].contact_notes
+        }
+    return None
+
+def _credential_owner(equipment, credential_identity):
+    """Identify output read from a device with a given set of credentials
+    
+    Anyone who would connect to the device with the same credentials may see
+    that output, as they would get the same output by running the command.
+    """
+    digest = hashlib.sha256(repr(credential_identity).encode('utf-8')).hexdigest()
+    return f"{equipment.id}:{digest}"
+
+def _build_equipment_task(equipment, mapping_command, commands_list, circuit_id, connect_policy, refresh=False):
+    """Build the MappingTask that runs a list of commands on one device
+    
+    Credential problems are turned into a task carrying the error result, so
+    they are reported alongside the other results instead of failing the check.
+    
+    Args:
+        equipment (Equipment): The device to connect to
+        mapping_command (str): Command text shown for credential errors
+        commands_list (list): Individual commands to run
+        circuit_id (str): Circuit being checked; part of the coalescing key
+        connect_policy (ConnectPolicy): Connection timing policy
+        refresh (bool, optional): Ignore cached output. Defaults to False.
+    """
+    try:
+        # Get user-specific credentials for this equipment
+        credentials = equipment.get_credentials_for_user(current_user)
+        ssh_params = _build_ssh_params(equipment, credentials)
+        
+        # Identical checks share command executions, and cached output is
+        # reused, only when they would connect to the same device with the
+        # same credentials and so have the same privileges on it
+        credential_identity = (equipment.id,) + ssh_pool.make_key(**ssh_params)
+        coalesce_key = (circuit_id,) + credential_identity if app.config['ALERT_COALESCE_REQUESTS'] else None
+        cache_scope = credential_identity if app.config['ALERT_CACHE_ENABLED'] else None
+        
+        max_sessions = equipment.max_sessions
+        if max_sessions is None:
+            max_sessions = app.config['ALERT_DEVICE_MAX_SESSIONS']
+        
+        return MappingTask(equipment.name, mapping_command, commands_list, ssh_params,
+                           connect_policy=connect_policy, coalesce_key=coalesce_key,
+                           cache_scope=cache_scope, refresh=refresh, max_sessions=max_sessions,
+                           queue_timeout=app.config['ALERT_DEVICE_QUEUE_TIMEOUT'],
+                           owner=_credential_owner(equipment, credential_identity))
+                
+    except ValueError as e:
+        # This is specific to the TACACS credential error we're raising in get_credentials_for_user
+        error_message = str(e)
+        logger.error(f"Credential error for equipment {equipment.name}: {error_message}")
+        
+        # Add a more user-friendly message for missing credentials
+        if "requires TACACS credentials" in error_message:
+            error_result = {
+                'equipment_name': equipment.name,
+                'command': mapping_command,
+                'output': f"⚠️ TACACS authentication requires global credentials. Please set up your TACACS credentials in 'My Credentials' section.",
+                'status': 'error',
+                'is_tacacs_error': True
+            }
+        elif "requires personal credentials" in error_message:
+            error_result = {
+                'equipment_name': equipment.name,
+                'command': mapping_command,
+                'output': f"⚠️ {error_message}",
+                'status': 'error',
+                'is_tacacs_error': True
+            }
+        else:
+            error_result = {
+                'equipment_name': equipment.name,
+                'command': mapping_command,
+                'output': error_message,
+                'status': 'error'
+            }
+        return MappingTask(equipment.name, mapping_command, error_results=[error_result])
+            
+    except Exception as e:
+        logger.error(f"SSH error for equipment {equipment.name}: {str(e)}")
+        return MappingTask(equipment.name, mapping_command, error_results=[{
+            'equipment_name': equipment.name,
+            'command': mapping_command,
+            'output': str(e),
+            'status': 'error'
+        }])
+
+def _build_alert_tasks(circuit_id, mappings, refresh=False):
+    """Turn the circuit mappings into MappingTasks for the alert runner
+    
+    Args:
+        circuit_id (str): The circuit being checked
+        mappings (list): CircuitMapping rows for the circuit, in display order
+        refresh (bool, optional): Ignore cached output and run every command. Defaults to False.
+    """
+    # Resolve credentials for every mapping up front; the SSH work itself
+    # runs outside the request thread and must not touch the database
+    tasks = []
+    connect_policy = ConnectPolicy(deadline=app.config['ALERT_CONNECT_DEADLINE'])
+    for mapping in mappings:
+        equipment = mapping.equipment
+        commands_list = mapping.get_commands_list()
+        
+        # If no valid commands, skip this mapping
+        if not commands_list:
+            logger.warning(f"No valid commands found for circuit {circuit_id} on {equipment.name}")
+            continue
+        
+        tasks.append(_build_equipment_task(equipment, mapping.command, commands_list, circuit_id,
+                                           connect_policy, refresh=refresh))
+    
+    return tasks
+
+def _pending_results(tasks):
+    """List the result slots a streamed alert run will fill, in display order"""
+    pending = []
+    for task_index, task in enumerate(tasks):
+        entries = task.error_results if task.error_results is not None else [{'command': cmd} for cmd in task.commands]
+        for index, entry in enumerate(entries):
+            pending.append({
+                'slot': f"{task_index}-{index}",
+                'equipment_name': task.equipment_name,
+                'command': entry['command']
+            })
+    return pending
+
+def _alert_stream_serializer():
+    """Signs the short-lived tokens that authorize an alert result stream"""
+    return URLSafeTimedSerializer(app.secret_key, salt='alert-stream')
+
 @app.route('/submit_alert', methods=['POST'])
 @login_required
 def submit_alert():
@@ -688,159 +869,44 @@ def submit_alert():
     start_total_time = time.time()
     
     # Find circuit mappings for the given circuit ID
-    mappings = CircuitMapping.query.filter_by(circuit_id=circuit_id).all()
+    mappings = CircuitMapping.query.filter_by(circuit_id=circuit_id).order_by(CircuitMapping.id).all()
     
     if not mappings:
         flash(f'No equipment mappings found for circuit ID: {circuit_id}', 'warning')
         return redirect(url_for('index'))
     
-    # Extract contact information from the first mapping 
-    # (assuming the same circuit ID has the same contact across mappings)
-    if mappings and (mappings[0].contact_name or mappings[0].contact_email or 
-                      mappings[0].contact_phone or mappings[0].contact_notes):
-        contact_info = {
-            'name': mappings[0].contact_name,
-            'email': mappings[0].contact_email,
-            'phone': mappings[0].contact_phone,
-            'notes': mappings[0].contact_notes
-        }
-    else:
-        contact_info = None
-        
-    results = []
-    
-    # Execute commands on each mapped equipment
-    for mapping in mappings:
-        equipment = mapping.equipment
-        commands_list = mapping.get_commands_list()
-        
-        # If no valid commands, skip this mapping
-        if not commands_list:
-            logger.warning(f"No valid commands found for circuit {circuit_id} on {equipment.name}")
-            continue
-        
+    contact_info = _get_contact_info(mappings)
+    refresh = request.form.get('refresh') == '1'
+    tasks = _build_alert_tasks(circuit_id, mappings, refresh=refresh)
+    
+    # In streaming mode the page is rendered right away and the results are
+    # pushed to it by stream_alert as each command completes
+    if request.form.get('stream') == '1':
+        token = _alert_stream_serializer().dumps({'circuit_id': circuit_id, 'user_id': current_user.id,
+                                                  'refresh': refresh})
+        return render_template('result.html',
+                              circuit_id=circuit_id,
+                              results=[],
+                              pending=_pending_results(tasks),
+                              stream_url=url_for('stream_alert', token=token),
+                              contact_info=contact_info)
+    
+    # Otherwise queue the run as a background job and send the browser to a
+    # page that polls for its results
+    if app.config['ALERT_BACKGROUND_JOBS']:
         try:
-            # Get user-specific credentials for this equipment
-            credentials = equipment.get_credentials_for_user(current_user)
-            
-            # Simplified approach (similar to SSH test page)
-            for cmd in commands_list:
-                # Measure time for this specific command
-                start_cmd_time = time.time()
-                
-                try:
-                    # Check if user has TACACS credentials - these are preferred
-                    if hasattr(current_user, 'tacacs_username') and current_user.tacacs_username and current_user.tacacs_password:
-                        logger.info(f"Using TACACS credentials for user {current_user.username}")
-                        username = current_user.tacacs_username
-                        password = current_user.tacacs_password
-                        # No key file with TACACS
-                        ssh_params = {
-                            'hostname': equipment.ip_address,
-                            'port': equipment.ssh_port,
-                            'username': username,
-                            'password': password
-                        }
-                    else:
-                        # Use equipment-specific or user-specific credentials
-                        logger.info(f"Using equipment-specific credentials for {equipment.name}")
-                        ssh_params = {
-                            'hostname': equipment.ip_address,
-                            'port': equipment.ssh_port,
-                            'username': credentials['username'],
-                            'password': credentials['password']
-                        }
-                        
-                        # Add key_filename if available in credentials
-                        if 'key_filename' in credentials and credentials['key_filename']:
-                            ssh_params['key_filename'] = credentials['key_filename']
-                            logger.info(f"Using key-based authentication for {equipment.name} with key file: {credentials['key_filename']}")
-                    
-                    ssh_client = SSHClient(**ssh_params)
-                    
-                    # Connect to the equipment
-                    ssh_client.connect()
-                    
-                    # Execute command (one at a time)
-                    success, output = ssh_client.execute_command(cmd)
-                    
-                    # Handle extremely large outputs, limit to 200KB instead of 500KB
-                    # for faster page rendering
-                    if success and isinstance(output, str) and len(output) > 200000:
-                        logger.warning(f"Large output ({len(output)} bytes) from {equipment.name}. Truncating for display.")
-                        truncated_output = output[:100000] + "\n\n[... Output truncated due to size (showing first 100KB) ...]\n\n" + output[-100000:]
-                        output_to_display = truncated_output
-                        status = 'success'
-                        is_truncated = True
-                    else:
-                        output_to_display = output
-                        status = 'success' if success else 'error'
-                        is_truncated = False
-                    
-                    # Disconnect immediately after command
-                    ssh_client.disconnect()
-                    
-                    # Calculate performance metrics
-                    cmd_time = int((time.time() - start_cmd_time) * 1000)  # ms
-                    
-                    results.append({
-                        'equipment_name': equipment.name,
-                        'command': cmd,
-                        'output': output_to_display,
-                        'status': status,
-                        'execution_time': cmd_time,
-                        'truncated': is_truncated
-                    })
-                    
-                except Exception as inner_e:
-                    # Handle command-specific errors
-                    logger.error(f"Command error for {equipment.name}, cmd: {cmd}: {str(inner_e)}")
-                    results.append({
-                        'equipment_name': equipment.name,
-                        'command': cmd,
-                        'output': f"ERROR: {str(inner_e)}",
-                        'status': 'error',
-                        'execution_time': int((time.time() - start_cmd_time) * 1000)
-                    })
-                    
-        except ValueError as e:
-            # This is specific to the TACACS credential error we're raising in get_credentials_for_user
-            error_message = str(e)
-            logger.error(f"Credential error for equipment {equipment.name}: {error_message}")
-            
-            # Add a more user-friendly message for missing credentials
-            if "requires TACACS credentials" in error_message:
-                results.append({
-                    'equipment_name': equipment.name,
-                    'command': mapping.command,
-                    'output': f"⚠️ TACACS authentication requires global credentials. Please set up your TACACS credentials in 'My Credentials' section.",
-                    'status': 'error',
-                    'is_tacacs_error': True
-                })
-            elif "requires personal credentials" in error_message:
-                results.append({
-                    'equipment_name': equipment.name,
-                    'command': mapping.command,
-                    'output': f"⚠️ {error_message}",
-                    'status': 'error',
-                    'is_tacacs_error': True
-                })
-            else:
-                results.append({
-                    'equipment_name': equipment.name,
-                    'command': mapping.command,
-                    'output': error_message,
-                    'status': 'error'
-                })
-                
-        except Exception as e:
-            logger.error(f"SSH error for equipment {equipment.name}: {str(e)}")
-            results.append({
-                'equipment_name': equipment.name,
-                'command': mapping.command,
-                'output': str(e),
-                'status': 'error'
-            })
+            job_id = alert_jobs.submit(current_user.id, circuit_id, tasks, _pending_results(tasks),
+                                       parallel=app.config['ALERT_PARALLEL_EXECUTION'],
+                                       max_workers=app.config['ALERT_MAX_WORKERS'])
+        except JobQueueFull as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('index'))
+        return redirect(url_for('alert_job', job_id=job_id))
+    
+    # Execute commands on each mapped equipment, in parallel when enabled
+    results = run_tasks(tasks,
+                        parallel=app.config['ALERT_PARALLEL_EXECUTION'],
+                        max_workers=app.config['ALERT_MAX_WORKERS'])
     
     # Calculate total execution time
     total_time = int((time.time() - start_total_time) * 1000)
@@ -852,6 +918,310 @@ def submit_alert():
                           contact_info=contact_info,
                           total_time=total_time)
 
+@app.route('/submit_alert/stream', methods=['GET'])
+@login_required
+def stream_alert():
+    """Stream the results of an alert run to the browser as Server-Sent Events"""
+    import time
+    
+    try:
+        token_data = _alert_stream_serializer().loads(request.args.get('token', ''),
+                                                      max_age=app.config['ALERT_STREAM_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return jsonify({'error': 'Invalid or expired stream token'}), 400
+    
+    if token_data.get('user_id') != current_user.id:
+        return jsonify({'error': 'Stream token does not belong to this user'}), 403
+    
+    circuit_id = token_data['circuit_id']
+    start_total_time = time.time()
+    mappings = CircuitMapping.query.filter_by(circuit_id=circuit_id).order_by(CircuitMapping.id).all()
+    tasks = _build_alert_tasks(circuit_id, mappings, refresh=token_data.get('refresh', False))
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate():
+        for task_index, index, result in iter_results(tasks,
+                                                      parallel=app.config['ALERT_PARALLEL_EXECUTION'],
+                                                      max_workers=app.config['ALERT_MAX_WORKERS']):
+            yield sse('result', dict(result, slot=f"{task_index}-{index}"))
+        
+        total_time = int((time.time() - start_total_time) * 1000)
+        logger.info(f"Total execution time for circuit {circuit_id} (streamed): {total_time}ms")
+        yield sse('done', {'total_time': total_time})
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _get_alert_job_or_404(job_id):
+    """Load an alert job the current user is allowed to see"""
+    job = db.session.get(AlertJob, job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.is_admin):
+        abort(404)
+    return job
+
+@app.route('/alert_jobs/<job_id>', methods=['GET'])
+@login_required
+def alert_job(job_id):
+    """Show the results page for a background alert job"""
+    job = _get_alert_job_or_404(job_id)
+    mappings = CircuitMapping.query.filter_by(circuit_id=job.circuit_id).order_by(CircuitMapping.id).all()
+    
+    return render_template('result.html',
+                          circuit_id=job.circuit_id,
+                          results=[],
+                          pending=job.get_pending(),
+                          poll_url=url_for('alert_job_status', job_id=job.id),
+                          cancel_url=url_for('cancel_alert_job', job_id=job.id),
+                          contact_info=_get_contact_info(mappings))
+
+@app.route('/alert_jobs/<job_id>/status', methods=['GET'])
+@login_required
+def alert_job_status(job_id):
+    """Return the status and results collected so far for an alert job
+    
+    Pollers pass ?since=N with the number of results they already have so that
+    large outputs are only sent once.
+    """
+    job = _get_alert_job_or_404(job_id)
+    return jsonify(job.to_dict(since=request.args.get('since', 0, type=int)))
+
+@app.route('/alert_jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_alert_job(job_id):
+    """Request cancellation of an alert job"""
+    job = _get_alert_job_or_404(job_id)
+    if not alert_jobs.cancel(job):
+        return jsonify({'success': False, 'message': f'Job is already {job.status}'}), 409
+    return jsonify({'success': True, 'message': 'Cancellation requested'})
+
+@app.route('/alert_jobs/<job_id>/download/<fmt>', methods=['GET'])
+@login_required
+def download_alert_job(job_id, fmt):
+    """Download the results of an alert job as JSON or CSV"""
+    job = _get_alert_job_or_404(job_id)
+    filename = f"acorn_results_{job.created_at.strftime('%Y%m%d_%H%M%S')}"
+    
+    if fmt == 'json':
+        return Response(json.dumps(job.to_dict(), indent=2),
+                        mimetype='application/json',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.json'})
+    
+    if fmt == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['Circuit ID', 'Equipment', 'Command', 'Status', 'Execution Time (ms)', 'Output'])
+        for result in job.get_results():
+            # Bulk results can belong to several circuits; write one row for each
+            for circuit_id in result.get('circuit_ids') or [job.circuit_id]:
+                writer.writerow([circuit_id, result.get('equipment_name', ''), result.get('command', ''),
+                                 result.get('status', ''), result.get('execution_time', ''), result.get('output', '')])
+        return Response(output.getvalue(),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.csv'})
+    
+    abort(404)
+
+def _may_read_output(owner):
+    """Check whether the current user's credentials for the device match the owner of an output"""
+    equipment = db.session.get(Equipment, int(owner.split(':', 1)[0]))
+    if equipment is None:
+        return False
+    try:
+        credentials = equipment.get_credentials_for_user(current_user)
+        ssh_params = _build_ssh_params(equipment, credentials)
+    except ValueError:
+        return False
+    credential_identity = (equipment.id,) + ssh_pool.make_key(**ssh_params)
+    return hmac.compare_digest(owner, _credential_owner(equipment, credential_identity))
+
+@app.route('/command_output/<file_id>', methods=['GET'])
+@login_required
+def download_command_output(file_id):
+    """Download the full output of a command that was too large to show
+    
+    Only users who would connect to the device with the same credentials as
+    the check that produced the output, and admins, may download it.
+    """
+    path = get_spill_path(file_id)
+    owner = get_spill_owner(file_id)
+    # Output without a recorded owner is not served to anyone
+    if path is None or owner is None:
+        flash('The full output is no longer available. Please run the check again.', 'warning')
+        return redirect(url_for('index'))
+    if not current_user.is_admin and not _may_read_output(owner):
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True,
+                     download_name=f"command_output_{file_id[:8]}.txt")
+
+def _parse_circuit_ids(text, is_csv=False):
+    """Split pasted or uploaded text into unique circuit IDs, keeping their order
+    
+    Pasted text and text files may list one ID per line or separate them with
+    commas. For CSV files only the first column is used. Header cells such as
+    "Circuit ID" are skipped.
+    """
+    if is_csv:
+        values = [row[0] for row in csv.reader(io.StringIO(text)) if row]
+    else:
+        values = [value for line in text.splitlines() for value in line.split(',')]
+    
+    circuit_ids = []
+    seen = set()
+    for value in values:
+        circuit_id = value.strip()
+        if not circuit_id or circuit_id.lower().replace('_', ' ') in ('circuit id', 'circuit ids', 'circuit'):
+            continue
+        if circuit_id not in seen:
+            seen.add(circuit_id)
+            circuit_ids.append(circuit_id)
+    return circuit_ids
+
+def _build_bulk_tasks(mappings, refresh=False):
+    """Group the mappings of many circuits into one MappingTask per device
+    
+    Each device gets a single task, and so a single SSH session, running every
+    distinct command any of the circuits needs on it.
+    
+    Returns:
+        tuple: (tasks, slot_circuits) where slot_circuits maps the slot of every
+            result the tasks will produce to the circuit IDs it belongs to
+    """
+    groups = {}  # equipment_id -> (equipment, {command: [circuit_id, ...]})
+    for mapping in mappings:
+        equipment, commands = groups.setdefault(mapping.equipment_id, (mapping.equipment, {}))
+        for cmd in mapping.get_commands_list():
+            circuits = commands.setdefault(cmd, [])
+            if mapping.circuit_id not in circuits:
+                circuits.append(mapping.circuit_id)
+    
+    tasks = []
+    slot_circuits = {}
+    connect_policy = ConnectPolicy(deadline=app.config['ALERT_CONNECT_DEADLINE'])
+    for equipment, commands in groups.values():
+        if not commands:
+            continue
+        commands_list = list(commands)
+        task = _build_equipment_task(equipment, '; '.join(commands_list), commands_list, None, connect_policy,
+                                     refresh=refresh)
+        task_index = len(tasks)
+        tasks.append(task)
+        
+        if task.error_results is not None:
+            # A credential error is reported once for every circuit on the device
+            device_circuits = []
+            for circuits in commands.values():
+                device_circuits.extend(c for c in circuits if c not in device_circuits)
+            result_circuits = [device_circuits] * len(task.error_results)
+        else:
+            result_circuits = [commands[cmd] for cmd in commands_list]
+        for index, circuits in enumerate(result_circuits):
+            slot_circuits[f"{task_index}-{index}"] = circuits
+    
+    return tasks, slot_circuits
+
+@app.route('/bulk_alert', methods=['GET', 'POST'])
+@login_required
+def bulk_alert():
+    """Check many circuits at once, running each device's commands over one session
+    
+    The check runs as a background alert job; the browser is sent to its
+    consolidated results page, which fills in as the job records results.
+    """
+    form = FlaskForm()
+    
+    if request.method == 'GET':
+        return render_template('bulk_alert.html', form=form,
+                               max_circuits=app.config['ALERT_BULK_MAX_CIRCUITS'])
+    
+    if not form.validate_on_submit():
+        flash('CSRF token missing or invalid', 'danger')
+        return redirect(url_for('bulk_alert'))
+    
+    text = request.form.get('circuit_ids', '')
+    is_csv = False
+    upload = request.files.get('circuit_file')
+    if upload and upload.filename:
+        if not upload.filename.lower().endswith(('.txt', '.csv')):
+            flash('Please upload a .txt or .csv file of circuit IDs', 'danger')
+            return redirect(url_for('bulk_alert'))
+        text = upload.read().decode('utf-8-sig', errors='replace')
+        is_csv = upload.filename.lower().endswith('.csv')
+    
+    circuit_ids = _parse_circuit_ids(text, is_csv=is_csv)
+    if not circuit_ids:
+        flash('Please enter at least one circuit ID', 'danger')
+        return redirect(url_for('bulk_alert'))
+    if len(circuit_ids) > app.config['ALERT_BULK_MAX_CIRCUITS']:
+        flash(f"Too many circuit IDs ({len(circuit_ids)}). "
+              f"Please check at most {app.config['ALERT_BULK_MAX_CIRCUITS']} at a time.", 'danger')
+        return redirect(url_for('bulk_alert'))
+    
+    mappings = CircuitMapping.query.filter(CircuitMapping.circuit_id.in_(circuit_ids)).order_by(CircuitMapping.id).all()
+    tasks, slot_circuits = _build_bulk_tasks(mappings, refresh=request.form.get('refresh') == '1')
+    logger.info(f"Bulk check of {len(circuit_ids)} circuits on {len(tasks)} devices")
+    
+    unmapped = []
+    mapped = {mapping.circuit_id for mapping in mappings}
+    for circuit_id in circuit_ids:
+        if circuit_id not in mapped:
+            unmapped.append({
+                'circuit_ids': [circuit_id],
+                'equipment_name': '',
+                'command': '',
+                'output': 'No equipment mappings found for this circuit ID',
+                'status': 'error',
+                'unmapped': True
+            })
+    
+    # For bulk checks the pending list holds the circuit IDs in the order entered
+    try:
+        job_id = alert_jobs.submit(current_user.id, f"BULK: {len(circuit_ids)} circuits", tasks, circuit_ids,
+                                   parallel=app.config['ALERT_PARALLEL_EXECUTION'],
+                                   max_workers=app.config['ALERT_MAX_WORKERS'],
+                                   slot_fields={slot: {'circuit_ids': circuits}
+                                                for slot, circuits in slot_circuits.items()},
+                                   results=unmapped)
+    except JobQueueFull as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('bulk_alert'))
+    
+    return redirect(url_for('bulk_alert_result', job_id=job_id))
+
+@app.route('/bulk_alert/<job_id>', methods=['GET'])
+@login_required
+def bulk_alert_result(job_id):
+    """Show the consolidated results of a bulk check, as far as its job has got"""
+    job = _get_alert_job_or_404(job_id)
+    circuit_ids = job.get_pending()
+    
+    # Results are recorded as commands complete; show them in task order,
+    # after the unmapped circuits that were recorded up front
+    results = sorted(job.get_results(),
+                     key=lambda r: tuple(int(part) for part in r['slot'].split('-')) if 'slot' in r else (-1,))
+    
+    by_circuit = {circuit_id: [] for circuit_id in circuit_ids}
+    for result in results:
+        for circuit_id in result.get('circuit_ids', []):
+            by_circuit.setdefault(circuit_id, []).append(result)
+    
+    summary = {
+        'circuits': len(by_circuit),
+        'ok': sum(1 for r in by_circuit.values() if r and all(x['status'] == 'success' for x in r)),
+        'errors': sum(1 for r in by_circuit.values() if any(x['status'] == 'error' and not x.get('unmapped') for x in r)),
+        'unmapped': sum(1 for r in by_circuit.values() if any(x.get('unmapped') for x in r)),
+        'devices': len({r['equipment_name'] for r in results if r.get('equipment_name')})
+    }
+    
+    return render_template('bulk_result.html',
+                          job=job,
+                          by_circuit=by_circuit,
+                          summary=summary,
+                          total_time=job.total_time,
+                          result_count=len(results))
+
 @app.route('/equipment')
 @login_required
 def equipment_list():
@@ -888,6 +1258,13 @@ def equipment_list():
         flash(f"An error occurred: {str(e)}", "danger")
         return redirect(url_for('index'))
 
+def _parse_max_sessions(value):
+    """Read the session limit from the equipment form; blank means use the default"""
+    try:
+        return max(0, int(value)) if value not in (None, '') else None
+    except ValueError:
+        return None
+
 @app.route('/equipment/add', methods=['POST'])
 @login_required
 def add_equipment():
@@ -936,6 +1313,7 @@ def add_equipment():
     # Set key filename if provided
     if key_filename and key_filename.strip():
         new_equipment.key_filename = key_filename.strip()
+    new_equipment.max_sessions = _parse_max_sessions(request.form.get('max_sessions'))
     
     db.session.add(new_equipment)
     db.session.commit()
@@ -989,6 +1367,7 @@ def edit_equipment(id):
     equipment.name = request.form.get('name')
     equipment.ip_address = request.form.get('ip_address')
     equipment.ssh_port = request.form.get('ssh_port', 22, type=int)
+    equipment.max_sessions = _parse_max_sessions(request.form.get('max_sessions'))
     
     credential_type = request.form.get('credential_type')
     username = request.form.get('username')
@@ -1422,24 +1801,42 @@ def test_ssh_connection():
         key_filename=request.form.get('key_filename', '')
     )
     
+# Fields of each circuit shown in the circuit list and returned by its JSON endpoint
+CIRCUIT_LIST_FIELDS = ['Market', 'Provider', 'Circuit ID', 'Status', 'Description']
+
+CIRCUIT_CONFLICT_MESSAGE = ('Circuit "{circuit_id}" was changed by someone else after you opened it. '
+                            'Review the current values and try again.')
+
+def select_circuits(circuit_index, args):
+    """Return the numbers of the circuits listed for the search parameters in args, in display order"""
+    search_term = args.get('search_term', '')
+    search_field = args.get('search_field', 'all')
+    provider_filter = args.get('provider_filter', 'all')
+    status_filter = args.get('status_filter', 'ACTIVE')
+    show_all = args.get('show_all', '0') == '1'  # Show all records if show_all=1
+    
+    # Header and junk rows are classified when circuits are imported or edited
+    # and are not part of the circuit snapshot. show_all lists every clean circuit
+    # regardless of the filters and search; otherwise the provider, status and
+    # search masks select the matching rows
+    if show_all:
+        return circuit_index.select(clean_only=True)
+    return circuit_index.select(provider=None if provider_filter == 'all' else provider_filter,
+                                status=None if status_filter == 'all' else status_filter,
+                                search_term=search_term,
+                                search_field=search_field)
+
+def paginate(items, page, per_page):
+    """Return one page of items and the number of the next page, or None on the last page"""
+    start = (page - 1) * per_page
+    next_page = page + 1 if start + per_page < len(items) else None
+    return items[start:start + per_page], next_page
+
 @app.route('/circuit_ids', methods=['GET'])
 @login_required
 def circuit_ids():
     """Display and search Circuit IDs database"""
     try:
-        # Load circuit data from JSON file
-        circuit_data_file = 'circuit_ids_data.json'
-        if not os.path.exists(circuit_data_file):
-            flash('Circuit IDs database file not found', 'danger')
-            return render_template('circuit_ids.html', 
-                                circuit_data=None, 
-                                providers=[], 
-                                search_form=CircuitIDSearchForm(),
-                                csrf_form=FlaskForm())
-        
-        with open(circuit_data_file, 'r') as f:
-            all_data = json.load(f)
-            
         # Check if we're viewing a specific circuit
         circuit_id = request.args.get('circuit_id')
         if circuit_id:
@@ -1453,16 +1850,8 @@ def circuit_ids():
             back_link = url_for('circuit_ids', **back_params)
             
             # Find the specific circuit
-            selected_circuit = None
-            for sheet_name, circuits in all_data.items():
-                for circuit in circuits:
-                    if str(circuit.get('Circuit ID')) == str(circuit_id):
-                        # Debug logging for circuit detection
-                        logger.debug(f"Found circuit: {circuit.get('Circuit ID')} in {sheet_name}")
-                        selected_circuit = circuit
-                        break
-                if selected_circuit:
-                    break
+            circuit_row = Circuit.query.filter_by(circuit_id=str(circuit_id)).order_by(Circuit.id).first()
+            selected_circuit = circuit_row.to_dict() if circuit_row else None
             
             if selected_circuit:
                 # Create search form for the filters
@@ -1486,6 +1875,7 @@ def circuit_ids():
                 
                 return render_template('circuit_detail.html',
                                     circuit=selected_circuit,
+                                    circuit_version=circuit_row.version,
                                     all_fields=all_fields,
                                     back_link=back_link,
                                     search_form=search_form,
@@ -1501,356 +1891,38 @@ def circuit_ids():
         search_field = request.args.get('search_field', 'all')
         provider_filter = request.args.get('provider_filter', 'all')
         status_filter = request.args.get('status_filter', 'ACTIVE')
-        show_all = request.args.get('show_all', '0') == '1'  # Show all records if show_all=1
-        
-        # Process data from all sheets and combine into a single list for display
-        all_circuits = []
+        page = max(request.args.get('page', 1, type=int), 1)
         
-        # Define valid providers (only these will be shown in filter dropdown)
-        valid_providers = ['Arelion', 'Accelecom', 'Cogent', 'Cologix - Jacksonville', 
-                          'CoreSite - Atlanta', 'Lumen', 'Seimitsu', 'Uniti', 
-                          'CenturyLink', 'Windstream']
+        # The circuit list is served from a snapshot of the circuit table shared
+        # by all workers, rebuilt when the table changes
+        circuit_index = circuit_store.current()
+        if not len(circuit_index):
+            flash('The Circuit IDs database is empty. Run import_circuit_ids.py to load it.', 'warning')
+            return render_template('circuit_ids.html', 
+                                circuit_data=None, 
+                                providers=[], 
+                                search_form=CircuitIDSearchForm(),
+                                csrf_form=FlaskForm())
         
+        # Only the known providers are shown in the filter dropdown
         providers = set(['all'])  # For filter dropdown, starting with 'all'
-        for provider in valid_providers:
+        for provider in VALID_PROVIDERS:
             providers.add(provider)
             
         # Set fixed status options - only these three values will be shown in dropdown regardless of data
         statuses = set(['all', 'ACTIVE', 'INACTIVE', 'PENDING'])
         
         # Key fields to include
-        key_fields = ['Market', 'Provider', 'Circuit ID', 'Status', 'Description', 
-                      'Parent CID', 'Access CID', 'Access Provider']
-        
-        # Process each sheet
-        for sheet_name, circuits in all_data.items():
-            for circuit in circuits:
-                # Skip rows without a circuit ID or description, or that are header-like rows
-                if not circuit.get('Circuit ID') and not circuit.get('Description'):
-                    continue
-                    
-                # Skip if we have header-like rows (Market, Arelion, Circuit ID, etc.)
-                market = str(circuit.get('Market', '')).lower()
-                provider = str(circuit.get('Provider', '')).lower() 
-                circuit_id = str(circuit.get('Circuit ID', '')).lower()
-                description = str(circuit.get('Description', '')).lower()
-                status = str(circuit.get('Status', '')).lower()
-                
-                # Check for header-like pattern with field names as values
-                # For this logic, we consider it to be a header row if:
-                # 1. At least one field is a field name (e.g., "Market", "Circuit ID", etc.)
-                # 2. No field contains any actual useful data (only contains field names or provider names or is empty)
-                
-                # These are descriptive field headers, not actual circuit data
-                # Make sure to include both capitalized and lowercase versions
-                forbidden_values = [
-                    'data center id', 'Data Center ID', 
-                    'cage id', 'Cage ID',
-                    'cabinet number', 'Cabinet Number',
-                    'patch panel id', 'Patch Panel ID',
-                    'patch panel port capacity', 'Patch Panel Port Capacity',
-                    'patch panel ports used', 'Patch Panel Ports Used',
-                    'patch panel ports available', 'Patch Panel Ports Available',
-                    'patch panel connector type', 'Patch Panel Connector Type',
-                    'data center description', 'Data Center Description',
-                    '-', 'patch panel connector', 'Patch Panel Connector'
-                ]
-                
-                # Check for header rows - these can appear in various patterns:
-                # 1. Market field contains a forbidden value (e.g., "Data Center ID")
-                # 2. Market is empty but Circuit ID contains a forbidden value
-                # 3. Market is "-" (a dash or hyphen) - often used as spacers
-                
-                # Filter out any row where Market field contains any of our forbidden values
-                if 'Market' in circuit and circuit['Market'] and isinstance(circuit['Market'], str):
-                    market_value = circuit['Market']
-                    
-                    # Check for exact match with forbidden values
-                    if market_value in forbidden_values:
-                        logger.debug(f"Filtering out forbidden header in Market: {market_value} from {sheet_name}")
-                        continue
-                        
-                    # Check lowercase match
-                    if market_value.lower() in [val.lower() for val in forbidden_values]:
-                        logger.debug(f"Filtering out forbidden header (case-insensitive) in Market: {market_value} from {sheet_name}")
-                        continue
-                        
-                    # Check for other problematic Market values
-                    if market_value == "-" or market_value == "":
-                        logger.debug(f"Filtering out empty or dash Market value: '{market_value}' from {sheet_name}")
-                        continue
-                
-                # Also filter rows where Circuit ID field contains forbidden values 
-                if 'Circuit ID' in circuit and circuit['Circuit ID'] and isinstance(circuit['Circuit ID'], str):
-                    circuit_id_value = circuit['Circuit ID']
-                    
-                    # Check for exact match with forbidden values
-                    if circuit_id_value in forbidden_values:
-                        logger.debug(f"Filtering out forbidden header in Circuit ID: {circuit_id_value} from {sheet_name}")
-                        continue
-                        
-                    # Check lowercase match
-                    if circuit_id_value.lower() in [val.lower() for val in forbidden_values]:
-                        logger.debug(f"Filtering out forbidden header (case-insensitive) in Circuit ID: {circuit_id_value} from {sheet_name}")
-                        continue
-                
-                # Special case for rows where circuit_id = provider = "Cologix - Jacksonville"
-                # This pattern appears in the problematic rows from the screenshot
-                if (circuit.get('Circuit ID') == 'Cologix - Jacksonville' and 
-                    circuit.get('Provider') == 'Cologix - Jacksonville' and
-                    circuit.get('Status') == 'ACTIVE' and
-                    (not circuit.get('Description') or circuit.get('Description') == '-')):
-                    logger.debug(f"Filtering out Cologix - Jacksonville entry with empty/missing Description")
-                    continue
-                
-                # Filter out entries where Market = "Market" and Circuit ID = "Circuit ID"
-                # This catches header rows that made it into the data
-                if ('Market' in circuit and 'Circuit ID' in circuit and
-                    circuit.get('Market') == 'Market' and 
-                    circuit.get('Circuit ID') == 'Circuit ID'):
-                    logger.debug(f"Filtering out header row with Market='Market' and Circuit ID='Circuit ID' from {sheet_name}")
-                    continue
-                    
-                # Filter out entries where Provider field = Provider name (e.g., "Uniti", "Windstream") 
-                # and Circuit ID = "Circuit ID" (based on screenshot example)
-                if ('Provider' in circuit and 'Circuit ID' in circuit and
-                    circuit.get('Circuit ID') == 'Circuit ID' and
-                    circuit.get('Provider') in ['Uniti', 'Windstream']):
-                    logger.debug(f"Filtering out header row with Provider={circuit.get('Provider')} and Circuit ID='Circuit ID' from {sheet_name}")
-                    continue
-                
-                # Extra check for the "Market" rows with Uniti or Windstream from the screenshot
-                if ('Market' in circuit and 'Provider' in circuit and 'Circuit ID' in circuit and
-                    circuit.get('Market') == 'Market' and 
-                    circuit.get('Provider') in ['Uniti', 'Windstream'] and
-                    circuit.get('Circuit ID') == 'Circuit ID'):
-                    logger.debug(f"Filtering out Market='Market' row with Provider={circuit.get('Provider')} from {sheet_name}")
-                    continue
-                
-                # Special case shown in the screenshot where Market is literally "Market" and Provider is Uniti or Windstream
-                if ('Market' in circuit and 'Provider' in circuit and
-                    circuit.get('Market') == 'Market' and 
-                    circuit.get('Provider') in ['Uniti', 'Windstream']):
-                    logger.debug(f"Filtering out row with Market='Market' and Provider={circuit.get('Provider')} from {sheet_name}")
-                    continue
-                
-                # Count how many fields contain only field names or provider names
-                header_field_count = 0
-                total_fields_with_data = 0
-                
-                for field in key_fields:
-                    field_value = str(circuit.get(field, '')).lower()
-                    if field_value:
-                        total_fields_with_data += 1
-                        
-                        # Check if this field contains its own name
-                        if field_value == field.lower():
-                            header_field_count += 1
-                        # Check for provider names as values
-                        elif field_value in ['accelecom', 'arelion', 'cogent']:
-                            header_field_count += 1
-                
-                # If any field is a header name AND all populated fields are header-like, skip it
-                if header_field_count > 0 and header_field_count == total_fields_with_data:
-                    continue
-                
-                # We're using a predefined provider list, so don't collect from data
-                # Just update the circuit provider if needed
-                if circuit.get('Provider') and circuit.get('Provider') not in valid_providers:
-                    circuit['Provider'] = sheet_name
-                
-                # No longer adding statuses from data - using only our predefined list
-                # of ACTIVE, INACTIVE, and PENDING
-                
-                # Even with show_all, we still want to skip rows that are just 
-                # field name matches (e.g., Market = Market, Provider = Provider, etc.)
-                # or header-like rows (Market, Arelion, Circuit ID, etc.)
-                if show_all:
-                    # Check for specific unwanted patterns:
-                    # 1. Circuit ID field contains a forbidden value (e.g., "Data Center ID", "Cage ID")
-                    # 2. Any field equals its own field name
-                    # 3. Header-like rows with just field names
-                    
-                    # Skip if the circuit has any key field that equals its field name
-                    skip_circuit = False
-                    
-                    # Case 1: Check all key fields for forbidden values (Data Center ID, Cage ID, etc.)
-                    # First check Market, Circuit ID, and Description fields
-                    for field in ['Market', 'Circuit ID', 'Description']:
-                        if field in circuit and circuit[field] and isinstance(circuit[field], str):
-                            field_value = circuit[field]
-                            # Check exact match
-                            if field_value in forbidden_values:
-                                logger.debug(f"Filtering out forbidden header in {field} (exact match) in show_all: {field_value} from {sheet_name}")
-                                skip_circuit = True
-                                break
-                            # Check lowercase match
-                            if field_value.lower() in [val.lower() for val in forbidden_values]:
-                                logger.debug(f"Filtering out forbidden header in {field} (case-insensitive) in show_all: {field_value} from {sheet_name}")
-                                skip_circuit = True
-                                break
-                    
-                    # Special case for rows where circuit_id = provider = "Cologix - Jacksonville"
-                    # This pattern appears in the problematic rows from the screenshot
-                    if not skip_circuit and (circuit.get('Circuit ID') == 'Cologix - Jacksonville' and 
-                        circuit.get('Provider') == 'Cologix - Jacksonville' and
-                        circuit.get('Status') == 'ACTIVE' and
-                        (not circuit.get('Description') or circuit.get('Description') == '-')):
-                        logger.debug(f"Filtering out Cologix - Jacksonville entry with empty/missing Description in show_all")
-                        skip_circuit = True
-                     
-                    # Filter out entries where Market = "Market" and Circuit ID = "Circuit ID"
-                    # This catches header rows that made it into the data
-                    if not skip_circuit and ('Market' in circuit and 'Circuit ID' in circuit and
-                        circuit.get('Market') == 'Market' and 
-                        circuit.get('Circuit ID') == 'Circuit ID'):
-                        logger.debug(f"Filtering out header row with Market='Market' and Circuit ID='Circuit ID' from {sheet_name} in show_all")
-                        skip_circuit = True
-                        
-                    # Filter out entries where Provider field = Provider name (e.g., "Uniti", "Windstream") 
-                    # and Circuit ID = "Circuit ID" (based on screenshot example)
-                    if not skip_circuit and ('Provider' in circuit and 'Circuit ID' in circuit and
-                        circuit.get('Circuit ID') == 'Circuit ID' and
-                        circuit.get('Provider') in ['Uniti', 'Windstream']):
-                        logger.debug(f"Filtering out header row with Provider={circuit.get('Provider')} and Circuit ID='Circuit ID' from {sheet_name} in show_all")
-                        skip_circuit = True
-                    
-                    # Extra check for the "Market" rows with Uniti or Windstream from the screenshot
-                    if not skip_circuit and ('Market' in circuit and 'Provider' in circuit and 'Circuit ID' in circuit and
-                        circuit.get('Market') == 'Market' and 
-                        circuit.get('Provider') in ['Uniti', 'Windstream'] and
-                        circuit.get('Circuit ID') == 'Circuit ID'):
-                        logger.debug(f"Filtering out Market='Market' row with Provider={circuit.get('Provider')} from {sheet_name} in show_all")
-                        skip_circuit = True
-                        
-                    # Special case shown in the screenshot where Market is literally "Market" and Provider is Uniti or Windstream
-                    if not skip_circuit and ('Market' in circuit and 'Provider' in circuit and
-                        circuit.get('Market') == 'Market' and 
-                        circuit.get('Provider') in ['Uniti', 'Windstream']):
-                        logger.debug(f"Filtering out row with Market='Market' and Provider={circuit.get('Provider')} from {sheet_name} in show_all")
-                        skip_circuit = True
-                    
-                    # Case 2: Check if any field equals its own name
-                    if not skip_circuit:
-                        for field in key_fields:
-                            field_value = str(circuit.get(field, '')).lower()
-                            if field_value and field_value == field.lower():
-                                skip_circuit = True
-                                break
-                    
-                    # Case 3: Check for header-like rows with key field names as values
-                    if not skip_circuit:
-                        # Count how many fields contain only field names or provider names
-                        header_field_count = 0
-                        total_fields_with_data = 0
-                        
-                        for field in key_fields:
-                            field_value = str(circuit.get(field, '')).lower()
-                            if field_value:
-                                total_fields_with_data += 1
-                                
-                                # Check if this field contains its own name
-                                if field_value == field.lower():
-                                    header_field_count += 1
-                                # Check for provider names as values
-                                elif field_value in ['accelecom', 'arelion', 'cogent']:
-                                    header_field_count += 1
-                        
-                        # If any field is a header name AND all populated fields are header-like, skip it
-                        if header_field_count > 0 and header_field_count == total_fields_with_data:
-                            skip_circuit = True
-                    
-                    if skip_circuit:
-                        continue
-                        
-                    # Include the circuit if it passed the field name check
-                    all_circuits.append(circuit)
-                    continue
-                
-                # Apply provider filter if selected
-                if provider_filter != 'all' and circuit.get('Provider') != provider_filter:
-                    continue
-                
-                # Apply status filter if selected
-                if status_filter != 'all' and circuit.get('Status') != status_filter:
-                    continue
-                
-                # Apply search filter if search term is provided
-                if search_term:
-                    # Handle case where circuit ID might be in different formats (with or without dashes)
-                    # Remove non-alphanumeric chars for more flexible matching
-                    if search_field == 'circuit_id':
-                        # Skip if search term is exactly "Circuit ID"
-                        if search_term.lower() == "circuit id":
-                            continue
-                            
-                        circuit_id = str(circuit.get('Circuit ID') or '').lower()
-                        search = search_term.lower()
-                        
-                        # Try exact match first
-                        if search in circuit_id:
-                            all_circuits.append(circuit)
-                            continue
-                        
-                        # Try normalized match (remove non-alphanumeric characters)
-                        circuit_id_norm = ''.join(c for c in circuit_id if c.isalnum())
-                        search_norm = ''.join(c for c in search if c.isalnum())
-                        
-                        if search_norm and circuit_id_norm and search_norm in circuit_id_norm:
-                            all_circuits.append(circuit)
-                            continue
-                        else:
-                            continue  # Skip if no match
-                            
-                    elif search_field == 'market':
-                        # Skip if search term is exactly "Market"
-                        if search_term.lower() == "market":
-                            continue
-                        if not circuit.get('Market') or search_term.lower() not in str(circuit.get('Market')).lower():
-                            continue
-                    elif search_field == 'provider':
-                        # Skip if search term is exactly "Provider"
-                        if search_term.lower() == "provider":
-                            continue
-                        if not circuit.get('Provider') or search_term.lower() not in str(circuit.get('Provider')).lower():
-                            continue
-                    elif search_field == 'status':
-                        # Skip if search term is exactly "Status"
-                        if search_term.lower() == "status":
-                            continue
-                        if not circuit.get('Status') or search_term.lower() not in str(circuit.get('Status')).lower():
-                            continue
-                    else:  # 'all' fields
-                        # Search across multiple fields
-                        found = False
-                        for field in key_fields:
-                            # Skip if the search term is exactly a field name (case-insensitive)
-                            if search_term.lower() == field.lower():
-                                continue
-                                
-                            # Check if the field value contains the search term
-                            if field in circuit and circuit[field] and search_term.lower() in str(circuit[field]).lower():
-                                found = True
-                                break
-                                
-                        # Try normalized circuit ID match as well
-                        if not found and 'Circuit ID' in circuit and circuit['Circuit ID']:
-                            circuit_id = str(circuit.get('Circuit ID')).lower()
-                            search = search_term.lower()
-                            circuit_id_norm = ''.join(c for c in circuit_id if c.isalnum())
-                            search_norm = ''.join(c for c in search if c.isalnum())
-                            
-                            if search_norm and circuit_id_norm and search_norm in circuit_id_norm:
-                                found = True
-                                
-                        if not found:
-                            continue
-                
-                # Circuit passed all filters, include in results
-                all_circuits.append(circuit)
+        key_fields = KEY_FIELDS
         
-        # Sort by Provider, then Circuit ID - convert values to strings to avoid type comparison issues
-        all_circuits.sort(key=lambda x: (str(x.get('Provider', '')), str(x.get('Circuit ID', ''))))
+        # Only the first page is rendered; the page loads the rest from
+        # circuit_ids_data as the table is scrolled. Rows with a provider outside
+        # the predefined list are listed under their sheet name
+        all_circuits = select_circuits(circuit_index, request.args)
+        page_numbers, next_page = paginate(all_circuits, page, app.config['CIRCUIT_PAGE_SIZE'])
+        next_page_url = None
+        if next_page:
+            next_page_url = url_for('circuit_ids', **dict(request.args.items(), page=next_page))
         
         # Create search form
         search_form = CircuitIDSearchForm()
@@ -1875,7 +1947,7 @@ def circuit_ids():
         csrf_form = FlaskForm()
         
         return render_template('circuit_ids.html', 
-                              circuit_data=all_circuits, 
+                              circuit_data=circuit_index.rows(page_numbers), 
                               search_form=search_form,
                               csrf_form=csrf_form,
                               search_term=search_term,
@@ -1883,6 +1955,9 @@ def circuit_ids():
                               provider_filter=provider_filter,
                               status_filter=status_filter,
                               count=len(all_circuits),
+                              next_page=next_page,
+                              next_page_url=next_page_url,
+                              list_version=circuit_index.version,
                               key_fields=key_fields)
     
     except Exception as e:
@@ -1894,10 +1969,41 @@ def circuit_ids():
                               search_form=CircuitIDSearchForm(),
                               csrf_form=FlaskForm())
                               
+@app.route('/circuit_ids/data', methods=['GET'])
+@login_required
+def circuit_ids_data():
+    """Return one page of the circuit list as JSON
+    
+    Takes the same search parameters as the circuit list, plus page (from 1)
+    and per_page.
+    """
+    try:
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = request.args.get('per_page', app.config['CIRCUIT_PAGE_SIZE'], type=int)
+        per_page = min(max(per_page, 1), app.config['CIRCUIT_PAGE_SIZE_MAX'])
+        
+        circuit_index = circuit_store.current()
+        all_circuits = select_circuits(circuit_index, request.args)
+        page_numbers, next_page = paginate(all_circuits, page, per_page)
+        
+        return jsonify({
+            'circuits': [{field: circuit.get(field) for field in CIRCUIT_LIST_FIELDS}
+                         for circuit in circuit_index.rows(page_numbers)],
+            'total': len(all_circuits),
+            'page': page,
+            'per_page': per_page,
+            'next_page': next_page,
+            'version': circuit_index.version
+        })
+    except Exception as e:
+        logger.error(f"Error loading circuit IDs page: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/update_circuit', methods=['POST'])
 @login_required
 def update_circuit():
-    """Update circuit information in the JSON database"""
+    """Update circuit information in the Circuit IDs database"""
     # Check if user has editor or admin privileges
     if not current_user.is_admin and not current_user.is_editor:
         flash('You do not have permission to edit circuits', 'danger')
@@ -1920,55 +2026,36 @@ def update_circuit():
     access_cid = request.form.get('access_cid')
     access_provider = request.form.get('access_provider')
     capacity = request.form.get('capacity')
+    version = request.form.get('version', type=int)  # Version of the circuit the form was filled in from
     
     if not original_circuit_id or not provider:
         flash('Missing required fields', 'danger')
         return redirect(url_for('circuit_ids'))
     
     try:
-        # Load circuit data
-        circuit_data_file = 'circuit_ids_data.json'
-        if not os.path.exists(circuit_data_file):
-            flash('Circuit IDs database file not found', 'danger')
-            return redirect(url_for('circuit_ids'))
-            
-        with open(circuit_data_file, 'r') as f:
-            all_data = json.load(f)
-        
-        # Find and update the circuit
-        found = False
-        for sheet_name, circuits in all_data.items():
-            for i, circuit in enumerate(circuits):
-                if str(circuit.get('Circuit ID')) == str(original_circuit_id) and str(circuit.get('Provider')) == str(provider):
-                    # Update the circuit with new values
-                    all_data[sheet_name][i]['Circuit ID'] = circuit_id
-                    all_data[sheet_name][i]['Status'] = status
-                    
-                    if market:
-                        all_data[sheet_name][i]['Market'] = market
-                    if description:
-                        all_data[sheet_name][i]['Description'] = description
-                    if parent_cid:
-                        all_data[sheet_name][i]['Parent CID'] = parent_cid
-                    if access_cid:
-                        all_data[sheet_name][i]['Access CID'] = access_cid
-                    if access_provider:
-                        all_data[sheet_name][i]['Access Provider'] = access_provider
-                    if capacity:
-                        all_data[sheet_name][i]['Capacity'] = capacity
-                    
-                    found = True
-                    break
-            if found:
-                break
-        
-        if not found:
+        changes = {'Circuit ID': circuit_id, 'Status': status}
+        optional_fields = {'Market': market, 'Description': description, 'Parent CID': parent_cid,
+                           'Access CID': access_cid, 'Access Provider': access_provider, 'Capacity': capacity}
+        changes.update({field: value for field, value in optional_fields.items() if value})
+        
+        # Find the circuit by its Circuit ID and Provider, locking the row until
+        # the change is committed so concurrent edits are applied one at a time
+        circuit = (Circuit.query.filter_by(circuit_id=original_circuit_id, provider=provider)
+                   .order_by(Circuit.id).with_for_update().first())
+        if not circuit:
+            db.session.rollback()
             flash(f'Circuit ID "{original_circuit_id}" not found', 'warning')
             return redirect(url_for('circuit_ids'))
         
-        # Save updated data back to file
-        with open(circuit_data_file, 'w') as f:
-            json.dump(all_data, f, indent=4)
+        # Don't overwrite changes someone else saved after this form was loaded
+        if version is not None and version != circuit.version:
+            db.session.rollback()
+            flash(CIRCUIT_CONFLICT_MESSAGE.format(circuit_id=original_circuit_id), 'warning')
+            return redirect(url_for('circuit_ids', circuit_id=original_circuit_id))
+        
+        circuit.set_fields(changes)
+        circuit_store.record_change('update', circuit.id, current_user.id)
+        db.session.commit()
         
         flash(f'Circuit "{original_circuit_id}" updated successfully', 'success')
         
@@ -1979,8 +2066,14 @@ def update_circuit():
         else:
             # Otherwise redirect to the same circuit to see changes
             return redirect(url_for('circuit_ids', circuit_id=original_circuit_id))
+    
+    except StaleDataError:
+        db.session.rollback()
+        flash(CIRCUIT_CONFLICT_MESSAGE.format(circuit_id=original_circuit_id), 'warning')
+        return redirect(url_for('circuit_ids', circuit_id=original_circuit_id))
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error updating circuit: {str(e)}")
         logger.error(traceback.format_exc())
         flash(f'Error updating circuit: {str(e)}', 'danger')
@@ -1989,7 +2082,7 @@ def update_circuit():
 @app.route('/delete_circuit', methods=['POST'])
 @login_required
 def delete_circuit():
-    """Delete circuit from the JSON database"""
+    """Delete circuit from the Circuit IDs database"""
     # Check if user has editor or admin privileges
     if not current_user.is_admin and not current_user.is_editor:
         flash('You do not have permission to delete circuits', 'danger')
@@ -2004,46 +2097,43 @@ def delete_circuit():
     # Get form data
     circuit_id = request.form.get('circuit_id')
     provider = request.form.get('provider')
+    version = request.form.get('version', type=int)  # Version of the circuit the form was shown for
     
     if not circuit_id or not provider:
         flash('Missing required fields', 'danger')
         return redirect(url_for('circuit_ids'))
     
     try:
-        # Load circuit data
-        circuit_data_file = 'circuit_ids_data.json'
-        if not os.path.exists(circuit_data_file):
-            flash('Circuit IDs database file not found', 'danger')
-            return redirect(url_for('circuit_ids'))
-            
-        with open(circuit_data_file, 'r') as f:
-            all_data = json.load(f)
-        
-        # Find and delete the circuit
-        found = False
-        for sheet_name, circuits in all_data.items():
-            for i, circuit in enumerate(circuits):
-                if str(circuit.get('Circuit ID')) == str(circuit_id) and str(circuit.get('Provider')) == str(provider):
-                    # Remove the circuit from the list
-                    deleted_circuit = all_data[sheet_name].pop(i)
-                    logger.info(f"Deleted circuit: {deleted_circuit}")
-                    found = True
-                    break
-            if found:
-                break
-        
-        if not found:
+        # Find the circuit by its Circuit ID and Provider, locking the row, and remove it
+        circuit = (Circuit.query.filter_by(circuit_id=circuit_id, provider=provider)
+                   .order_by(Circuit.id).with_for_update().first())
+        if not circuit:
+            db.session.rollback()
             flash(f'Circuit ID "{circuit_id}" not found', 'warning')
             return redirect(url_for('circuit_ids'))
         
-        # Save updated data back to file
-        with open(circuit_data_file, 'w') as f:
-            json.dump(all_data, f, indent=4)
+        # Don't delete a circuit that changed since the user looked at it
+        if version is not None and version != circuit.version:
+            db.session.rollback()
+            flash(CIRCUIT_CONFLICT_MESSAGE.format(circuit_id=circuit_id), 'warning')
+            return redirect(url_for('circuit_ids', circuit_id=circuit_id))
+        
+        deleted_circuit = circuit.to_dict()
+        circuit_store.record_change('delete', circuit.id, current_user.id)
+        db.session.delete(circuit)
+        db.session.commit()
+        logger.info(f"Deleted circuit: {deleted_circuit}")
         
         flash(f'Circuit "{circuit_id}" deleted successfully', 'success')
         return redirect(url_for('circuit_ids'))
+    
+    except StaleDataError:
+        db.session.rollback()
+        flash(CIRCUIT_CONFLICT_MESSAGE.format(circuit_id=circuit_id), 'warning')
+        return redirect(url_for('circuit_ids', circuit_id=circuit_id))
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error deleting circuit: {str(e)}")
         logger.error(traceback.format_exc())
         flash(f'Error deleting circuit: {str(e)}', 'danger')
@@ -0,0 +1,193 @@
+import datetime
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, db
+from models import AlertJob, AlertJobResult
+from utils.alert_runner import iter_results
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when too many alert jobs are already waiting or running in this process"""
+
+
+class AlertJobManager:
+    """Runs alert jobs on a local background executor
+
+    Job state and results are stored in the AlertJob table, so any gunicorn worker
+    can answer status requests for a job. The queue depth limit and the executor
+    itself are per process. Cancellation is requested through the database and
+    picked up by the worker running the job before its next command. Jobs left
+    queued or running by a worker process that stopped are marked as failed
+    once they are older than ``stale_after``.
+    """
+
+    def __init__(self, max_workers=4, queue_limit=20, retention=86400, stale_after=3600):
+        """Initialize the manager
+
+        Args:
+            max_workers (int, optional): Jobs run at the same time. Defaults to 4.
+            queue_limit (int, optional): Jobs allowed to be queued or running. Defaults to 20.
+            retention (int, optional): Seconds a job and its results are kept. Defaults to 86400.
+            stale_after (int, optional): Seconds after which an unfinished job of another
+                process is assumed abandoned. Defaults to 3600.
+        """
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.retention = retention
+        self.stale_after = stale_after
+        self._executor = None
+        self._cancel_events = {}  # job_id -> threading.Event for jobs in this process
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, circuit_id, tasks, pending, parallel=True, max_workers=8, slot_fields=None,
+               results=None):
+        """Create a job for the given tasks and queue it
+
+        Args:
+            user_id (int): Owner of the job
+            circuit_id (str): Circuit ID, or label of a bulk check, shown for the job
+            tasks (list): MappingTasks to run
+            pending (list): Result slots to display, stored with the job
+            parallel (bool, optional): Run the tasks in parallel. Defaults to True.
+            max_workers (int, optional): Tasks run at the same time. Defaults to 8.
+            slot_fields (dict, optional): Slot -> extra fields added to that slot's result. Defaults to None.
+            results (list, optional): Results known before anything runs. Defaults to None.
+
+        Returns:
+            str: The new job ID
+
+        Raises:
+            JobQueueFull: If queue_limit jobs are already queued or running
+        """
+        self.purge_expired()
+
+        with self._lock:
+            if len(self._cancel_events) >= self.queue_limit:
+                raise JobQueueFull(f"Too many alert checks are already running ({self.queue_limit}). "
+                                   f"Please try again in a moment.")
+            job_id = str(uuid.uuid4())
+            self._cancel_events[job_id] = threading.Event()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='alert-job')
+
+        try:
+            job = AlertJob(id=job_id, user_id=user_id, circuit_id=circuit_id, status='queued')
+            job.pending_json = json.dumps(pending)
+            db.session.add(job)
+            for seq, result in enumerate(results or [], start=1):
+                db.session.add(AlertJobResult(job_id=job_id, seq=seq, result_json=json.dumps(result)))
+            db.session.commit()
+            self._executor.submit(self._run, job_id, tasks, parallel, max_workers, slot_fields or {},
+                                  len(results or []))
+        except Exception:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+            raise
+
+        logger.info(f"Queued alert job {job_id} for circuit {circuit_id}")
+        return job_id
+
+    def cancel(self, job):
+        """Request cancellation of a job; commands already running are allowed to finish"""
+        if job.is_finished:
+            return False
+        job.cancel_requested = True
+        db.session.commit()
+        with self._lock:
+            event = self._cancel_events.get(job.id)
+        if event is not None:
+            event.set()
+        logger.info(f"Cancellation requested for alert job {job.id}")
+        return True
+
+    def purge_expired(self):
+        """Delete jobs older than the retention period and fail jobs abandoned by a stopped worker"""
+        now = datetime.datetime.utcnow()
+        cutoff = now - datetime.timedelta(seconds=self.retention)
+        stale_cutoff = now - datetime.timedelta(seconds=self.stale_after)
+        try:
+            expired = db.select(AlertJob.id).where(AlertJob.created_at < cutoff)
+            AlertJobResult.query.filter(AlertJobResult.job_id.in_(expired)).delete(synchronize_session=False)
+            deleted = AlertJob.query.filter(AlertJob.created_at < cutoff).delete(synchronize_session=False)
+
+            # Jobs of this process are still being worked on, however old they are
+            with self._lock:
+                running_here = list(self._cancel_events)
+            stale = AlertJob.query.filter(AlertJob.status.in_(('queued', 'running')),
+                                          AlertJob.created_at < stale_cutoff,
+                                          AlertJob.id.notin_(running_here)).all()
+            for job in stale:
+                job.status = 'failed'
+                job.error = 'The worker running this job stopped before it finished. Please run the check again.'
+                job.finished_at = now
+            db.session.commit()
+
+            if deleted:
+                logger.info(f"Purged {deleted} expired alert jobs")
+            if stale:
+                logger.warning(f"Marked {len(stale)} abandoned alert jobs as failed")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error purging expired alert jobs: {str(e)}")
+
+    def _run(self, job_id, tasks, parallel, max_workers, slot_fields, seq):
+        """Run a job on the executor thread and record its results after the first ``seq``"""
+        cancel_event = self._cancel_events[job_id]
+        start_time = time.time()
+
+        with app.app_context():
+            job = db.session.get(AlertJob, job_id)
+            try:
+                if job.cancel_requested:
+                    cancel_event.set()
+                job.status = 'running'
+                job.started_at = datetime.datetime.utcnow()
+                db.session.commit()
+
+                for task_index, index, result in iter_results(tasks, parallel=parallel, max_workers=max_workers,
+                                                              should_cancel=cancel_event.is_set):
+                    slot = f"{task_index}-{index}"
+                    seq += 1
+                    db.session.add(AlertJobResult(job_id=job_id, seq=seq, result_json=json.dumps(
+                        dict(result, slot=slot, **slot_fields.get(slot, {})))))
+                    db.session.commit()
+
+                    # Pick up cancellations requested through another worker
+                    if not cancel_event.is_set() and db.session.scalar(
+                            db.select(AlertJob.cancel_requested).where(AlertJob.id == job_id)):
+                        cancel_event.set()
+
+                job.status = 'cancelled' if cancel_event.is_set() else 'completed'
+
+            except Exception as e:
+                logger.error(f"Alert job {job_id} failed: {str(e)}")
+                logger.error(traceback.format_exc())
+                db.session.rollback()
+                job = db.session.get(AlertJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+
+            finally:
+                job.total_time = int((time.time() - start_time) * 1000)
+                job.finished_at = datetime.datetime.utcnow()
+                db.session.commit()
+                db.session.remove()
+                with self._lock:
+                    self._cancel_events.pop(job_id, None)
+                logger.info(f"Alert job {job_id} {job.status} in {job.total_time}ms")
+
+
+alert_jobs = AlertJobManager(
+    max_workers=app.config['ALERT_JOB_WORKERS'],
+    queue_limit=app.config['ALERT_JOB_QUEUE_LIMIT'],
+    retention=app.config['ALERT_JOB_RETENTION'],
+    stale_after=app.config['ALERT_JOB_STALE_AFTER']
+)
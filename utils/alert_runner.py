@@ -0,0 +1,359 @@
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+from utils.device_limiter import device_limiter
+from utils.output_capture import set_spill_owner
+from utils.result_cache import result_cache
+from utils.single_flight import SingleFlight
+from utils.ssh_client import ssh_pool
+
+logger = logging.getLogger(__name__)
+
+# Outputs larger than this are truncated to the first and last half for display.
+# SSHClient already keeps only the start and end of very large outputs, so this
+# is a safety net for output from anywhere else.
+MAX_DISPLAY_OUTPUT = 200000
+TRUNCATED_HALF = 100000
+
+# Identical commands that are already running for another check are shared
+command_flights = SingleFlight()
+
+
+class MappingTask:
+    """A unit of work for one circuit mapping: the equipment, its SSH parameters
+    and the list of commands to run on it.
+
+    Tasks are built in the request thread (where the database session and
+    current_user are available) so the worker threads only deal with plain data.
+    If credentials could not be resolved, ``error_results`` holds the result
+    entries to report instead of running anything. ``connect_policy`` bounds how
+    long connecting to the device may take. When ``coalesce_key`` is set, each
+    command is shared with identical commands already running under the same key
+    (see ``command_flights``). When ``cache_scope`` is set, fresh output from
+    ``result_cache`` is reused for that scope unless ``refresh`` is True.
+    ``max_sessions`` caps the sessions open to the device at once (see
+    ``device_limiter``), waiting at most ``queue_timeout`` seconds for one.
+    ``owner`` identifies the device and credentials the commands run with;
+    full outputs spilled to disk are recorded as theirs.
+    """
+
+    def __init__(self, equipment_name, mapping_command, commands=None, ssh_params=None, error_results=None,
+                 connect_policy=None, coalesce_key=None, cache_scope=None, refresh=False, max_sessions=None,
+                 queue_timeout=60, owner=None):
+        self.equipment_name = equipment_name
+        self.mapping_command = mapping_command
+        self.commands = commands or []
+        self.ssh_params = ssh_params
+        self.error_results = error_results
+        self.connect_policy = connect_policy
+        self.coalesce_key = coalesce_key
+        self.cache_scope = cache_scope
+        self.refresh = refresh
+        self.max_sessions = max_sessions
+        self.queue_timeout = queue_timeout
+        self.owner = owner
+
+    def __repr__(self):
+        return f"<MappingTask {self.equipment_name} ({len(self.commands)} commands)>"
+
+
+def format_output(equipment_name, success, output):
+    """Apply display truncation to a command output
+
+    Returns:
+        tuple: (output_to_display, status, is_truncated)
+    """
+    # Handle extremely large outputs, limit to 200KB for faster page rendering
+    if success and isinstance(output, str) and len(output) > MAX_DISPLAY_OUTPUT:
+        logger.warning(f"Large output ({len(output)} bytes) from {equipment_name}. Truncating for display.")
+        truncated_output = (output[:TRUNCATED_HALF] +
+                            "\n\n[... Output truncated due to size (showing first 100KB) ...]\n\n" +
+                            output[-TRUNCATED_HALF:])
+        return truncated_output, 'success', True
+    return output, 'success' if success else 'error', False
+
+
+def run_mapping(task, on_result=None, should_cancel=None):
+    """Run every command of a mapping task and return its result entries in order
+
+    All commands of the mapping share one authenticated SSH session, checked out
+    from the process-wide connection pool and returned to it afterwards. Each
+    command still gets its own result entry, error handling and execution time;
+    the time spent connecting is counted against the command that needed it.
+
+    If another check is already running the same command with the same
+    credentials, the command waits for that execution and reports its output,
+    marked with ``coalesced``. The check that ran it reports how many others
+    shared it in ``shared_with``. Output served from the result cache is
+    marked with ``cached`` and its age in seconds in ``cache_age``.
+
+    Results include ``timings``, the milliseconds spent in each SSH phase
+    (tcp, banner, kex, auth when the command opened the session; exec and read
+    always), with ``reused_session`` telling whether a pooled session was used.
+
+    Before connecting, the task waits for a session slot on the device and
+    holds it until all its commands are done. Time spent waiting is reported
+    in ``queue_wait`` (ms) and left out of ``execution_time``. The slot and the
+    session are given back before waiting for another check's execution of a
+    command, since that check may itself be waiting for a slot on the device.
+
+    Args:
+        task (MappingTask): The mapping to run
+        on_result (callable, optional): Called as on_result(index, result) as soon
+            as each command finishes, for callers that stream results
+        should_cancel (callable, optional): Checked before each command; once it
+            returns True the remaining commands are reported as cancelled
+    """
+    results = []
+
+    def emit(result):
+        results.append(result)
+        if on_result is not None:
+            on_result(len(results) - 1, result)
+
+    if task.error_results is not None:
+        for result in task.error_results:
+            emit(result)
+        return results
+
+    ssh_client = None
+    connect_error = None
+    device_key = (task.ssh_params['hostname'], int(task.ssh_params.get('port') or 22))
+    slot_held = False
+    queue_wait = 0.0
+
+    def execute(cmd):
+        nonlocal ssh_client, connect_error, slot_held, queue_wait
+        if ssh_client is None:
+            try:
+                if not slot_held:
+                    queue_wait = device_limiter.acquire(device_key, task.max_sessions, task.queue_timeout)
+                    slot_held = True
+                    metrics.device_queue_wait.labels(task.equipment_name).observe(queue_wait)
+                try:
+                    ssh_client = ssh_pool.acquire(connect_policy=task.connect_policy,
+                                                  device_limit=task.max_sessions, **task.ssh_params)
+                except Exception:
+                    metrics.ssh_connect_failures.labels(task.equipment_name).inc()
+                    raise
+            except Exception as e:
+                connect_error = e
+                raise
+        reused = ssh_client.commands_run > 0
+
+        success, output = ssh_client.execute_command(cmd)
+
+        # Pooled sessions can be closed by the device between checks, and some
+        # devices only accept one exec channel per session. If a reused session
+        # was dropped, reconnect once and retry the command.
+        if not success and reused and not ssh_client.is_active():
+            logger.info(f"Session to {task.equipment_name} was closed, reconnecting for: {cmd}")
+            ssh_pool.release(ssh_client)
+            ssh_client = None  # Not released again if reconnecting fails
+            ssh_client = ssh_pool.acquire(connect_policy=task.connect_policy,
+                                          device_limit=task.max_sessions, **task.ssh_params)
+            reused = ssh_client.commands_run > 0
+            success, output = ssh_client.execute_command(cmd)
+
+        details = {}
+        stats = ssh_client.last_command_stats if success else None
+
+        # Phase timings in ms: the connection phases when this command opened
+        # the session, then exec and read for the command itself
+        timings = {}
+        if not reused and ssh_client.connect_timings:
+            timings.update(ssh_client.connect_timings)
+            metrics.ssh_connect_duration.labels(task.equipment_name).observe(ssh_client.connect_timings['connect'])
+        if stats and stats.get('timings'):
+            timings.update(stats['timings'])
+            metrics.ssh_command_duration.labels(task.equipment_name).observe(sum(stats['timings'].values()))
+        if timings:
+            details['timings'] = {phase: int(seconds * 1000) for phase, seconds in timings.items()}
+            details['reused_session'] = reused
+
+        # Outputs too large to keep in memory were cut to their start and end;
+        # the full output may have been spilled to a file for download
+        if stats and stats.get('omitted_bytes'):
+            details.update(output_bytes=stats['bytes'], output_file=stats.get('output_file'), truncated=True)
+            if stats.get('output_file') and task.owner is not None:
+                set_spill_owner(stats['output_file'], task.owner)
+
+        if success and task.cache_scope is not None:
+            result_cache.put(task.cache_scope, cmd, output)
+        return success, output, details
+
+    def step_aside():
+        """Give back the session and device slot before waiting for another check's execution"""
+        nonlocal ssh_client, slot_held
+        ssh_pool.release(ssh_client)
+        ssh_client = None
+        if slot_held:
+            device_limiter.release(device_key, task.max_sessions)
+            slot_held = False
+
+    try:
+        for cmd in task.commands:
+            # Measure time for this specific command
+            start_cmd_time = time.time()
+            queue_wait = 0.0
+
+            if should_cancel is not None and should_cancel():
+                emit({
+                    'equipment_name': task.equipment_name,
+                    'command': cmd,
+                    'output': "Cancelled before this command ran.",
+                    'status': 'error',
+                    'execution_time': 0,
+                    'cancelled': True
+                })
+                continue
+
+            cached = None
+            if task.cache_scope is not None and not task.refresh:
+                cached = result_cache.get(task.cache_scope, cmd)
+            if cached is not None:
+                output, age = cached
+                output_to_display, status, is_truncated = format_output(task.equipment_name, True, output)
+                emit({
+                    'equipment_name': task.equipment_name,
+                    'command': cmd,
+                    'output': output_to_display,
+                    'status': status,
+                    'execution_time': int((time.time() - start_cmd_time) * 1000),
+                    'truncated': is_truncated,
+                    'cached': True,
+                    'cache_age': int(age)
+                })
+                continue
+
+            # A device that could not be reached is not retried for every command
+            if connect_error is not None:
+                emit(_error_result(task.equipment_name, cmd, connect_error, start_cmd_time))
+                continue
+
+            try:
+                if task.coalesce_key is not None:
+                    (success, output, details), shared, waiters = command_flights.do(
+                        task.coalesce_key + (cmd,), lambda: execute(cmd), before_wait=step_aside)
+                else:
+                    (success, output, details), shared, waiters = execute(cmd), False, 0
+
+                output_to_display, status, is_truncated = format_output(task.equipment_name, success, output)
+
+                result = {
+                    'equipment_name': task.equipment_name,
+                    'command': cmd,
+                    'output': output_to_display,
+                    'status': status,
+                    'execution_time': int((time.time() - start_cmd_time - queue_wait) * 1000),  # ms
+                    'truncated': is_truncated
+                }
+                result.update(details)
+                if queue_wait:
+                    result['queue_wait'] = int(queue_wait * 1000)
+                if shared:
+                    result['coalesced'] = True
+                    metrics.coalesced_commands.inc()
+                elif waiters:
+                    result['shared_with'] = waiters
+                emit(result)
+
+            except Exception as e:
+                # Handle command-specific errors and start the next command on a fresh session
+                logger.error(f"Command error for {task.equipment_name}, cmd: {cmd}: {str(e)}")
+                emit(_error_result(task.equipment_name, cmd, e, start_cmd_time))
+                if ssh_client is not None:
+                    ssh_client.disconnect()
+                    ssh_pool.release(ssh_client)
+                    ssh_client = None
+    finally:
+        ssh_pool.release(ssh_client)
+        if slot_held:
+            device_limiter.release(device_key, task.max_sessions)
+
+    return results
+
+
+def _error_result(equipment_name, cmd, error, start_cmd_time):
+    """Build the result entry for a command that could not be run"""
+    return {
+        'equipment_name': equipment_name,
+        'command': cmd,
+        'output': f"ERROR: {str(error)}",
+        'status': 'error',
+        'execution_time': int((time.time() - start_cmd_time) * 1000)
+    }
+
+
+def run_tasks(tasks, parallel=True, max_workers=8):
+    """Run a list of mapping tasks and return the flattened results
+
+    Args:
+        tasks (list): MappingTask objects, in display order
+        parallel (bool, optional): Run the mappings concurrently. Defaults to True.
+        max_workers (int, optional): Upper bound on concurrent mappings. Defaults to 8.
+
+    Returns:
+        list: Result dicts in the same order as the tasks and their commands
+    """
+    if not parallel or len(tasks) <= 1:
+        return [result for task in tasks for result in run_mapping(task)]
+
+    workers = max(1, min(max_workers, len(tasks)))
+    logger.info(f"Running {len(tasks)} mappings with {workers} workers")
+
+    # executor.map yields results in submission order, so the page layout
+    # does not depend on which device answers first
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='alert') as executor:
+        per_task_results = list(executor.map(run_mapping, tasks))
+
+    return [result for task_results in per_task_results for result in task_results]
+
+
+def iter_results(tasks, parallel=True, max_workers=8, should_cancel=None):
+    """Run a list of mapping tasks and yield each result as soon as it is ready
+
+    Args:
+        tasks (list): MappingTask objects, in display order
+        parallel (bool, optional): Run the mappings concurrently. Defaults to True.
+        max_workers (int, optional): Upper bound on concurrent mappings. Defaults to 8.
+        should_cancel (callable, optional): Passed to run_mapping() for every task
+
+    Yields:
+        tuple: (task_index, command_index, result) in completion order. The indexes
+            give the position the result would have in the list from run_tasks().
+    """
+    if not tasks:
+        return
+
+    workers = max(1, min(max_workers, len(tasks))) if parallel else 1
+    logger.info(f"Streaming {len(tasks)} mappings with {workers} workers")
+    finished = queue.Queue()
+
+    def run(task_index, task):
+        try:
+            run_mapping(task,
+                        on_result=lambda index, result: finished.put((task_index, index, result)),
+                        should_cancel=should_cancel)
+        finally:
+            # Marks the task as done even if it failed unexpectedly
+            finished.put((task_index, None, None))
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='alert-stream')
+    try:
+        for task_index, task in enumerate(tasks):
+            executor.submit(run, task_index, task)
+
+        pending = len(tasks)
+        while pending:
+            task_index, index, result = finished.get()
+            if index is None:
+                pending -= 1
+                continue
+            yield task_index, index, result
+    finally:
+        # If the consumer goes away, let running commands finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,129 @@
+"""
+Classification of rows in the Circuit IDs database.
+
+The source workbook repeats header rows, spacer rows and section labels
+between the circuits of each sheet, and read_excel.py keeps them. Each row is
+classified once, when it is imported or edited, and the class is stored with
+it so the circuit list only has to look at the flag:
+
+- ROW_CLEAN: a circuit, listed everywhere
+- ROW_SUSPECT: passes the basic checks but looks like a header under the
+  stricter show_all checks (for example a key field holding its own name);
+  listed in filtered views but not when showing all circuits
+- ROW_JUNK: a header or spacer row, never listed
+"""
+
+ROW_CLEAN = 'clean'
+ROW_SUSPECT = 'suspect'
+ROW_JUNK = 'junk'
+
+# Providers listed in the circuit database; circuits whose Provider is anything
+# else are listed under the name of the sheet they came from
+VALID_PROVIDERS = ['Arelion', 'Accelecom', 'Cogent', 'Cologix - Jacksonville',
+                   'CoreSite - Atlanta', 'Lumen', 'Seimitsu', 'Uniti',
+                   'CenturyLink', 'Windstream']
+
+# Fields shown in the circuit list and searched in 'all fields' mode
+KEY_FIELDS = ['Market', 'Provider', 'Circuit ID', 'Status', 'Description',
+              'Parent CID', 'Access CID', 'Access Provider']
+
+# Descriptive field headers from the data center sheets, not circuit data
+FORBIDDEN_VALUES = frozenset([
+    'data center id', 'cage id', 'cabinet number', 'patch panel id',
+    'patch panel port capacity', 'patch panel ports used', 'patch panel ports available',
+    'patch panel connector type', 'data center description', '-', 'patch panel connector'
+])
+
+# Providers whose sheets repeat "Market" / "Circuit ID" header rows
+HEADER_ROW_PROVIDERS = ('Uniti', 'Windstream')
+
+# Provider names that appear as values in header rows
+HEADER_PROVIDER_VALUES = ('accelecom', 'arelion', 'cogent')
+
+
+def normalize_circuit_id(value):
+    """Return a Circuit ID lowercased with everything but letters and digits removed"""
+    return ''.join(c for c in str(value).lower() if c.isalnum())
+
+
+def listed_fields(sheet, fields):
+    """Return the row as shown in the circuit list
+
+    Rows with a Provider outside VALID_PROVIDERS are listed under the sheet name.
+    """
+    provider = fields.get('Provider')
+    if provider and provider not in VALID_PROVIDERS:
+        return dict(fields, Provider=sheet)
+    return fields
+
+
+def classify_circuit(sheet, fields):
+    """Classify a row of the circuit database
+
+    Args:
+        sheet (str): Sheet the row came from
+        fields (dict): The row, keyed by field name
+
+    Returns:
+        str: ROW_CLEAN, ROW_SUSPECT or ROW_JUNK
+    """
+    # Rows without a circuit ID or description
+    if not fields.get('Circuit ID') and not fields.get('Description'):
+        return ROW_JUNK
+
+    if _is_header_row(fields, ('Market', 'Circuit ID')):
+        return ROW_JUNK
+
+    # Showing all circuits applies the same checks to the row as listed, and
+    # also drops rows with a header in Description or any field holding its own name
+    listed = listed_fields(sheet, fields)
+    if _is_header_row(listed, ('Market', 'Circuit ID', 'Description')):
+        return ROW_SUSPECT
+    for field in KEY_FIELDS:
+        field_value = str(listed.get(field, '')).lower()
+        if field_value and field_value == field.lower():
+            return ROW_SUSPECT
+
+    return ROW_CLEAN
+
+
+def _is_header_row(circuit, forbidden_fields):
+    """Check for header-like rows
+
+    Args:
+        circuit (dict): The row
+        forbidden_fields (tuple): Fields that must not hold a FORBIDDEN_VALUES entry
+
+    Returns:
+        bool: True if the row is a header, spacer or label rather than a circuit
+    """
+    for field in forbidden_fields:
+        value = circuit.get(field)
+        if value and isinstance(value, str) and value.lower() in FORBIDDEN_VALUES:
+            return True
+
+    # Rows where circuit_id = provider = "Cologix - Jacksonville" without a description
+    if (circuit.get('Circuit ID') == 'Cologix - Jacksonville' and
+            circuit.get('Provider') == 'Cologix - Jacksonville' and
+            circuit.get('Status') == 'ACTIVE' and
+            (not circuit.get('Description') or circuit.get('Description') == '-')):
+        return True
+
+    # Header rows that made it into the data
+    if circuit.get('Market') == 'Market' and circuit.get('Circuit ID') == 'Circuit ID':
+        return True
+    if circuit.get('Provider') in HEADER_ROW_PROVIDERS and (
+            circuit.get('Circuit ID') == 'Circuit ID' or circuit.get('Market') == 'Market'):
+        return True
+
+    # Rows where any field is a header name and every populated key field holds
+    # only field names or provider names
+    header_field_count = 0
+    total_fields_with_data = 0
+    for field in KEY_FIELDS:
+        field_value = str(circuit.get(field, '')).lower()
+        if field_value:
+            total_fields_with_data += 1
+            if field_value == field.lower() or field_value in HEADER_PROVIDER_VALUES:
+                header_field_count += 1
+    return header_field_count > 0 and header_field_count == total_fields_with_data
@@ -0,0 +1,392 @@
+"""
+Columnar snapshot of the circuit list, shared by the workers through mmap.
+
+The circuit list only needs the key fields of the listable circuits. Instead
+of each worker holding those as Python objects, one process writes them as
+NumPy columns to a snapshot file whenever the circuit table changes and every
+worker maps the file read-only. The pages of the file are shared through the
+page cache, so a worker's memory does not grow with the number of circuits,
+and a new worker opens the snapshot without reading or parsing the table.
+
+File layout (every array aligned to 8 bytes):
+
+    MAGIC | header offset (u64) | header length (u64) | arrays ... | header
+
+The header is JSON: the journal state and database the snapshot was built
+from, the interned Market / Provider / Status dictionaries, and the offset,
+NumPy dtype and length of each array. Circuits are numbered in table order
+and every array is indexed by that number:
+
+- pk, row_class (0 clean, 1 suspect) and the market / provider / status codes
+- display_order: the circuit numbers sorted by Provider, then Circuit ID,
+  then table order
+- display columns: the other key fields as listed, as offsets into a UTF-8
+  blob with a null flag per row
+- search columns: the other key fields lowercased, and the normalized Circuit
+  ID, as fixed-width UTF-8 byte strings that NumPy searches in one pass. The
+  width is capped at SEARCH_WIDTH bytes so one long value cannot blow up the
+  whole column; longer values are truncated, and the numbers of those rows
+  are listed so searches check them in full
+
+Filters and searches each produce a boolean mask over the circuits; the masks
+are combined with & and the matches are gathered in display order at once.
+"""
+
+import datetime
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from utils.circuit_rows import ROW_CLEAN, KEY_FIELDS, normalize_circuit_id
+
+MAGIC = b'CIRCSNP3'
+PREFIX = struct.Struct('<QQ')
+ALIGN = 8
+
+# Widest value, in UTF-8 bytes, a search column holds in full
+SEARCH_WIDTH = 128
+
+# Search fields of the circuit search form that match a single key field
+SEARCH_FIELDS = {'market': 'Market', 'provider': 'Provider', 'status': 'Status'}
+
+# Key fields stored as interned codes, and the column each is stored in
+CODED_FIELDS = {'Market': 'market', 'Provider': 'provider', 'Status': 'status'}
+
+# Key fields stored as strings, and the column each is stored in
+STRING_FIELDS = {'Circuit ID': 'circuit_id', 'Description': 'description', 'Parent CID': 'parent_cid',
+                 'Access CID': 'access_cid', 'Access Provider': 'access_provider'}
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file cannot be used"""
+    pass
+
+
+def build_snapshot(circuits, journal, source):
+    """Encode the listable circuits as a snapshot
+
+    Args:
+        circuits (list): (pk, row_class, listed) tuples in table order, where
+            listed holds the key fields as shown in the circuit list
+        journal (tuple): State of the change journal the circuits match
+        source (str): Identifies the database the circuits were read from
+
+    Returns:
+        bytes: The snapshot file contents
+    """
+    dictionaries = {column: [] for column in CODED_FIELDS.values()}
+    interned = {column: {} for column in CODED_FIELDS.values()}
+    codes = {column: [] for column in CODED_FIELDS.values()}
+    strings = {column: [] for column in STRING_FIELDS.values()}
+    pks = []
+    row_classes = []
+    sort_keys = []
+
+    for pk, row_class, listed in circuits:
+        pks.append(pk)
+        row_classes.append(0 if row_class == ROW_CLEAN else 1)
+        for field, column in CODED_FIELDS.items():
+            value = listed.get(field)
+            code = interned[column].get(value)
+            if code is None:
+                code = interned[column][value] = len(dictionaries[column])
+                dictionaries[column].append(value)
+            codes[column].append(code)
+        for field, column in STRING_FIELDS.items():
+            strings[column].append(listed.get(field))
+        sort_keys.append((str(listed.get('Provider', '')), str(listed.get('Circuit ID', ''))))
+
+    writer = _SnapshotWriter()
+    writer.add('pk', np.array(pks, dtype='<i8'))
+    writer.add('row_class', np.array(row_classes, dtype='u1'))
+    for column, column_codes in codes.items():
+        writer.add(column, np.array(column_codes, dtype='<u4'))
+    writer.add('display_order', np.array(sorted(range(len(circuits)), key=sort_keys.__getitem__), dtype='<u4'))
+    for column, values in strings.items():
+        writer.add_strings(column, values)
+        writer.add_search(f'search.{column}', [_search_text(column, value) for value in values])
+    writer.add_search('search.circuit_id_norm', [_search_text('circuit_id_norm', value)
+                                                 for value in strings['circuit_id']])
+
+    return writer.finish({
+        'journal': list(journal),
+        'source': source,
+        'count': len(circuits),
+        'built_at': datetime.datetime.utcnow().isoformat(),
+        'dictionaries': dictionaries,
+    })
+
+
+def _search_text(column, value):
+    """Return the text a search column holds for a key field value"""
+    # Searches compare lowercased text, with empty values as ''
+    if column == 'circuit_id_norm':
+        return normalize_circuit_id(str(value or '').lower())
+    return str(value).lower() if value else ''
+
+
+def write_snapshot_file(path, data):
+    """Replace the snapshot file atomically, so readers see either version whole"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.circuit-snapshot-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file private to its owner; workers may run as another user
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class CircuitSnapshot:
+    """Read-only view of a snapshot, with the filters and searches of the circuit list
+
+    Selections are arrays of circuit numbers in display order; rows() turns the
+    ones to show into dicts. Nothing is copied out of the snapshot until then.
+
+    Matching is case-insensitive substring matching. Circuit IDs also match
+    when the term is contained in them with punctuation ignored, so
+    '44kgfn1234' matches '44.KGFN.123456..LUMN'. Market, Provider and Status
+    are matched against their few distinct values, and the circuits holding a
+    matching code are then picked out with one comparison over the codes.
+    """
+
+    def __init__(self, buffer):
+        """Map the arrays of a snapshot
+
+        Args:
+            buffer: The snapshot contents, usually an mmap of the snapshot file
+
+        Raises:
+            SnapshotError: If the contents are not a snapshot this process can read
+        """
+        if len(buffer) < len(MAGIC) + PREFIX.size or buffer[:len(MAGIC)] != MAGIC:
+            raise SnapshotError("Not a circuit snapshot")
+        header_offset, header_length = PREFIX.unpack_from(buffer, len(MAGIC))
+        try:
+            header = json.loads(buffer[header_offset:header_offset + header_length])
+        except ValueError as e:
+            raise SnapshotError(f"Unreadable snapshot header: {str(e)}")
+
+        self.journal = tuple(header['journal'])
+        self.source = header['source']
+        self.count = header['count']
+        self.version = None  # Set by the CircuitStore that loaded it, from the journal
+        self.dictionaries = header['dictionaries']
+        self._codes = {column: {value: code for code, value in enumerate(values)}
+                       for column, values in self.dictionaries.items()}
+        # The arrays keep the buffer alive; none of them is copied
+        self._arrays = {name: np.frombuffer(buffer, dtype=dtype, count=length, offset=offset)
+                        for name, (offset, dtype, length) in header['arrays'].items()}
+        self.display_order = self._arrays['display_order']
+
+    @classmethod
+    def open(cls, path):
+        """Map a snapshot file read-only
+
+        Raises:
+            OSError: If the file cannot be opened
+            SnapshotError: If the file is not a readable snapshot
+        """
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError("Empty snapshot file")
+        return cls(buffer)
+
+    def __len__(self):
+        return self.count
+
+    def rows(self, numbers):
+        """Return the key fields of the given circuits as listed, one dict per circuit"""
+        codes = {field: (self._arrays[column], self.dictionaries[column])
+                 for field, column in CODED_FIELDS.items()}
+        rows = []
+        for number in numbers:
+            number = int(number)
+            row = {field: values[column_codes[number]] for field, (column_codes, values) in codes.items()}
+            for field, column in STRING_FIELDS.items():
+                row[field] = self._string(column, number)
+            rows.append(row)
+        return rows
+
+    def select(self, provider=None, status=None, clean_only=False, search_term='', search_field='all'):
+        """Return the numbers of the circuits matching the filters, in display order
+
+        Args:
+            provider (str, optional): Provider as listed; None for any. Defaults to None.
+            status (str, optional): Exact Status; None for any. Defaults to None.
+            clean_only (bool, optional): Leave out suspect rows. Defaults to False.
+            search_term (str, optional): Text to search for; '' for no search. Defaults to ''.
+            search_field (str, optional): 'circuit_id', 'market', 'provider', 'status' or 'all'. Defaults to 'all'.
+
+        Returns:
+            numpy.ndarray: Circuit numbers
+        """
+        mask = None
+        filters = []
+        if clean_only:
+            filters.append(self._arrays['row_class'] == 0)
+        if provider is not None:
+            filters.append(self._code_mask('provider', [provider]))
+        if status is not None:
+            filters.append(self._code_mask('status', [status]))
+        for other in filters:
+            mask = other if mask is None else mask & other
+
+        if search_term:
+            if mask is None:
+                mask = self.search(search_term, search_field)
+            else:
+                # Only the circuits the other filters kept are searched
+                numbers = np.flatnonzero(mask)
+                mask[numbers] = self.search(search_term, search_field, numbers)
+        if mask is None:
+            return self.display_order
+        return self.display_order[mask[self.display_order]]
+
+    def search(self, search_term, search_field='all', numbers=None):
+        """Return a mask of the circuits matching a search term
+
+        Searching a single field for its own name (e.g. "Market") matches
+        nothing, as those are header rows.
+
+        Args:
+            search_term (str): Text to search for
+            search_field (str, optional): 'circuit_id', 'market', 'provider', 'status' or 'all'. Defaults to 'all'.
+            numbers (numpy.ndarray, optional): Circuits to search; None for all. Defaults to None.
+
+        Returns:
+            numpy.ndarray: Boolean mask over numbers, or indexed by circuit number
+        """
+        size = self.count if numbers is None else len(numbers)
+        search = search_term.lower()
+        search_norm = normalize_circuit_id(search)
+
+        if search_field == 'circuit_id':
+            if search == 'circuit id':
+                return np.zeros(size, dtype=bool)
+            if not search_norm:
+                # Only punctuation: plain substring match on the Circuit ID
+                return self._contains('search.circuit_id', search, numbers)
+            # A plain substring of a Circuit ID is also a substring of its normalized form
+            return self._contains('search.circuit_id_norm', search_norm, numbers)
+
+        if search_field in SEARCH_FIELDS:
+            field = SEARCH_FIELDS[search_field]
+            if search == field.lower():
+                return np.zeros(size, dtype=bool)
+            fields = [field]
+        else:
+            # All key fields, except one named like the search term
+            fields = [field for field in KEY_FIELDS if field.lower() != search]
+
+        mask = np.zeros(size, dtype=bool)
+        for field in fields:
+            if field in CODED_FIELDS:
+                column = CODED_FIELDS[field]
+                matching = [value for value in self.dictionaries[column] if value and search in str(value).lower()]
+                mask |= self._code_mask(column, matching, numbers)
+            else:
+                mask |= self._contains(f'search.{STRING_FIELDS[field]}', search, numbers)
+        if search_field not in SEARCH_FIELDS and search_norm:
+            mask |= self._contains('search.circuit_id_norm', search_norm, numbers)
+        return mask
+
+    def _column(self, name, numbers=None):
+        """Return a column, or just its values for the given circuits"""
+        return self._arrays[name] if numbers is None else self._arrays[name][numbers]
+
+    def _code_mask(self, column, values, numbers=None):
+        """Return a mask of the circuits whose column holds one of values"""
+        codes = [self._codes[column][value] for value in values if value in self._codes[column]]
+        if len(codes) == 1:
+            return self._column(column, numbers) == codes[0]
+        return np.isin(self._column(column, numbers), codes)
+
+    def _contains(self, name, text, numbers=None):
+        """Return a mask of the circuits whose search column contains text"""
+        mask = np.strings.find(self._column(name, numbers), text.encode('utf-8')) >= 0
+
+        # Values truncated to SEARCH_WIDTH are checked in full unless they already matched
+        truncated = self._arrays[f'{name}.truncated']
+        if len(truncated):
+            if numbers is None:
+                positions = truncated
+            else:
+                positions = np.flatnonzero(np.isin(numbers, truncated))
+            column = name[len('search.'):]
+            source = 'circuit_id' if column == 'circuit_id_norm' else column
+            for position in positions[~mask[positions]]:
+                number = int(position if numbers is None else numbers[position])
+                mask[position] = text in _search_text(column, self._string(source, number))
+        return mask
+
+    def _string(self, column, number):
+        if self._arrays[f'{column}.null'][number]:
+            return None
+        offsets = self._arrays[f'{column}.offsets']
+        return self._arrays[f'{column}.data'][offsets[number]:offsets[number + 1]].tobytes().decode('utf-8')
+
+
+class _SnapshotWriter:
+    """Lays out the arrays of a snapshot and records where each one is"""
+
+    def __init__(self):
+        self._parts = [MAGIC, bytes(PREFIX.size)]
+        self._size = len(MAGIC) + PREFIX.size
+        self._arrays = {}
+
+    def add(self, name, values):
+        """Append a NumPy array"""
+        padding = -self._size % ALIGN
+        if padding:
+            self._parts.append(bytes(padding))
+            self._size += padding
+        data = values.tobytes()
+        self._arrays[name] = [self._size, values.dtype.str, len(values)]
+        self._parts.append(data)
+        self._size += len(data)
+
+    def add_strings(self, name, values):
+        """Append a display column: UTF-8 blob, offsets into it and null flags"""
+        encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        self.add(f'{name}.offsets', offsets)
+        self.add(f'{name}.data', np.frombuffer(b''.join(encoded), dtype='u1'))
+        self.add(f'{name}.null', np.array([value is None for value in values], dtype=bool))
+
+    def add_search(self, name, values):
+        """Append a search column of fixed-width UTF-8 strings and the rows truncated to fit it
+
+        The column is as wide as the longest value, up to SEARCH_WIDTH bytes.
+        """
+        encoded = [value.encode('utf-8') for value in values]
+        width = min(max((len(value) for value in encoded), default=0), SEARCH_WIDTH)
+        self.add(name, np.array(encoded, dtype=f'S{max(width, 1)}'))
+        self.add(f'{name}.truncated', np.array([number for number, value in enumerate(encoded)
+                                                if len(value) > width], dtype='<u4'))
+
+    def finish(self, header):
+        """Append the header and return the file contents"""
+        header = json.dumps(dict(header, arrays=self._arrays)).encode('utf-8')
+        self._parts[1] = PREFIX.pack(self._size, len(header))
+        self._parts.append(header)
+        return b''.join(self._parts)
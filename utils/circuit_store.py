@@ -0,0 +1,151 @@
+import datetime
+import fcntl
+import hashlib
+import logging
+import threading
+import time
+
+from sqlalchemy import func
+
+from app import app, db
+from models import Circuit, CircuitChange
+from utils.circuit_rows import ROW_JUNK, listed_fields
+from utils.circuit_snapshot import CircuitSnapshot, SnapshotError, build_snapshot, write_snapshot_file
+
+logger = logging.getLogger(__name__)
+
+# Seconds between prunings of the journal by each process
+JOURNAL_COMPACT_INTERVAL = 3600
+
+
+class CircuitStore:
+    """Keeps this process's view of the circuit list current
+
+    The circuit list is served from a CircuitSnapshot mapped from the file at
+    CIRCUIT_SNAPSHOT_PATH, shared by every worker. Every change to the table is
+    recorded in the circuit_change journal (see record_change), and each
+    snapshot carries the journal state it was built at. Each access compares
+    that with the journal's current bounds - one aggregate query on a small
+    table. When they differ, the snapshot file is opened again, and if no
+    worker has rebuilt it for the current state yet, this one rebuilds it from
+    the table while holding a lock on the file, so each change is built once.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.RLock()
+        self._last_compaction = 0
+
+    def current(self):
+        """Return the up-to-date CircuitSnapshot; must be called in an app context"""
+        journal = self._journal_state()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.journal == journal:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.journal == journal:
+                return snapshot
+
+            snapshot = self._open_snapshot(journal)
+            if snapshot is None:
+                snapshot = self._build_snapshot(journal)
+            # The newest journal entry changes only when the table does, and is
+            # the same in every worker, so pages loaded from different workers agree
+            snapshot.version = journal[0] or 0
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        """Drop the mapped snapshot so the next access opens the file again"""
+        with self._lock:
+            self._snapshot = None
+
+    def record_change(self, action, circuit_pk=None, user_id=None):
+        """Add a journal entry for a change to the current transaction; the caller commits
+
+        Args:
+            action (str): 'update', 'delete', or 'reload' when every circuit may have changed
+            circuit_pk (int, optional): circuit.id of the changed row. Defaults to None.
+            user_id (int, optional): User making the change. Defaults to None.
+        """
+        db.session.add(CircuitChange(circuit_pk=circuit_pk, action=action, user_id=user_id))
+
+        now = time.time()
+        if now - self._last_compaction >= JOURNAL_COMPACT_INTERVAL:
+            self._last_compaction = now
+            self._compact()
+
+    def _journal_state(self):
+        """Return (newest id, entry count, oldest id) of the journal"""
+        newest, count, oldest = db.session.query(
+            func.max(CircuitChange.id), func.count(CircuitChange.id), func.min(CircuitChange.id)).one()
+        return newest, count, oldest
+
+    def _source(self):
+        """Identify the database, so a snapshot path shared by two databases is not mixed up"""
+        return hashlib.sha1(app.config['SQLALCHEMY_DATABASE_URI'].encode('utf-8')).hexdigest()
+
+    def _open_snapshot(self, journal):
+        """Return the snapshot file's contents if they match the journal state, otherwise None"""
+        try:
+            snapshot = CircuitSnapshot.open(app.config['CIRCUIT_SNAPSHOT_PATH'])
+        except FileNotFoundError:
+            return None
+        except (OSError, SnapshotError) as e:
+            logger.warning(f"Ignoring circuit snapshot {app.config['CIRCUIT_SNAPSHOT_PATH']}: {str(e)}")
+            return None
+        if snapshot.journal != journal or snapshot.source != self._source():
+            return None
+        return snapshot
+
+    def _build_snapshot(self, journal):
+        """Write a snapshot of the table for the journal state and return it mapped"""
+        path = app.config['CIRCUIT_SNAPSHOT_PATH']
+        try:
+            with open(f'{path}.lock', 'a') as lock_file:
+                # Workers that see the same change wait here for the first one to build it
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    snapshot = self._open_snapshot(journal)
+                    if snapshot is not None:
+                        return snapshot
+                    start = time.time()
+                    circuits = self._load_circuits()
+                    write_snapshot_file(path, build_snapshot(circuits, journal, self._source()))
+                    logger.info(f"Wrote circuit snapshot of {len(circuits)} circuits to {path} "
+                                f"in {time.time() - start:.2f}s")
+                    return CircuitSnapshot.open(path)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError as e:
+            # Still serve the list when the snapshot cannot be shared, from this process's memory
+            logger.error(f"Could not write circuit snapshot {path}: {str(e)}")
+            return CircuitSnapshot(build_snapshot(self._load_circuits(), journal, self._source()))
+
+    def _load_circuits(self):
+        """Return (pk, row_class, listed key fields) of the listable circuits in table order"""
+        # Junk rows are never listed, and the list only needs the key field columns
+        columns = [getattr(Circuit, column) for column in Circuit.CORE_FIELDS.values()]
+        query = (db.session.query(Circuit.id, Circuit.sheet, Circuit.row_class, *columns)
+                 .filter(Circuit.row_class.is_distinct_from(ROW_JUNK)).order_by(Circuit.id))
+        circuits = []
+        for pk, sheet, row_class, *values in query:
+            fields = {field: value for field, value in zip(Circuit.CORE_FIELDS, values) if value is not None}
+            circuits.append((pk, row_class, listed_fields(sheet, fields)))
+        return circuits
+
+    def _compact(self):
+        """Prune journal entries older than the retention, keeping the newest one"""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=app.config['CIRCUIT_JOURNAL_RETENTION'])
+        newest = db.session.query(func.max(CircuitChange.id)).scalar()
+        if newest is None:
+            return
+        pruned = CircuitChange.query.filter(CircuitChange.created_at < cutoff,
+                                            CircuitChange.id < newest).delete(synchronize_session=False)
+        if pruned:
+            logger.info(f"Pruned {pruned} circuit journal entries")
+
+
+circuit_store = CircuitStore()
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceBusy(RuntimeError):
+    """Raised when no session slot on a device became free within the queue timeout"""
+
+
+class _DeviceSlots:
+    """Sessions in use on one device and the callers waiting for one, oldest first"""
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+
+class DeviceLimiter:
+    """Limits how many SSH sessions this process opens to each device at once
+
+    Callers beyond the limit wait in first-come, first-served order; a freed
+    slot is handed directly to the oldest waiter so a steady stream of new
+    callers cannot starve it. Waiting is bounded by a timeout, after which
+    DeviceBusy is raised.
+
+    Devices are identified by hostname and port, so several Equipment rows
+    pointing at the same device share its limit. Limits apply per process.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, limit, timeout):
+        """Wait for a session slot on a device
+
+        Args:
+            key (tuple): (hostname, port) of the device
+            limit (int): Sessions allowed at once; 0 or None means unlimited
+            timeout (float): Seconds to wait for a slot
+
+        Returns:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            DeviceBusy: If no slot became free within the timeout
+        """
+        if not limit or limit <= 0:
+            return 0.0
+
+        start = time.time()
+        with self._lock:
+            slots = self._devices.setdefault(key, _DeviceSlots())
+            if slots.active < limit and not slots.waiters:
+                slots.active += 1
+                return 0.0
+            waiter = threading.Event()
+            slots.waiters.append(waiter)
+            position = len(slots.waiters)
+
+        logger.info(f"Waiting for a session slot on {key[0]}:{key[1]} "
+                    f"({slots.active} in use, limit {limit}, position {position} in queue)")
+        waiter.wait(timeout)
+
+        with self._lock:
+            # release() sets the event under the lock, so this check cannot race with it
+            if waiter.is_set():
+                return time.time() - start
+            slots.waiters.remove(waiter)
+            self._discard_if_unused(key, slots)
+
+        raise DeviceBusy(f"Device {key[0]} is busy: no session became free after waiting {int(timeout)}s "
+                         f"(limit {limit} at once)")
+
+    def release(self, key, limit):
+        """Give back a slot taken with acquire()"""
+        if not limit or limit <= 0:
+            return
+
+        with self._lock:
+            slots = self._devices.get(key)
+            if slots is None:
+                return
+            slots.active -= 1
+            while slots.waiters and slots.active < limit:
+                slots.active += 1
+                slots.waiters.popleft().set()
+            self._discard_if_unused(key, slots)
+
+    def stats(self):
+        """Return the sessions in use and callers waiting per device"""
+        with self._lock:
+            return {f"{host}:{port}": {'active': slots.active, 'waiting': len(slots.waiters)}
+                    for (host, port), slots in self._devices.items()}
+
+    def _discard_if_unused(self, key, slots):
+        """Forget a device nobody is using or waiting for; the caller holds the lock"""
+        if slots.active <= 0 and not slots.waiters:
+            self._devices.pop(key, None)
+
+
+device_limiter = DeviceLimiter()
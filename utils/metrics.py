@@ -0,0 +1,148 @@
+"""
+Prometheus metrics for the application.
+
+Metrics are defined here and updated from the request hooks, the SSH client
+and pool, the alert runner and the result cache. When PROMETHEUS_MULTIPROC_DIR
+is set (it must be set before the app starts, and the directory emptied on each
+start), every gunicorn worker writes its values to files in that directory and
+/metrics reports the sum across workers. See gunicorn_workers.conf.py for the hook that
+cleans up after exited workers.
+
+If prometheus_client is not installed the helpers here do nothing and /metrics
+reports that metrics are unavailable. /metrics is refused unless METRICS_TOKEN
+is set, and then requires it as a bearer token.
+"""
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                                   CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+    METRICS_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional at runtime
+    METRICS_AVAILABLE = False
+    logger.warning("prometheus_client is not installed; /metrics is disabled")
+
+MULTIPROCESS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Request latencies range from static files to multi-device alert checks
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SSH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client is missing"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if not METRICS_AVAILABLE:
+        return _NoopMetric()
+    cls = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}[kind]
+    return cls(name, documentation, labelnames, **kwargs)
+
+
+http_request_duration = _metric('histogram', 'acorn_http_request_duration_seconds',
+                                'Time to handle HTTP requests', ('method', 'route', 'status'),
+                                buckets=REQUEST_BUCKETS)
+ssh_connect_duration = _metric('histogram', 'acorn_ssh_connect_duration_seconds',
+                               'Time to open an authenticated SSH session', ('equipment',),
+                               buckets=SSH_BUCKETS)
+ssh_command_duration = _metric('histogram', 'acorn_ssh_command_duration_seconds',
+                               'Time to run a command and read its output', ('equipment',),
+                               buckets=SSH_BUCKETS)
+ssh_connect_failures = _metric('counter', 'acorn_ssh_connect_failures_total',
+                               'SSH sessions that could not be opened', ('equipment',))
+ssh_sessions_active = _metric('gauge', 'acorn_ssh_sessions_active',
+                              'Open SSH sessions, including idle pooled ones', multiprocess_mode='livesum')
+ssh_pool_requests = _metric('counter', 'acorn_ssh_pool_requests_total',
+                            'SSH pool checkouts by whether an idle session was reused', ('result',))
+ssh_pool_evictions = _metric('counter', 'acorn_ssh_pool_evictions_total',
+                             'Pooled SSH sessions closed for being idle, unhealthy or over capacity')
+device_queue_wait = _metric('histogram', 'acorn_device_queue_wait_seconds',
+                            'Time spent waiting for a free session on a device', ('equipment',),
+                            buckets=SSH_BUCKETS)
+result_cache_requests = _metric('counter', 'acorn_result_cache_requests_total',
+                                'Command output cache lookups', ('result',))
+result_cache_evictions = _metric('counter', 'acorn_result_cache_evictions_total',
+                                 'Cached outputs dropped to stay under the memory cap')
+coalesced_commands = _metric('counter', 'acorn_coalesced_commands_total',
+                             'Commands answered by an identical execution already in flight')
+db_queries = _metric('counter', 'acorn_db_queries_total',
+                     'SQL statements executed', ('operation',))
+db_query_duration = _metric('histogram', 'acorn_db_query_duration_seconds',
+                            'Time to execute SQL statements', ('operation',),
+                            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+def init_app(app):
+    """Register request timing hooks, SQL statement counting and the /metrics route"""
+    from flask import Response, g, request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start_time = time.perf_counter()
+
+    @app.after_request
+    def _record_request_duration(response):
+        start = g.pop('metrics_start_time', None)
+        if start is not None:
+            # Label by route template, not the raw path, to keep the label set bounded
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            http_request_duration.labels(request.method, route, str(response.status_code)).observe(
+                time.perf_counter() - start)
+        return response
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _record_query(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        if operation not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+            operation = 'OTHER'
+        db_queries.labels(operation).inc()
+        starts = conn.info.get('metrics_query_start')
+        if starts:
+            db_query_duration.labels(operation).observe(time.perf_counter() - starts.pop())
+
+    @app.route('/metrics')
+    def metrics():
+        """Expose metrics in the Prometheus text format"""
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            return Response("Metrics are disabled; set METRICS_TOKEN to enable them\n", status=403, mimetype='text/plain')
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return Response("Unauthorized\n", status=401, mimetype='text/plain')
+        if not METRICS_AVAILABLE:
+            return Response("prometheus_client is not installed\n", status=503, mimetype='text/plain')
+        if MULTIPROCESS_DIR:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Clean up the live gauge files of an exited gunicorn worker"""
+    if METRICS_AVAILABLE and MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid)
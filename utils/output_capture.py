@@ -0,0 +1,208 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Full outputs spilled to disk are kept here for download, named by a random ID
+SPILL_DIR = os.environ.get('SSH_OUTPUT_SPILL_DIR', os.path.join(tempfile.gettempdir(), 'acorn_output'))
+SPILL_ENABLED = os.environ.get('SSH_OUTPUT_SPILL', 'true').lower() in ('1', 'true', 'yes')
+SPILL_TTL = int(os.environ.get('SSH_OUTPUT_SPILL_TTL', '3600'))
+
+_FILE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+class OutputCapture:
+    """Collects command output in bounded memory
+
+    The first ``head_bytes`` are kept as they arrive and the most recent
+    ``tail_bytes`` are kept in a ring buffer, so memory use does not depend on
+    how much the device sends. Anything in between is dropped from memory; when
+    spilling is enabled the complete output is also written to a temporary file,
+    which is only kept if something was actually dropped.
+    """
+
+    def __init__(self, head_bytes=100000, tail_bytes=100000, spill=False):
+        """Initialize the capture
+
+        Args:
+            head_bytes (int, optional): Bytes kept from the start. Defaults to 100000.
+            tail_bytes (int, optional): Bytes kept from the end. Defaults to 100000.
+            spill (bool, optional): Write the full output to a temp file. Defaults to False.
+        """
+        self.head = bytearray()
+        self.head_bytes = head_bytes
+        self._tail = bytearray(tail_bytes)
+        self._tail_pos = 0
+        self._tail_len = 0
+        self.total_bytes = 0
+        self.file_id = None
+        self._spill_file = None
+        if spill:
+            self._open_spill_file()
+
+    @property
+    def omitted_bytes(self):
+        """Bytes received but not kept in memory"""
+        return self.total_bytes - len(self.head) - self._tail_len
+
+    def write(self, data):
+        """Add a chunk of output"""
+        if not data:
+            return
+        self.total_bytes += len(data)
+
+        if self._spill_file is not None:
+            try:
+                self._spill_file.write(data)
+            except OSError as e:
+                logger.error(f"Could not write full output to {self._spill_file.name}: {str(e)}")
+                self._discard_spill_file()
+
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self._write_tail(data)
+
+    def tail(self):
+        """Return the bytes currently held in the tail ring buffer, oldest first"""
+        if self._tail_len < len(self._tail):
+            return bytes(self._tail[:self._tail_len])
+        return bytes(self._tail[self._tail_pos:] + self._tail[:self._tail_pos])
+
+    def text(self):
+        """Decode the captured output, marking where bytes were left out"""
+        head = self.head.decode('utf-8', errors='replace')
+        tail = self.tail().decode('utf-8', errors='replace')
+        if not self.omitted_bytes:
+            return head + tail
+        return (head +
+                f"\n\n[... {self.omitted_bytes} bytes omitted; showing the first {len(self.head)} "
+                f"and last {self._tail_len} bytes of {self.total_bytes} ...]\n\n" +
+                tail)
+
+    def close(self):
+        """Finish the spill file, keeping it only if the in-memory copy is incomplete
+
+        Returns:
+            str: ID of the spilled file for get_spill_path(), or None
+        """
+        if self._spill_file is None:
+            return None
+        try:
+            self._spill_file.close()
+        except OSError as e:
+            logger.error(f"Could not finish full output file {self._spill_file.name}: {str(e)}")
+            self._discard_spill_file()
+            return None
+        if not self.omitted_bytes:
+            self._discard_spill_file()
+            return None
+        self._spill_file = None
+        return self.file_id
+
+    def _write_tail(self, data):
+        """Append to the ring buffer, overwriting the oldest bytes"""
+        size = len(self._tail)
+        if not size:
+            return
+        if len(data) >= size:
+            self._tail[:] = data[-size:]
+            self._tail_pos = 0
+            self._tail_len = size
+            return
+        first = min(len(data), size - self._tail_pos)
+        self._tail[self._tail_pos:self._tail_pos + first] = data[:first]
+        rest = len(data) - first
+        if rest:
+            self._tail[:rest] = data[first:]
+        self._tail_pos = (self._tail_pos + len(data)) % size
+        self._tail_len = min(size, self._tail_len + len(data))
+
+    def _open_spill_file(self):
+        """Create the temp file that receives the full output"""
+        try:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            purge_spill_files()
+            self.file_id = uuid.uuid4().hex
+            self._spill_file = open(os.path.join(SPILL_DIR, f"{self.file_id}.txt"), 'wb')
+        except OSError as e:
+            logger.error(f"Could not create full output file in {SPILL_DIR}: {str(e)}")
+            self._spill_file = None
+            self.file_id = None
+
+    def _discard_spill_file(self):
+        """Close and delete the spill file"""
+        path = self._spill_file.name
+        try:
+            self._spill_file.close()
+        except OSError:
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self._spill_file = None
+        self.file_id = None
+
+
+def get_spill_path(file_id):
+    """Return the path of a spilled output file, or None if it does not exist"""
+    if not file_id or not _FILE_ID_PATTERN.match(file_id):
+        return None
+    path = os.path.join(SPILL_DIR, f"{file_id}.txt")
+    return path if os.path.isfile(path) else None
+
+
+def set_spill_owner(file_id, owner):
+    """Record who may download a spilled output file
+
+    Args:
+        file_id (str): ID returned by OutputCapture.close()
+        owner (str): Opaque identity of the device and credentials the output was read with
+    """
+    try:
+        with open(os.path.join(SPILL_DIR, f"{file_id}.owner"), 'w') as f:
+            f.write(owner)
+    except OSError as e:
+        logger.error(f"Could not record the owner of full output file {file_id}: {str(e)}")
+
+
+def get_spill_owner(file_id):
+    """Return the owner recorded for a spilled output file, or None if there is none"""
+    if not file_id or not _FILE_ID_PATTERN.match(file_id):
+        return None
+    try:
+        with open(os.path.join(SPILL_DIR, f"{file_id}.owner")) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def purge_spill_files(max_age=None):
+    """Delete spilled output files, and their owner records, older than SSH_OUTPUT_SPILL_TTL, at most once a minute"""
+    global _last_purge
+    max_age = SPILL_TTL if max_age is None else max_age
+    now = time.time()
+    with _purge_lock:
+        if now - _last_purge < 60:
+            return
+        _last_purge = now
+    try:
+        for name in os.listdir(SPILL_DIR):
+            path = os.path.join(SPILL_DIR, name)
+            try:
+                if name.endswith(('.txt', '.owner')) and now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+    except OSError as e:
+        logger.error(f"Could not purge full output files in {SPILL_DIR}: {str(e)}")
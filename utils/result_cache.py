@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Commands that only read device state; their output is cached by default
+READ_ONLY_COMMANDS = ('show', 'display')
+
+
+class CommandResultCache:
+    """Short-lived cache of command output per device, command and credentials
+
+    Entries are keyed by (equipment_id, credential identity, command), so output
+    is only ever served to checks that would have connected with the same
+    credentials and therefore have the same privileges on the device. Only
+    successful output is stored. Each command gets a TTL from the longest
+    matching prefix in ``command_ttls``; otherwise read-only commands (starting
+    with one of ``READ_ONLY_COMMANDS``) get ``read_only_ttl`` and everything else
+    ``default_ttl``. A TTL of 0 means the command is never cached, so by default
+    only read-only commands are. Least recently used entries are evicted once
+    the stored output exceeds ``max_bytes``.
+
+    The cache lives in process memory, so each worker process has its own.
+    """
+
+    def __init__(self, default_ttl=0, read_only_ttl=30, command_ttls=None, max_bytes=32 * 1024 * 1024):
+        """Initialize the cache
+
+        Args:
+            default_ttl (float, optional): Seconds output is reused for other commands without a rule. Defaults to 0.
+            read_only_ttl (float, optional): Seconds output of read-only commands is reused. Defaults to 30.
+            command_ttls (dict, optional): Command prefix -> TTL in seconds. Defaults to None.
+            max_bytes (int, optional): Upper bound on the size of stored output. Defaults to 32MB.
+        """
+        self.default_ttl = default_ttl
+        self.read_only_ttl = read_only_ttl
+        self.command_ttls = {prefix.strip().lower(): float(ttl) for prefix, ttl in (command_ttls or {}).items()}
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (output, stored_at, expires_at, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def parse_command_ttls(value):
+        """Parse the JSON object of command prefix -> TTL used for configuration"""
+        if not value:
+            return {}
+        try:
+            rules = json.loads(value)
+            if not isinstance(rules, dict):
+                raise ValueError("expected a JSON object")
+            return {str(prefix): float(ttl) for prefix, ttl in rules.items()}
+        except (ValueError, TypeError) as e:
+            logger.error(f"Ignoring invalid command cache TTLs {value!r}: {str(e)}")
+            return {}
+
+    def ttl_for(self, command):
+        """Return the TTL in seconds for a command"""
+        normalized = ' '.join(command.lower().split())
+        best = None
+        for prefix, ttl in self.command_ttls.items():
+            if normalized.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        if best is not None:
+            return self.command_ttls[best]
+        if normalized.split(' ', 1)[0] in READ_ONLY_COMMANDS:
+            return self.read_only_ttl
+        return self.default_ttl
+
+    def get(self, scope, command):
+        """Look up fresh output for a command
+
+        Args:
+            scope (tuple): Equipment and credential identity of the caller
+            command (str): The command that would be run
+
+        Returns:
+            tuple: (output, age_in_seconds), or None if nothing fresh is cached
+        """
+        key = scope + (command,)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                metrics.result_cache_requests.labels('miss').inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.result_cache_requests.labels('hit').inc()
+            return entry[0], now - entry[1]
+
+    def put(self, scope, command, output):
+        """Store the successful output of a command if its TTL allows it"""
+        ttl = self.ttl_for(command)
+        size = len(output) if isinstance(output, str) else 0
+        if ttl <= 0 or not size or size > self.max_bytes:
+            return
+
+        key = scope + (command,)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (output, now, now + ttl, size)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+                metrics.result_cache_evictions.inc()
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return cache counters for diagnostics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _remove(self, key):
+        """Remove an entry; the caller holds the lock"""
+        entry = self._entries.pop(key)
+        self._size -= entry[3]
+
+
+result_cache = CommandResultCache(
+    read_only_ttl=float(os.environ.get('ALERT_CACHE_TTL', '30')),
+    command_ttls=CommandResultCache.parse_command_ttls(os.environ.get('ALERT_CACHE_COMMAND_TTLS', '')),
+    max_bytes=int(os.environ.get('ALERT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+)
@@ -0,0 +1,81 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An execution in flight and the callers waiting for it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses identical concurrent calls into one execution
+
+    The first caller for a key runs the function; callers arriving with the same
+    key while it is still running wait for it and receive the same value (or
+    exception) instead of running it again. Nothing is cached: once the call
+    finishes, the next caller for that key starts a new execution.
+
+    Calls are only shared within one process.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, before_wait=None):
+        """Run fn() once for all concurrent callers using the same key
+
+        Args:
+            key: Hashable identity of the call
+            fn (callable): The function to run if no identical call is in flight
+            before_wait (callable, optional): Called before waiting for another
+                caller's execution, to give up anything that execution may need
+
+        Returns:
+            tuple: (value, shared, waiters) where shared is True for callers that
+                attached to another caller's execution, and waiters is the number
+                of callers that attached to it (only final for the caller that ran it)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            if before_wait is not None:
+                before_wait()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True, call.waiters
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Stop accepting new waiters before waking the current ones
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+            if call.waiters:
+                logger.info(f"Shared one execution with {call.waiters} identical concurrent calls")
+
+        return call.value, False, call.waiters
+
+    def in_flight(self):
+        """Return the number of executions currently running"""
+        with self._lock:
+            return len(self._calls)
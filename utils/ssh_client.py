@@ -4,7 +4,16 @@ import sys
 import os
 import socket
 import time
+import random
+import selectors
+import threading
+import hashlib
+import json
 import traceback
+from collections import OrderedDict
+
+from utils import metrics
+from utils.output_capture import OutputCapture, SPILL_ENABLED
 
 # Configure enhanced logging
 logging.basicConfig(
@@ -34,14 +43,95 @@ paramiko_handler = logging.FileHandler('paramiko_debug.log', mode='a')
 paramiko_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 paramiko_logger.addHandler(paramiko_handler)
 
+# Per-phase connection and command timings are logged here as one JSON object per
+# line, to their own file (standard error if SSH_TIMING_LOG is empty) and not the
+# application logs, so the file can be parsed as JSON lines
+timing_logger = logging.getLogger('ssh_timing')
+timing_logger.setLevel(logging.INFO)
+timing_logger.propagate = False
+SSH_TIMING_LOG = os.environ.get('SSH_TIMING_LOG', 'ssh_timing.log')
+timing_handler = logging.FileHandler(SSH_TIMING_LOG, mode='a') if SSH_TIMING_LOG else logging.StreamHandler(sys.stderr)
+timing_handler.setFormatter(logging.Formatter('%(message)s'))
+timing_logger.addHandler(timing_handler)
+
+# Reading stops once a single command has produced this much output
+MAX_OUTPUT_BYTES = int(os.environ.get('SSH_MAX_OUTPUT_BYTES', str(64 * 1024 * 1024)))
+
+# Only the start and end of a command's output are kept in memory; the full
+# output can be spilled to a temp file (see utils.output_capture)
+OUTPUT_HEAD_BYTES = int(os.environ.get('SSH_OUTPUT_HEAD_BYTES', '90000'))
+OUTPUT_TAIL_BYTES = int(os.environ.get('SSH_OUTPUT_TAIL_BYTES', '90000'))
+STDERR_KEEP_BYTES = 4096
+
+# Longest wait on a channel between checks. paramiko signals the channel's
+# file descriptor for output, EOF and close but not for the exit status, so a
+# command that exits before its channel is closed is noticed within this.
+CHANNEL_WAIT_INTERVAL = 0.05
+
+class ConnectPolicy:
+    """Timing policy for establishing an SSH connection
+    
+    A connection gets one overall deadline. Within it, each attempt splits its time
+    into per-phase budgets (TCP connect, banner/key exchange, authentication), and
+    failed attempts are retried with jittered exponential backoff. Errors that a
+    retry cannot fix, such as rejected credentials, fail immediately.
+    
+    Usage:
+        client.connect(policy=ConnectPolicy(deadline=20))
+    """
+    
+    def __init__(self, deadline=45, tcp_timeout=10, banner_timeout=15, auth_timeout=20,
+                 max_attempts=3, backoff_base=1.0, backoff_max=8.0, jitter=0.5):
+        """Initialize the policy
+        
+        Args:
+            deadline (float, optional): Overall seconds allowed for connect(). Defaults to 45.
+            tcp_timeout (float, optional): Seconds for the TCP connect. Defaults to 10.
+            banner_timeout (float, optional): Seconds for the SSH banner and key exchange. Defaults to 15.
+            auth_timeout (float, optional): Seconds for each authentication method. Defaults to 20.
+            max_attempts (int, optional): Maximum connection attempts. Defaults to 3.
+            backoff_base (float, optional): Delay before the first retry in seconds. Defaults to 1.0.
+            backoff_max (float, optional): Upper bound on the retry delay in seconds. Defaults to 8.0.
+            jitter (float, optional): Fraction of each delay that is randomized. Defaults to 0.5.
+        """
+        self.deadline = deadline
+        self.tcp_timeout = tcp_timeout
+        self.banner_timeout = banner_timeout
+        self.auth_timeout = auth_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+    
+    def backoff(self, attempt):
+        """Return the delay in seconds before retrying after the given attempt"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        # Randomize part of the delay so concurrent callers do not retry in lockstep
+        return delay * (1 - self.jitter * random.random())
+    
+    @staticmethod
+    def is_retryable(error):
+        """Check whether another connection attempt could succeed after this error"""
+        if isinstance(error, (paramiko.AuthenticationException, socket.gaierror)):
+            return False
+        if isinstance(error, (FileNotFoundError, IsADirectoryError, PermissionError)):
+            # Missing or unreadable key file
+            return False
+        if isinstance(error, paramiko.SSHException) and "private key file" in str(error):
+            return False
+        return True
+    
+    def __repr__(self):
+        return f"<ConnectPolicy deadline={self.deadline}s attempts={self.max_attempts}>"
+
 class SSHClient:
     """Improved utility class for SSH connections to network equipment
     
     Features:
     1. Universal keyboard-interactive authentication support for all network devices
     2. Smart authentication fallback that tries keyboard-interactive when regular auth fails
-    3. Retry mechanism for connection failures (5 attempts with 5 second delay)
-    4. Socket pre-checking to avoid timeouts
+    3. Deadline-based retries with jittered exponential backoff (see ConnectPolicy)
+    4. Fail-fast on errors that retrying cannot fix, such as rejected credentials
     5. Improved error handling and logging
     6. Support for key-based authentication
     7. Better timeout handling for commands (60 second timeouts)
@@ -53,7 +143,7 @@ class SSHClient:
     This helps connect to many OLT devices and network equipment without special handling.
     """
     
-    def __init__(self, hostname, port=22, username=None, password=None, key_filename=None):
+    def __init__(self, hostname, port=22, username=None, password=None, key_filename=None, connect_policy=None):
         """Initialize the SSH client with connection parameters
         
         Args:
@@ -62,6 +152,7 @@ class SSHClient:
             username (str, optional): SSH username. Defaults to None.
             password (str, optional): SSH password. Defaults to None.
             key_filename (str, optional): Path to private key file. Defaults to None.
+            connect_policy (ConnectPolicy, optional): Connection timing policy. Defaults to ConnectPolicy().
         """
         self.hostname = hostname
         self.port = port
@@ -70,233 +161,156 @@ class SSHClient:
         self.key_filename = key_filename
         self.client = None
         self.connected = False
-        self.reconnect_attempts = 5  # increased from 3 to 5 attempts
-        self.reconnect_delay = 5  # seconds (increased from 2 to 5 seconds)
+        self.connect_policy = connect_policy or ConnectPolicy()
+        self.auth_method = None  # Authentication method that succeeded on the current connection
+        self.last_command_stats = None  # Exit status, size and timing of the last command
+        self.connect_timings = None  # Seconds spent in each phase of the current connection
+        self._attempt_timings = {}
+        self._session_counted = False  # Whether this connection is included in the active sessions metric
+        self.commands_run = 0  # Commands executed over the current connection
+        self.last_used = time.time()
     
-    def check_socket(self):
-        """Check if the SSH port is open before attempting to connect"""
-        max_attempts = 3  # Try up to 3 times
-        retry_delay = 2   # 2 seconds between attempts
+    def connect(self, policy=None):
+        """Establish an SSH connection to the equipment within the policy's deadline
         
-        for attempt in range(1, max_attempts + 1):
-            try:
-                logger.debug(f"Testing socket connection to {self.hostname}:{self.port} (attempt {attempt}/{max_attempts})")
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(20)  # increased from 10 to 20 seconds for real network equipment
-                result = sock.connect_ex((self.hostname, self.port))
-                sock.close()
-                
-                if result == 0:
-                    logger.debug(f"Socket connection to {self.hostname}:{self.port} successful")
-                    return True
-                else:
-                    logger.warning(f"Socket connection to {self.hostname}:{self.port} failed with code {result} (attempt {attempt}/{max_attempts})")
-                    
-                    # If not the last attempt, wait and retry
-                    if attempt < max_attempts:
-                        logger.debug(f"Retrying socket connection in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                    else:
-                        logger.error(f"Socket connection to {self.hostname}:{self.port} failed after {max_attempts} attempts")
-                        return False
-            except Exception as e:
-                logger.error(f"Socket test error on attempt {attempt}: {str(e)}")
-                
-                # If not the last attempt, wait and retry
-                if attempt < max_attempts:
-                    logger.debug(f"Retrying socket connection in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    return False
+        Args:
+            policy (ConnectPolicy, optional): Timing policy for this call. Defaults to
+                the policy the client was created with.
         
-        return False  # Should never reach here, but added as a safeguard
-    
-    def connect(self):
-        """Establish an SSH connection to the equipment with retry mechanism"""
+        Raises:
+            ConnectionError: If the device could not be reached or authentication failed
+        """
         if self.connected and self.client:
             logger.debug("Already connected")
             return True
-            
-        # Check socket connection first
-        if not self.check_socket():
-            raise ConnectionError(f"Cannot connect to {self.hostname} on port {self.port} - port is closed or unreachable")
         
-        # Try to connect with retries
-        for attempt in range(1, self.reconnect_attempts + 1):
+        policy = policy or self.connect_policy
+        start_time = time.monotonic()
+        deadline_at = start_time + policy.deadline
+        last_error = None
+        attempt = 0
+        
+        while attempt < policy.max_attempts:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            attempt += 1
+            
             try:
-                logger.debug(f"Connection attempt {attempt} to {self.hostname}:{self.port} as {self.username}")
-                
-                # Create a new client for each attempt
-                self.client = paramiko.SSHClient()
-                self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                
-                # Use verbose transport logging for debug purposes
-                # Only enable on debug builds
-                if logger.level == logging.DEBUG:
-                    paramiko_logger = logging.getLogger("paramiko")
-                    paramiko_logger.setLevel(logging.DEBUG)
-                
-                # Set connection parameters
-                connect_params = {
-                    'hostname': self.hostname,
-                    'port': self.port,
-                    'username': self.username,
-                    'timeout': 60,  # Timeout in seconds for establishing a connection
-                    'banner_timeout': 60,  # Timeout for the SSH banner
-                    'auth_timeout': 60,  # Timeout for authentication
-                }
-                
-                # Handle authentication methods
-                if self.key_filename:
-                    # Use key-based authentication if key file is provided
-                    logger.info(f"Using key-based authentication with key file: {self.key_filename}")
-                    connect_params['key_filename'] = self.key_filename
-                    # Still include password as some keys require passphrase
-                    if self.password:
-                        connect_params['password'] = self.password
-                    
-                    # When using a key file, we don't need to look for other keys
-                    connect_params['allow_agent'] = False
-                    connect_params['look_for_keys'] = False
-                elif self.password:
-                    # Use password authentication if password is provided and no key file
-                    logger.info("Using password authentication")
-                    connect_params['password'] = self.password
-                    connect_params['allow_agent'] = False
-                    connect_params['look_for_keys'] = False
-                    
-                    # Use custom auth_timeout for slow equipment
-                    connect_params['auth_timeout'] = 60
-                    
-                    # Disable certain pubkey algorithms that might not be supported
-                    connect_params['disabled_algorithms'] = dict(pubkeys=["rsa-sha2-256", "rsa-sha2-512"])
-                    
-                    # Set up a custom keyboard-interactive handler for servers that require it
-                    def interactive_handler(title, instructions, fields):
-                        logger.debug(f"Keyboard-interactive auth request: {title}")
-                        if instructions:
-                            logger.debug(f"Instructions: {instructions}")
-                        
-                        responses = []
-                        for field in fields:
-                            prompt, echo = field
-                            logger.debug(f"Prompt: {prompt}, echo: {echo}")
-                            # Always return the password for any prompt
-                            responses.append(self.password)
-                        
-                        return responses
-                    
-                    # Store the handler for use by transport after connection
-                    self._interactive_handler = interactive_handler
-                    
-                    # Try keyboard-interactive authentication first for all network equipment
-                    # Many devices like OLTs, certain switches, and routers prefer this method
-                    if self.username:  # Only try if we have a username
-                        logger.info(f"Trying keyboard-interactive authentication first for {self.hostname}")
-                        
-                        # Try direct keyboard-interactive authentication
-                        ki_result = self._connect_with_keyboard_interactive()
-                        if ki_result:
-                            logger.info(f"Keyboard-interactive authentication successful for {self.hostname}")
-                            return True
-                        else:
-                            logger.info(f"Keyboard-interactive authentication failed, falling back to password for {self.hostname}")
-                    else:
-                        logger.info("No username provided, skipping keyboard-interactive authentication")
-                        
-                else:
-                    # If no explicit auth method provided, try to use SSH agent or default keys
-                    logger.info("No explicit credentials provided, trying SSH agent and default keys")
-                    connect_params['allow_agent'] = True
-                    connect_params['look_for_keys'] = True
-                
-                # Connect with our parameters
-                self.client.connect(**connect_params)
+                logger.debug(f"Connection attempt {attempt}/{policy.max_attempts} to {self.hostname}:{self.port} "
+                             f"as {self.username} ({remaining:.1f}s left)")
+                self._attempt_timings = {}
+                self._connect_once(policy, deadline_at)
                 
-                # Get the transport
-                transport = self.client.get_transport()
-                if transport:
-                    # Set keepalive for long-running connections
-                    transport.set_keepalive(15)  # 15 second keepalive (reduced from 30 for more frequent keepalives)
-                    
-                    # Try keyboard-interactive auth if we have a handler and password auth failed
-                    if hasattr(self, '_interactive_handler') and not transport.is_authenticated() and self.username:
-                        logger.info("Trying keyboard-interactive authentication as fallback")
-                        try:
-                            # Make sure username is string
-                            username = str(self.username) if self.username is not None else ""
-                            transport.auth_interactive(
-                                username=username,
-                                handler=self._interactive_handler
-                            )
-                            if transport.is_authenticated():
-                                logger.info("Keyboard-interactive authentication succeeded")
-                        except Exception as e:
-                            logger.error(f"Keyboard-interactive authentication failed: {str(e)}")
-                            # Continue anyway - we'll catch connection failures later if auth didn't work
-                
-                logger.info(f"Successfully connected to {self.hostname}")
+                elapsed = time.monotonic() - start_time
+                logger.info(f"Successfully connected to {self.hostname} in {elapsed:.2f}s (attempt {attempt})")
+                self.connect_timings = dict(self._attempt_timings, connect=elapsed)
+                self._log_timing('ssh_connect', self.connect_timings, attempts=attempt, auth_method=self.auth_method)
                 self.connected = True
+                if not self._session_counted:
+                    self._session_counted = True
+                    metrics.ssh_sessions_active.inc()
                 return True
                 
-            except paramiko.SSHException as e:
-                logger.error(f"SSH error on attempt {attempt}: {str(e)}")
-                if "Error reading SSH protocol banner" in str(e):
-                    logger.error("SSH protocol banner error - possible connectivity issue")
-                # Show full stack trace for SSH exceptions
-                logger.error(traceback.format_exc())
-                
-                # For authentication failures with password, try keyboard-interactive as a fallback
-                if "Authentication failed" in str(e) and self.password:
-                    logger.info(f"Password authentication failed, attempting keyboard-interactive auth...")
-                    try:
-                        success = self._connect_with_keyboard_interactive()
-                        if success:
-                            return True
-                    except Exception as ki_e:
-                        logger.error(f"Keyboard-interactive authentication also failed: {str(ki_e)}")
+            except Exception as e:
+                last_error = e
+                self._close_failed_attempt()
                 
-            except socket.error as e:
-                logger.error(f"Socket error on attempt {attempt}: {str(e)}")
+                if not policy.is_retryable(e):
+                    logger.error(f"Not retrying connection to {self.hostname}:{self.port}: {str(e)}")
+                    raise ConnectionError(self._describe_fatal_error(e)) from e
                 
-            except Exception as e:
-                logger.error(f"Connection error on attempt {attempt}: {str(e)}")
-                logger.error(traceback.format_exc())
+                logger.warning(f"Connection attempt {attempt} to {self.hostname}:{self.port} failed: {str(e) or type(e).__name__}")
+                if isinstance(e, paramiko.SSHException) and "Error reading SSH protocol banner" in str(e):
+                    logger.warning("SSH protocol banner error - possible connectivity issue")
             
-            # Clean up failed attempt
-            if self.client:
-                self.client.close()
-                self.client = None
-            
-            # Retry after delay if not the last attempt
-            if attempt < self.reconnect_attempts:
-                logger.info(f"Retrying in {self.reconnect_delay} seconds...")
-                time.sleep(self.reconnect_delay)
-        
-        # If we get here, all attempts failed
-        raise ConnectionError(f"Failed to connect to {self.hostname} on port {self.port} after {self.reconnect_attempts} attempts. Please check network connectivity and SSH server availability.")
-        
-    def _connect_with_keyboard_interactive(self):
-        """Connect using keyboard-interactive authentication directly
-        This method is designed for network devices that require or prefer keyboard-interactive auth
-        Many network equipment types including OLTs, certain switches, and routers use this method
-        """
-        logger.info(f"Trying direct keyboard-interactive authentication for {self.hostname}")
+            # Back off before the next attempt, without overrunning the deadline
+            if attempt < policy.max_attempts:
+                delay = min(policy.backoff(attempt), deadline_at - time.monotonic())
+                if delay > 0:
+                    logger.info(f"Retrying {self.hostname} in {delay:.1f} seconds...")
+                    time.sleep(delay)
         
-        # Ensure we have a valid username
-        if not self.username:
-            logger.error("Username is required for keyboard-interactive authentication")
-            return False
-            
+        elapsed = time.monotonic() - start_time
+        if elapsed >= policy.deadline:
+            raise ConnectionError(f"Connection to {self.hostname} on port {self.port} timed out: no session within "
+                                  f"the {policy.deadline}s deadline after {attempt} attempts (last error: {last_error})")
+        raise ConnectionError(f"Failed to connect to {self.hostname} on port {self.port} after {attempt} attempts "
+                              f"({elapsed:.1f}s): {last_error}. Please check network connectivity and SSH server availability.")
+    
+    def _connect_once(self, policy, deadline_at):
+        """Make a single connection attempt: TCP connect, banner and key exchange, then authentication"""
+        def budget(phase_timeout):
+            # Each phase gets its own budget, capped by what is left of the overall deadline
+            return max(0.1, min(phase_timeout, deadline_at - time.monotonic()))
+        
+        phase_start = time.monotonic()
+        sock = socket.create_connection((self.hostname, self.port), timeout=budget(policy.tcp_timeout))
+        self._attempt_timings['tcp'] = time.monotonic() - phase_start
         try:
-            # Create a socket to the server
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)  # 30-second timeout
-            sock.connect((self.hostname, self.port))
+            if self.key_filename or not self.password:
+                self._connect_with_client(sock, policy, budget)
+            else:
+                self._connect_with_transport(sock, policy, budget)
+        except Exception:
+            sock.close()
+            raise
+    
+    def _connect_with_client(self, sock, policy, budget):
+        """Authenticate with a key file, the SSH agent or default keys using paramiko's SSHClient"""
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        
+        connect_params = {
+            'hostname': self.hostname,
+            'port': self.port,
+            'username': self.username,
+            'sock': sock,
+            'banner_timeout': budget(policy.banner_timeout),
+            'auth_timeout': budget(policy.auth_timeout),
+        }
+        
+        if self.key_filename:
+            # Use key-based authentication if key file is provided
+            logger.info(f"Using key-based authentication with key file: {self.key_filename}")
+            connect_params['key_filename'] = self.key_filename
+            # Still include password as some keys require passphrase
+            if self.password:
+                connect_params['password'] = self.password
             
-            # Create transport directly
-            transport = paramiko.Transport(sock)
-            transport.start_client()
+            # When using a key file, we don't need to look for other keys
+            connect_params['allow_agent'] = False
+            connect_params['look_for_keys'] = False
+        else:
+            # If no explicit auth method provided, try to use SSH agent or default keys
+            logger.info("No explicit credentials provided, trying SSH agent and default keys")
+            connect_params['allow_agent'] = True
+            connect_params['look_for_keys'] = True
+        
+        # paramiko's SSHClient runs banner, key exchange and auth in one call,
+        # so they are timed together as the handshake
+        phase_start = time.monotonic()
+        self.client.connect(**connect_params)
+        self._attempt_timings['handshake'] = time.monotonic() - phase_start
+        self.auth_method = 'publickey' if self.key_filename else 'agent'
+        
+        # Set keepalive for long-running connections
+        transport = self.client.get_transport()
+        if transport:
+            transport.set_keepalive(15)
+    
+    def _connect_with_transport(self, sock, policy, budget):
+        """Authenticate with a password over a single transport
+        
+        Keyboard-interactive is tried first, as many network devices (OLTs, certain
+        switches and routers) require or prefer it. If it is refused, plain password
+        auth is tried on the same transport, so the fallback costs no extra handshake.
+        """
+        transport = paramiko.Transport(sock)
+        try:
+            transport.banner_timeout = budget(policy.banner_timeout)
+            self._start_client_timed(transport, budget(policy.banner_timeout))
+            auth_phase_start = time.monotonic()
             
             # Function to handle interactive authentication prompts
             def handler(title, instructions, prompt_list):
@@ -304,48 +318,143 @@ class SSHClient:
                 responses = []
                 for prompt, echo in prompt_list:
                     logger.debug(f"Prompt: {prompt}, echo: {echo}")
+                    # Always return the password for any prompt
                     responses.append(self.password)
                 return responses
             
-            # Try keyboard-interactive authentication
             # Make sure username is string
             username = str(self.username) if self.username is not None else ""
-            transport.auth_interactive(username=username, handler=handler)
+            allowed = None
+            last_error = None
             
-            if transport.is_authenticated():
-                logger.info(f"Keyboard-interactive authentication succeeded for {self.hostname}")
-                
-                # Create a client and assign the authenticated transport properly
-                self.client = paramiko.SSHClient()
-                self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                
-                # Properly set the transport for the client
-                # This is critical to avoid 'NoneType' object has no attribute 'open_session' errors
-                self.client._transport = transport
-                
-                # Also store at class level for backup/reference
-                self._transport = transport
-                self.connected = True
-                
-                # Set keepalive
-                transport.set_keepalive(15)
-                
-                return True
-            else:
-                logger.error(f"Keyboard-interactive authentication failed for {self.hostname}")
-                transport.close()
-                return False
+            # Try the method that last worked for this device and username first
+            remembered = auth_method_cache.get(self.hostname, self.port, username)
+            methods = ['keyboard-interactive', 'password']
+            if remembered in methods:
+                logger.info(f"Using remembered {remembered} authentication for {self.hostname} as {username}")
+                methods.remove(remembered)
+                methods.insert(0, remembered)
+            
+            for method in methods:
+                if allowed is not None and method not in allowed:
+                    continue
+                transport.auth_timeout = budget(policy.auth_timeout)
+                auth_start = time.monotonic()
+                try:
+                    logger.info(f"Trying {method} authentication for {self.hostname}")
+                    if method == 'keyboard-interactive':
+                        transport.auth_interactive(username=username, handler=handler)
+                    else:
+                        transport.auth_password(username=username, password=self.password)
+                except paramiko.BadAuthenticationType as e:
+                    logger.info(f"{method} authentication not offered by {self.hostname} (allowed: {e.allowed_types})")
+                    allowed = e.allowed_types
+                    last_error = e
+                    continue
+                except paramiko.AuthenticationException as e:
+                    logger.info(f"{method} authentication failed for {self.hostname} "
+                                f"after {time.monotonic() - auth_start:.2f}s: {str(e)}")
+                    last_error = e
+                    continue
                 
-        except Exception as e:
-            logger.error(f"Error during keyboard-interactive authentication: {str(e)}")
-            logger.error(traceback.format_exc())
-            return False
+                if transport.is_authenticated():
+                    self.auth_method = method
+                    logger.info(f"{method} authentication succeeded for {self.hostname} in "
+                                f"{time.monotonic() - auth_start:.2f}s"
+                                f"{' (remembered)' if method == remembered else ''}")
+                    if method != remembered:
+                        auth_method_cache.record(self.hostname, self.port, username, method)
+                    break
+            
+            self._attempt_timings['auth'] = time.monotonic() - auth_phase_start
+            if not transport.is_authenticated():
+                raise last_error or paramiko.AuthenticationException("Authentication failed.")
+        except Exception:
+            transport.close()
+            raise
+        
+        # Create a client and assign the authenticated transport properly
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        
+        # This is critical to avoid 'NoneType' object has no attribute 'open_session' errors
+        self.client._transport = transport
+        self._transport = transport
+        
+        # Set keepalive for long-running connections
+        transport.set_keepalive(15)
+    
+    def _start_client_timed(self, transport, timeout):
+        """Run the SSH handshake, timing the banner exchange and key exchange separately
+        
+        This is Transport.start_client() in its asynchronous form, watching for
+        the server's version banner while waiting for negotiation to finish.
+        """
+        phase_start = time.monotonic()
+        max_time = phase_start + timeout
+        event = threading.Event()
+        transport.start_client(event=event)
+        banner_done = None
+        
+        while True:
+            event.wait(0.005 if banner_done is None else 0.1)
+            if banner_done is None and transport.remote_version:
+                banner_done = time.monotonic()
+            if not transport.is_active():
+                e = transport.get_exception()
+                if e is not None:
+                    raise e
+                raise paramiko.SSHException("Negotiation failed.")
+            if event.is_set():
+                break
+            if time.monotonic() >= max_time:
+                raise paramiko.SSHException(f"Key exchange with {self.hostname} did not finish within {timeout:.1f}s")
+        
+        finished = time.monotonic()
+        banner_done = banner_done or finished
+        self._attempt_timings['banner'] = banner_done - phase_start
+        self._attempt_timings['kex'] = finished - banner_done
+    
+    def _log_timing(self, event, timings, **fields):
+        """Write one machine-parsable JSON line with phase timings in milliseconds"""
+        record = {'event': event, 'host': self.hostname, 'port': self.port, 'user': self.username}
+        record.update({f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in timings.items()})
+        record.update(fields)
+        timing_logger.info(json.dumps(record, default=str))
     
-    def execute_command(self, command):
+    def _close_failed_attempt(self):
+        """Clean up the client left behind by a failed connection attempt"""
+        if self.client:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+    
+    def _describe_fatal_error(self, error):
+        """Build the message for a connection error that retrying cannot fix"""
+        if isinstance(error, paramiko.AuthenticationException):
+            return f"Authentication failed for {self.username}@{self.hostname}:{self.port}: {str(error)}"
+        if isinstance(error, socket.gaierror):
+            return f"Cannot resolve hostname {self.hostname}: {str(error)}"
+        if self.key_filename and isinstance(error, (OSError, paramiko.SSHException)):
+            return f"SSH key file error for {self.key_filename}: {str(error)}"
+        return f"Cannot connect to {self.hostname} on port {self.port}: {str(error)}"
+    
+    def execute_command(self, command, timeout=60, idle_timeout=30, max_bytes=MAX_OUTPUT_BYTES):
         """Execute a command on the connected equipment with timeout handling
         
+        Args:
+            command (str): Command to run
+            timeout (float, optional): Total seconds allowed for the command. Defaults to 60.
+            idle_timeout (float, optional): Seconds to wait without any output before giving up. Defaults to 30.
+            max_bytes (int, optional): Stop reading once this much output has arrived. Defaults to MAX_OUTPUT_BYTES.
+        
         Returns:
-            tuple: (success, output) where success is a boolean and output is the command output
+            tuple: (success, output) where success is a boolean and output is the command output.
+                Output larger than SSH_OUTPUT_HEAD_BYTES + SSH_OUTPUT_TAIL_BYTES is returned as its
+                start and end only. Details of the run (exit status, byte count, truncation, the ID of
+                the spilled full output) are kept in last_command_stats.
         """
         if not self.connected or not self.client:
             raise RuntimeError("Not connected. Call connect() first.")
@@ -353,55 +462,30 @@ class SSHClient:
         try:
             logger.debug(f"Executing command on {self.hostname}: {command}")
             
-            # Execute with 60-second timeout for real network equipment
-            stdin, stdout, stderr = self.client.exec_command(command, timeout=60)
-            
-            # Read the output with timeout tracking and chunking for large outputs
-            start_time = time.time()
-            
-            # Use chunked reading approach for very large outputs
-            buffer_size = 32768  # 32KB chunks for faster reading
-            stdout_chunks = []
-            stderr_chunks = []
-            chunk_count = 0
-            
-            # Set the channel timeout to 60 seconds for real network equipment
-            stdout.channel.settimeout(60)  # 60-second timeout for channel operations
-            
-            # Read stdout in chunks
-            while not stdout.channel.exit_status_ready() or stdout.channel.recv_ready():
-                if stdout.channel.recv_ready():
-                    chunk = stdout.channel.recv(buffer_size)
-                    if not chunk:
-                        break
-                    stdout_chunks.append(chunk.decode('utf-8', errors='replace'))
-                    chunk_count += 1
-                else:
-                    time.sleep(0.1)  # Small sleep to prevent CPU spinning
-                    
-                # Safety check - abort if taking too long (60 seconds max for real network equipment)
-                if time.time() - start_time > 60:
-                    logger.warning(f"Command execution taking too long (>60 sec), forcing completion: {command}")
-                    break
-            
-            # Read stderr if available
-            while stderr.channel.recv_stderr_ready():
-                chunk = stderr.channel.recv_stderr(buffer_size)
-                if not chunk:
-                    break
-                stderr_chunks.append(chunk.decode('utf-8', errors='replace'))
-            
-            # Join all the chunks
-            stdout_data = ''.join(stdout_chunks)
-            stderr_data = ''.join(stderr_chunks)
+            exec_start = time.monotonic()
+            stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+            exec_time = time.monotonic() - exec_start
+            self.commands_run += 1
+            self.last_used = time.time()
             
-            elapsed = time.time() - start_time
+            stdout_data, stderr_data, stats = self._read_channel(stdout.channel, timeout, idle_timeout, max_bytes)
+            stats['timings'] = {'exec': exec_time, 'read': stats['elapsed']}
+            self.last_command_stats = stats
+            self._log_timing('ssh_command', stats['timings'], command=command, bytes=stats['bytes'],
+                             exit_status=stats['exit_status'], session_command=self.commands_run)
             
-            # Get exit status if available
-            exit_status = stdout.channel.recv_exit_status() if stdout.channel.exit_status_ready() else -1
+            logger.debug(f"Command completed in {stats['elapsed']:.2f}s with status {stats['exit_status']}")
+            logger.debug(f"Output size: {stats['bytes']} bytes in {stats['chunks']} chunks")
             
-            logger.debug(f"Command completed in {elapsed:.2f}s with status {exit_status}")
-            logger.debug(f"Output size: {len(stdout_data)} bytes in {chunk_count} chunks")
+            if stats['timed_out'] or stats['idle_timed_out']:
+                limit = f"{timeout}s total" if stats['timed_out'] else f"{idle_timeout}s without output"
+                logger.warning(f"Command on {self.hostname} stopped after {limit}, forcing completion: {command}")
+                if not stdout_data and not stderr_data:
+                    return (False, "ERROR: Command execution timed out. The device may be busy or the command produces too much output.")
+                stdout_data += f"\n\n[... Command stopped after {limit}; output may be incomplete ...]"
+            elif stats['truncated']:
+                logger.warning(f"Output from {self.hostname} exceeded {max_bytes} bytes, remaining output discarded: {command}")
+                stdout_data += f"\n\n[... Output exceeded {max_bytes} bytes; remaining output discarded ...]"
             
             if stderr_data:
                 logger.warning(f"Command error on {self.hostname}: {stderr_data}")
@@ -434,6 +518,9 @@ class SSHClient:
         except Exception as e:
             logger.error(f"Error executing command: {str(e)}")
             logger.error(traceback.format_exc())
+            if isinstance(e, (EOFError, OSError)):
+                # The session was dropped under us; the transport thread may not have noticed yet
+                self.connected = False
             # Provide more detailed error messages for common issues
             if "Authentication failed" in str(e) or "auth fail" in str(e).lower():
                 return (False, "AUTHENTICATION ERROR: The username or password was rejected by the device. Please check your TACACS credentials in your user profile.")
@@ -444,6 +531,94 @@ class SSHClient:
             else:
                 return (False, f"ERROR: {str(e)}")
     
+    def _read_channel(self, channel, timeout, idle_timeout, max_bytes):
+        """Read stdout and stderr from a channel until the command exits
+        
+        The channel is waited on with a selector, so the reader wakes as soon as
+        output, EOF or channel close arrives. The exit status does not wake the
+        selector, so each wait is bounded by CHANNEL_WAIT_INTERVAL. Output goes
+        into OutputCapture buffers, so memory use stays bounded however much
+        the device sends.
+        
+        Returns:
+            tuple: (stdout_data, stderr_data, stats)
+        """
+        buffer_size = 32768  # 32KB chunks for faster reading
+        stdout_capture = OutputCapture(OUTPUT_HEAD_BYTES, OUTPUT_TAIL_BYTES, spill=SPILL_ENABLED)
+        stderr_capture = OutputCapture(STDERR_KEEP_BYTES, STDERR_KEEP_BYTES)
+        stats = {'exit_status': -1, 'bytes': 0, 'chunks': 0, 'truncated': False,
+                 'timed_out': False, 'idle_timed_out': False, 'elapsed': 0.0,
+                 'omitted_bytes': 0, 'output_file': None}
+        
+        start_time = time.monotonic()
+        last_data_time = start_time
+        selector = selectors.DefaultSelector()
+        selector.register(channel, selectors.EVENT_READ)
+        
+        try:
+            while True:
+                # Drain everything that is already buffered
+                while channel.recv_ready() or channel.recv_stderr_ready():
+                    if channel.recv_ready():
+                        chunk = channel.recv(buffer_size)
+                        stdout_capture.write(chunk)
+                    else:
+                        chunk = channel.recv_stderr(buffer_size)
+                        stderr_capture.write(chunk)
+                    stats['bytes'] += len(chunk)
+                    stats['chunks'] += 1
+                    last_data_time = time.monotonic()
+                    if stats['bytes'] >= max_bytes:
+                        stats['truncated'] = True
+                        break
+                
+                if stats['truncated'] or channel.exit_status_ready() or channel.eof_received or channel.closed:
+                    break
+                
+                now = time.monotonic()
+                if now - start_time >= timeout:
+                    stats['timed_out'] = True
+                    break
+                if now - last_data_time >= idle_timeout:
+                    stats['idle_timed_out'] = True
+                    break
+                
+                selector.select(min(timeout - (now - start_time), idle_timeout - (now - last_data_time),
+                                    CHANNEL_WAIT_INTERVAL))
+            
+            if not stats['truncated'] and not stats['timed_out'] and not stats['idle_timed_out']:
+                # The exit status can trail the EOF slightly; collect any output that raced it
+                channel.status_event.wait(max(0.0, min(1.0, timeout - (time.monotonic() - start_time))))
+                while channel.recv_ready():
+                    chunk = channel.recv(buffer_size)
+                    stdout_capture.write(chunk)
+                    stats['bytes'] += len(chunk)
+                while channel.recv_stderr_ready():
+                    chunk = channel.recv_stderr(buffer_size)
+                    stderr_capture.write(chunk)
+                    stats['bytes'] += len(chunk)
+            
+            if channel.exit_status_ready():
+                stats['exit_status'] = channel.recv_exit_status()
+        finally:
+            selector.close()
+            stats['output_file'] = stdout_capture.close()
+            if not channel.closed and (stats['truncated'] or stats['timed_out'] or stats['idle_timed_out']):
+                channel.close()
+        
+        stats['elapsed'] = time.monotonic() - start_time
+        stats['omitted_bytes'] = stdout_capture.omitted_bytes + stderr_capture.omitted_bytes
+        
+        # Decode once at the end so multi-byte characters split across chunks survive
+        return stdout_capture.text(), stderr_capture.text(), stats
+    
+    def is_active(self):
+        """Check whether the SSH transport is still open and usable"""
+        if not self.connected or not self.client:
+            return False
+        transport = self.client.get_transport()
+        return bool(transport and transport.is_active())
+    
     def disconnect(self):
         """Close the SSH connection"""
         if self.client:
@@ -455,3 +630,311 @@ class SSHClient:
             finally:
                 self.client = None
                 self.connected = False
+                self.commands_run = 0
+                self.auth_method = None
+                self.connect_timings = None
+                if self._session_counted:
+                    self._session_counted = False
+                    metrics.ssh_sessions_active.dec()
+
+
+class AuthMethodCache:
+    """Remembers which password authentication method last worked per device and username
+    
+    Devices that only accept one of keyboard-interactive or password auth would
+    otherwise pay for a refused attempt on every connect. Entries are kept in
+    memory and persisted to a small JSON file so all worker processes share them.
+    The file is re-read when another process has changed it.
+    """
+    
+    def __init__(self, path=None):
+        """Initialize the cache
+        
+        Args:
+            path (str, optional): JSON file to persist to. None keeps entries in memory only.
+        """
+        self.path = path
+        self._methods = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(hostname, port, username):
+        return f"{hostname}:{port}:{username}"
+    
+    def get(self, hostname, port, username):
+        """Return the remembered method for a device and username, or None"""
+        with self._lock:
+            self._reload()
+            return self._methods.get(self._key(hostname, port, username))
+    
+    def record(self, hostname, port, username, method):
+        """Remember the method that just succeeded for a device and username"""
+        key = self._key(hostname, port, username)
+        with self._lock:
+            self._reload()
+            if self._methods.get(key) == method:
+                return
+            logger.info(f"Recording {method} authentication for {hostname}:{port} as {username}")
+            self._methods[key] = method
+            self._save()
+    
+    def _reload(self):
+        """Load the file if it changed since it was last read (lock must be held)"""
+        if not self.path:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self._methods.update(json.load(f))
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read auth method cache {self.path}: {str(e)}")
+    
+    def _save(self):
+        """Write the cache atomically (lock must be held)"""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._methods, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning(f"Could not write auth method cache {self.path}: {str(e)}")
+
+
+# Remembered authentication methods, shared by every client in the process
+auth_method_cache = AuthMethodCache(os.environ.get('SSH_AUTH_CACHE_FILE', 'ssh_auth_methods.json') or None)
+
+
+class SSHConnectionPool:
+    """Process-wide pool of authenticated SSH connections
+    
+    Connections are keyed by (hostname, port, username, auth method) plus a digest
+    of the secret used, so a session opened with one user's credentials is never
+    handed to a caller presenting different ones. Idle connections are kept for
+    up to ``idle_ttl`` seconds and at most ``max_size`` of them are retained;
+    the least recently used connection is closed when the pool is full.
+    
+    When acquire() is given a ``device_limit``, the connections checked out and
+    idle for that device (hostname and port, whatever the credentials) are kept
+    within it: idle connections of other users are closed to make room for a
+    new one, and a released connection is closed rather than kept if the device
+    is at its limit.
+    
+    Usage:
+        client = ssh_pool.acquire(hostname='10.0.0.1', username='admin', password='...')
+        try:
+            client.execute_command('show version')
+        finally:
+            ssh_pool.release(client)
+    """
+    
+    def __init__(self, max_size=32, idle_ttl=300):
+        """Initialize the pool
+        
+        Args:
+            max_size (int, optional): Maximum idle connections kept. 0 disables pooling. Defaults to 32.
+            idle_ttl (int, optional): Seconds an idle connection is kept. Defaults to 300.
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._idle = OrderedDict()  # (key, id(client)) -> client, least recently used first
+        self._in_use = {}  # (hostname, port) -> connections checked out
+        self._lock = threading.Lock()
+        self._reaper = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(hostname, port=22, username=None, password=None, key_filename=None, **kwargs):
+        """Build the pool key for a set of SSHClient connection parameters"""
+        if key_filename:
+            auth_method = 'key'
+        elif password:
+            auth_method = 'password'
+        else:
+            auth_method = 'agent'
+        secret = f"{password or ''}\0{key_filename or ''}".encode('utf-8')
+        return (hostname, int(port or 22), username, auth_method, hashlib.sha256(secret).hexdigest())
+    
+    def acquire(self, connect_policy=None, device_limit=None, **ssh_params):
+        """Check out a healthy connection for the given parameters, connecting if needed
+        
+        Args:
+            connect_policy (ConnectPolicy, optional): Timing policy if a new connection is needed
+            device_limit (int, optional): Connections allowed to the device, checked out
+                and idle together; 0 or None means unlimited. Defaults to None.
+            **ssh_params: SSHClient constructor arguments (hostname, port, username, ...)
+        
+        Returns:
+            SSHClient: A connected client. Hand it back with release() when done.
+        """
+        key = self.make_key(**ssh_params)
+        device = key[:2]
+        
+        while True:
+            client = self._pop_idle(key)
+            if client is None:
+                break
+            if self._is_healthy(client):
+                with self._lock:
+                    self.hits += 1
+                    self._in_use[device] = self._in_use.get(device, 0) + 1
+                metrics.ssh_pool_requests.labels('hit').inc()
+                logger.debug(f"Reusing pooled SSH connection to {client.hostname}:{client.port}")
+                client._device_limit = device_limit
+                return client
+            logger.info(f"Discarding stale pooled SSH connection to {client.hostname}:{client.port}")
+            client.disconnect()
+            metrics.ssh_pool_evictions.inc()
+        
+        with self._lock:
+            self.misses += 1
+            self._in_use[device] = self._in_use.get(device, 0) + 1
+            # Idle sessions of other users count against the device's limit too
+            evicted = self._trim_device(device, device_limit)
+            self.evictions += len(evicted)
+        metrics.ssh_pool_requests.labels('miss').inc()
+        metrics.ssh_pool_evictions.inc(len(evicted))
+        for old_client in evicted:
+            logger.debug(f"Closing idle SSH connection to {old_client.hostname}:{old_client.port} "
+                         f"to stay within its session limit")
+            old_client.disconnect()
+        
+        client = SSHClient(connect_policy=connect_policy, **ssh_params)
+        try:
+            client.connect()
+        except Exception:
+            self._check_in(device)
+            raise
+        client._pool_key = key
+        client._device_limit = device_limit
+        return client
+    
+    def release(self, client):
+        """Return a client to the pool, or close it if it is no longer usable"""
+        if client is None:
+            return
+        key = getattr(client, '_pool_key', None)
+        if key is None:
+            client.disconnect()
+            return
+        self._check_in(key[:2])
+        if self.max_size <= 0 or not client.is_active():
+            client.disconnect()
+            return
+        
+        client.last_used = time.time()
+        evicted = []
+        with self._lock:
+            self._idle[(key, id(client))] = client
+            while len(self._idle) > self.max_size:
+                evicted.append(self._idle.popitem(last=False)[1])
+            evicted.extend(self._trim_device(key[:2], getattr(client, '_device_limit', None)))
+            self.evictions += len(evicted)
+            self._start_reaper()
+        metrics.ssh_pool_evictions.inc(len(evicted))
+        
+        for old_client in evicted:
+            old_client.disconnect()
+    
+    def evict_idle(self):
+        """Close connections that have been idle for longer than idle_ttl"""
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            expired = [entry for entry, client in self._idle.items() if client.last_used < cutoff]
+            clients = [self._idle.pop(entry) for entry in expired]
+            self.evictions += len(clients)
+        metrics.ssh_pool_evictions.inc(len(clients))
+        
+        for client in clients:
+            logger.debug(f"Closing idle SSH connection to {client.hostname}:{client.port}")
+            client.disconnect()
+        return len(clients)
+    
+    def close_all(self):
+        """Close every idle connection in the pool"""
+        with self._lock:
+            clients = list(self._idle.values())
+            self._idle.clear()
+        for client in clients:
+            client.disconnect()
+    
+    def stats(self):
+        """Return pool counters as a dictionary"""
+        with self._lock:
+            idle = len(self._idle)
+        return {'idle': idle, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+    
+    def _check_in(self, device):
+        """Count a checked-out connection to device as returned"""
+        with self._lock:
+            in_use = self._in_use.get(device, 0) - 1
+            if in_use > 0:
+                self._in_use[device] = in_use
+            else:
+                self._in_use.pop(device, None)
+    
+    def _trim_device(self, device, limit):
+        """Remove the least recently used idle connections to device beyond its limit (lock must be held)
+        
+        Returns:
+            list: The removed clients, for the caller to close
+        """
+        if not limit or limit <= 0:
+            return []
+        entries = [entry for entry in self._idle if entry[0][:2] == device]
+        excess = self._in_use.get(device, 0) + len(entries) - limit
+        return [self._idle.pop(entry) for entry in entries[:max(excess, 0)]]
+    
+    def _pop_idle(self, key):
+        """Remove and return the most recently used idle client for key, if any"""
+        with self._lock:
+            for entry in reversed(self._idle):
+                if entry[0] == key:
+                    return self._idle.pop(entry)
+        return None
+    
+    def _is_healthy(self, client):
+        """Check the transport is active and still answers on the wire"""
+        if time.time() - client.last_used > self.idle_ttl or not client.is_active():
+            return False
+        try:
+            # An SSH_MSG_IGNORE fails fast if the socket was reset while idle
+            client.client.get_transport().send_ignore()
+            return True
+        except Exception as e:
+            logger.debug(f"Pooled connection health check failed: {str(e)}")
+            return False
+    
+    def _start_reaper(self):
+        """Start the background thread that closes idle connections (lock must be held)"""
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        
+        def reap():
+            while True:
+                time.sleep(max(1, self.idle_ttl / 2))
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    logger.error(f"Error evicting idle SSH connections: {str(e)}")
+        
+        self._reaper = threading.Thread(target=reap, name='ssh-pool-reaper', daemon=True)
+        self._reaper.start()
+
+
+# Shared pool for the whole process (each gunicorn worker has its own)
+ssh_pool = SSHConnectionPool(
+    max_size=int(os.environ.get('SSH_POOL_MAX_SIZE', '32')),
+    idle_ttl=int(os.environ.get('SSH_POOL_IDLE_TTL', '300'))
+)